@@ -3,9 +3,26 @@ from __future__ import unicode_literals
 from django.contrib import admin
 
 from waldur_core.structure import admin as structure_admin
-from .models import AzureService, AzureServiceProjectLink, VirtualMachine
+from .models import AzureService, AzureServiceProjectLink, Operation, TransitionStatistics, VirtualMachine
 
 
 admin.site.register(VirtualMachine, structure_admin.VirtualMachineAdmin)
 admin.site.register(AzureService, structure_admin.ServiceAdmin)
 admin.site.register(AzureServiceProjectLink, structure_admin.ServiceProjectLinkAdmin)
+
+
+class OperationAdmin(admin.ModelAdmin):
+    list_display = ('name', 'request_id', 'virtual_machine', 'status', 'created')
+    list_filter = ('status', 'name')
+    readonly_fields = ('settings', 'request_id', 'name', 'virtual_machine', 'status', 'error_message')
+
+
+admin.site.register(Operation, OperationAdmin)
+
+
+class TransitionStatisticsAdmin(admin.ModelAdmin):
+    list_display = ('transition', 'image_name', 'cores', 'ram', 'count', 'average')
+    list_filter = ('transition',)
+
+
+admin.site.register(TransitionStatistics, TransitionStatisticsAdmin)
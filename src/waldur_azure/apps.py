@@ -13,6 +13,7 @@ class AzureConfig(AppConfig):
         from backend import AzureBackend
         SupportedServices.register_backend(AzureBackend)
 
+        from waldur_core.structure import models as structure_models
         from waldur_azure import models, handlers
 
         signals.post_save.connect(
@@ -20,3 +21,9 @@ class AzureConfig(AppConfig):
             sender=models.AzureServiceProjectLink,
             dispatch_uid='waldur_azure.handlers.copy_cloud_service_name_on_service_creation',
         )
+
+        signals.post_delete.connect(
+            handlers.invalidate_driver_on_settings_deletion,
+            sender=structure_models.ServiceSettings,
+            dispatch_uid='waldur_azure.handlers.invalidate_driver_on_settings_deletion',
+        )
@@ -1,51 +1,91 @@
 import collections
+import contextlib
+import itertools
 import logging
 import os
 import re
 import ssl
-import tempfile
+import threading
 import time
+from multiprocessing.pool import ThreadPool
 
+from django.conf import settings as django_settings
 from django.core.files.uploadedfile import File, InMemoryUploadedFile
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Value, When
 from django.utils import six
 from libcloud.common.types import LibcloudError, InvalidCredsError
-from libcloud.compute.base import NodeAuthPassword
+from libcloud.compute.base import Node, NodeAuthPassword, NodeImage
 from libcloud.compute.drivers import azure
 from libcloud.compute.types import NodeState
+from libcloud.utils.py3 import httplib
 
+from waldur_core.core import utils as core_utils
 from waldur_core.structure import ServiceBackend, ServiceBackendError, ServiceBackendNotImplemented, \
     log_backend_action
 
-from . import models
-from .driver import AzureNodeDriver, AZURE_COMPUTE_INSTANCE_TYPES
+from . import models, polling
+from .cache import CloudServiceList, DeploymentCache, DeploymentLease, ImageCatalog, NodeInventory
+from .driver import INSTANCE_TYPES, drivers
 
 
 logger = logging.getLogger(__name__)
 
+# maximum number of IDs in a single IN lookup
+QUERY_CHUNK_SIZE = 500
+
+
+def chunked(items, size):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+
+_fan_out_pool = None
+_fan_out_pool_pid = None
+_fan_out_pool_lock = threading.Lock()
+
+
+def get_fan_out_pool():
+    """
+    Thread pool shared by all backends of the process, so that its threads keep
+    their drivers from registry and connections of drivers stay warm between calls.
+    Pool is created again in process forked by Celery worker, because threads are not copied.
+    """
+    global _fan_out_pool, _fan_out_pool_pid
+    with _fan_out_pool_lock:
+        if _fan_out_pool is None or _fan_out_pool_pid != os.getpid():
+            _fan_out_pool = ThreadPool(django_settings.WALDUR_AZURE['FAN_OUT_WORKERS'])
+            _fan_out_pool_pid = os.getpid()
+        return _fan_out_pool
+
+
 # libcloud doesn't match Visual Studio images properly
 azure.WINDOWS_SERVER_REGEX = re.compile(
     azure.WINDOWS_SERVER_REGEX.pattern + '|VS-201[35]'
 )
 
-# there's a hope libcloud will implement this method in further releases
-AzureNodeDriver.ex_list_storage_services = lambda self: \
-    self._perform_get(self._get_path('services', 'storageservices'), StorageServices)
+
+class Size(collections.namedtuple('Size', ('uuid', 'pk', 'name', 'cores', 'ram', 'disk', 'price'))):
+    __slots__ = ()
+
+    def __str__(self):
+        return self.name
+
+
+SIZES = tuple(Size(uuid=instance_type.id,
+                   pk=instance_type.id,
+                   name='{}: {}'.format(instance_type.key, instance_type.name),
+                   cores=isinstance(instance_type.cores, int) and instance_type.cores or 1,
+                   ram=instance_type.ram,
+                   disk=ServiceBackend.gb2mb(instance_type.disk),
+                   price=float(instance_type.price))
+              for instance_type in INSTANCE_TYPES)
+
+SIZES_BY_UUID = {size.uuid: size for size in SIZES}
 
 
 class SizeQueryset(object):
-    def __init__(self):
-        self.items = []
-        for key, val in AZURE_COMPUTE_INSTANCE_TYPES.items():
-            self.items.append(SizeQueryset.Size(uuid=val['id'],
-                                                pk=val['id'],
-                                                name='{}: {}'.format(key, val['name']),
-                                                cores=isinstance(val['cores'], int) and val['cores'] or 1,
-                                                ram=val['ram'],
-                                                disk=ServiceBackend.gb2mb(val['disk']),
-                                                price=float(val['price'])))
-
-        self.items = list(sorted(self.items, key=lambda s: s.price))
+    items = SIZES
 
     def __len__(self):
         return len(self.items)
@@ -57,48 +97,48 @@ class SizeQueryset(object):
         return self.items
 
     def get(self, uuid):
-        for item in self.items:
-            if item.uuid == uuid:
-                return item
-        raise ValueError
-
-    class Size(collections.namedtuple('Size', ('uuid', 'pk', 'name', 'cores', 'ram', 'disk', 'price'))):
-        def __str__(self):
-            return self.name
+        try:
+            return SIZES_BY_UUID[uuid]
+        except KeyError:
+            raise ValueError
 
 
-class StorageServiceProperties(azure.WindowsAzureData):
+class ImportableResources(object):
+    """
+    Virtual machines available for import consumed page by page by import view.
+    Resources are produced by backend generator on every access instead of being
+    kept in memory, only the requested page is built.
+    """
 
-    def __init__(self):
-        self.description = ''
-        self.location = ''
-        self.affinity_group = ''
-        self.label = azure._Base64String()
-        self.status = ''
-        self.createion_time = ''
+    def __init__(self, backend):
+        self.backend = backend
 
+    def __iter__(self):
+        return self.backend.iter_resources_for_import()
 
-class StorageService(azure.WindowsAzureData):
-    _repr_attributes = [
-        'service_name',
-        'url'
-    ]
+    def count(self):
+        return sum(1 for _ in self)
 
-    def __init__(self):
-        self.url = ''
-        self.service_name = ''
-        self.storage_service_properties = StorageServiceProperties()
+    def __len__(self):
+        return self.count()
 
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return list(itertools.islice(self, key.start, key.stop, key.step))
+        try:
+            return next(itertools.islice(self, key, None))
+        except StopIteration:
+            raise IndexError('Resource index out of range')
 
-class StorageServices(azure.WindowsAzureDataTypedList, azure.ReprMixin):
-    list_type = StorageService
 
-    _repr_attributes = [
-        'items'
-    ]
+class AzureBackendError(ServiceBackendError):
+    pass
 
 
-class AzureBackendError(ServiceBackendError):
+class DeploymentBusyError(AzureBackendError):
+    """
+    Cloud service deployment is busy with another operation, the request should be repeated later.
+    """
     pass
 
 
@@ -114,42 +154,54 @@ class AzureBaseBackend(ServiceBackend):
 
         self.settings = settings
         self.cloud_service_name = cloud_service_name
-
-    def __del__(self):
-        try:
-            os.remove(self._temp_file)
-        except (AttributeError, OSError):
-            pass
+        self._drivers = threading.local()
 
     # Lazy init
     @property
     def manager(self):
-        if not hasattr(self, '_manager'):
+        """
+        Drivers are not thread-safe, so registry hands out a driver per thread.
+        It is kept by backend to avoid hashing certificate on every call.
+        """
+        driver = getattr(self._drivers, 'driver', None)
+        if driver is not None:
+            return driver
+
+        if not hasattr(self, '_credentials'):
             key_file = None
+            certificate = b''
             cert_file = self.settings.certificate.file if self.settings.certificate else None
-            if isinstance(cert_file, InMemoryUploadedFile):
+            if isinstance(cert_file, File):
                 cert_file.seek(0)
-                temp_file = tempfile.NamedTemporaryFile(mode='w+t', delete=False)
-                temp_file.writelines(cert_file.readlines())
-                temp_file.close()
+                certificate = cert_file.read()
                 cert_file.seek(0)
-                key_file = self._temp_file = temp_file.name
-            elif isinstance(cert_file, File):
-                key_file = cert_file.name
+                if not isinstance(cert_file, InMemoryUploadedFile):
+                    key_file = cert_file.name
 
-            try:
-                self._manager = AzureNodeDriver(
-                    subscription_id=self.settings.username, key_file=key_file)
-            except InvalidCredsError as e:
-                logger.exception("Wrong credentials for service settings %s", self.settings.uuid)
-                six.reraise(AzureBackendError, e)
-        return self._manager
+            self._credentials = dict(
+                owner=self.settings.uuid.hex,
+                subscription_id=self.settings.username,
+                certificate=certificate,
+                key_file=key_file,
+                endpoint=(self.settings.options or {}).get('endpoint') or None)
+
+        try:
+            driver = self._drivers.driver = drivers.get(**self._credentials)
+        except InvalidCredsError as e:
+            logger.exception("Wrong credentials for service settings %s", self.settings.uuid)
+            six.reraise(AzureBackendError, e)
+        return driver
 
     def sync(self):
         self.pull_service_properties()
 
     def sync_link(self, service_project_link, is_initial=False):
         self.push_link(service_project_link)
+        if service_project_link.storage_state == models.AzureServiceProjectLink.StorageStates.CREATING:
+            from .tasks import PollLinkStorageTask  # tasks module depends on backend
+            PollLinkStorageTask().apply_async(
+                args=(core_utils.serialize_instance(service_project_link),),
+                countdown=PollLinkStorageTask.default_retry_delay)
 
     def remove_link(self, service_project_link):
         # TODO: this should remove storage and cloud service
@@ -183,39 +235,40 @@ class AzureBackend(AzureBaseBackend):
         self.pull_images()
 
     def pull_images(self):
-        options = self.settings.options or {}
-        regex = None
-        if 'images_regex' in options:
-            try:
-                regex = re.compile(options['images_regex'])
-            except re.error:
-                logger.warning(
-                    'Invalid images regexp supplied for service settings %s: %s',
-                    self.settings.uuid, options['images_regex'])
+        catalog = self.refresh_image_catalog()
+        backend_images = {image['id']: image['name'] for image in catalog['by_name'].values()}
+        try:
+            self._sync_images(backend_images)
+        except IntegrityError:
+            logger.warning(
+                'Could not synchronize Azure images for service settings %s due to concurrent update',
+                self.settings.uuid)
+
+    @transaction.atomic
+    def _sync_images(self, backend_images):
+        """
+        Apply difference between backend images and images of service settings
+        using a constant number of queries.
+        :param backend_images: dictionary mapping image backend ID to its name
+        """
+        images = models.Image.objects.filter(settings=self.settings)
+        cur_images = dict(images.values_list('backend_id', 'name'))
 
-        images = {}
-        for image in self.manager.list_images():
-            images.setdefault(image.name, [])
-            images[image.name].append(image)
+        stale_ids = set(cur_images) - set(backend_images)
+        if stale_ids:
+            images.filter(backend_id__in=stale_ids).delete()
 
-        cur_images = {i.backend_id: i for i in models.Image.objects.all()}
-        for backend_images in images.values():
-            backend_image = sorted(backend_images)[-1]  # get last image with same name (perhaps newest one)
-            if regex and not regex.match(backend_image.name):
-                continue
-            cur_images.pop(backend_image.id, None)
-            try:
-                models.Image.objects.update_or_create(
-                    backend_id=backend_image.id,
-                    defaults={
-                        'name': backend_image.name,
-                    })
-            except IntegrityError:
-                logger.warning(
-                    'Could not create Azure image with id %s due to concurrent update',
-                    backend_image.id)
+        models.Image.objects.bulk_create([
+            models.Image(settings=self.settings, backend_id=backend_id, name=name)
+            for backend_id, name in backend_images.items() if backend_id not in cur_images
+        ])
 
-        map(lambda i: i.delete(), cur_images.values())
+        changed_names = {backend_id: name for backend_id, name in backend_images.items()
+                         if backend_id in cur_images and cur_images[backend_id] != name}
+        if changed_names:
+            images.filter(backend_id__in=changed_names).update(name=Case(
+                *[When(backend_id=backend_id, then=Value(name)) for backend_id, name in changed_names.items()],
+                output_field=CharField()))
 
     def push_link(self, service_project_link):
         # define cloud service name
@@ -228,10 +281,11 @@ class AzureBackend(AzureBaseBackend):
             cloud_service_name = 'nc-%x' % service_project_link.project.uuid.node
 
         # create cloud
-        services = [s.service_name for s in self.manager.ex_list_cloud_services()]
+        services = self.list_cloud_services()
         if cloud_service_name not in services:
             logger.debug('About to create new azure cloud service for SPL %s', service_project_link.pk)
             self.manager.ex_create_cloud_service(cloud_service_name, self.location)
+            self.get_cloud_service_list().invalidate()
             service_project_link.cloud_service_name = cloud_service_name
             service_project_link.save(update_fields=['cloud_service_name'])
             logger.info('Successfully created new azure cloud for SPL %s', service_project_link.pk)
@@ -242,76 +296,184 @@ class AzureBackend(AzureBaseBackend):
         storage_name = self.get_storage_name(cloud_service_name)
         storages = [s.service_name for s in self.manager.ex_list_storage_services()]
 
+        States = models.AzureServiceProjectLink.StorageStates
         if storage_name not in storages:
             logger.debug('About to create new azure storage for SPL %s', service_project_link.pk)
             self.manager.ex_create_storage_service(storage_name, self.location)
-
-            # XXX: missed libcloud feature
-            #      it will block celery worker for a while (5 min max)
-            #      but it's easiest workaround for azure and general syncing workflow
-            for _ in range(100):
-                storage = self.get_storage(storage_name)
-                if storage.storage_service_properties.status == 'Created':  # ResolvingDns otherwise
-                    break
-                time.sleep(30)
-            logger.info('Successfully created new azure storage for SPL %s', service_project_link.pk)
+            service_project_link.storage_state = States.CREATING
+            logger.info('Requested creation of new azure storage for SPL %s', service_project_link.pk)
         else:
+            service_project_link.storage_state = States.CREATED
             logger.debug(
                 'Skipped azure storage creation for SPL %s - such cloud already exists', service_project_link.pk)
+        service_project_link.cloud_service_name = cloud_service_name
+        service_project_link.save(update_fields=['cloud_service_name', 'storage_state'])
+
+    def pull_link_storage_state(self, service_project_link):
+        """
+        Storage account is not usable until it leaves ResolvingDns status.
+        """
+        storage_name = self.get_storage_name(service_project_link.cloud_service_name)
+        try:
+            storage = self.manager.ex_get_storage_service(storage_name)
+        except LibcloudError as e:
+            six.reraise(AzureBackendError, e)
+
+        if storage and storage.status == 'Created':
+            service_project_link.storage_state = models.AzureServiceProjectLink.StorageStates.CREATED
+            service_project_link.save(update_fields=['storage_state'])
+            logger.info('Successfully created new azure storage for SPL %s', service_project_link.pk)
 
     @log_backend_action()
     def reboot_vm(self, vm):
-        self.manager.reboot_node(
-            self.get_vm(vm.backend_id),
-            ex_cloud_service_name=self.cloud_service_name,
-            ex_deployment_slot=self.deployment)
+        self._perform_role_operation(vm, 'reboot_vm', '', '?comp=reboot')
 
     @log_backend_action()
     def stop_vm(self, vm):
-        deployment_name = self.manager._get_deployment(
-            service_name=self.cloud_service_name,
-            deployment_slot=self.deployment
-        ).name
-
-        try:
-            response = self.manager._perform_post(
-                self.manager._get_deployment_path_using_name(
-                    self.cloud_service_name, deployment_name
-                ) + '/roleinstances/' + azure._str(vm.backend_id) + '/Operations',
-                azure.AzureXmlSerializer.shutdown_role_operation_to_xml()
-            )
-
-            self.manager.raise_for_response(response, 202)
-            self.manager._ex_complete_async_azure_operation(response)
-        except Exception as e:
-            six.reraise(AzureBackendError, e)
+        self._perform_role_operation(
+            vm, 'stop_vm', azure.AzureXmlSerializer.shutdown_role_operation_to_xml(), '/Operations')
 
     @log_backend_action()
     def start_vm(self, vm):
-        deployment_name = self.manager._get_deployment(
-            service_name=self.cloud_service_name,
-            deployment_slot=self.deployment
-        ).name
+        self._perform_role_operation(
+            vm, 'start_vm', azure.AzureXmlSerializer.start_role_operation_to_xml(), '/Operations')
+
+    def _perform_role_operation(self, vm, name, body, suffix):
+        """
+        Request operation on role instance and record its request ID
+        instead of waiting until Azure completes it.
+        """
+        with self.deployment_lease():
+            deployment = self.get_deployment()
 
+            try:
+                response = self.manager._perform_post(
+                    self.manager._get_deployment_path_using_name(
+                        self.cloud_service_name, deployment['name']
+                    ) + '/roleinstances/' + azure._str(vm.backend_id) + suffix,
+                    body
+                )
+
+                self.manager.raise_for_response(response, 202)
+            except Exception as e:
+                # deployment could be recreated outside of Waldur
+                self.get_deployment_cache().invalidate()
+                self.reraise_operation_error(e)
+            finally:
+                self.get_node_inventory().invalidate()
+
+            return self.create_operation(name, response, vm)
+
+    def start_vms(self, vms):
+        return self._perform_roles_operation(vms, 'start_vms', self.manager.ex_start_roles)
+
+    def stop_vms(self, vms):
+        return self._perform_roles_operation(vms, 'stop_vms', self.manager.ex_shutdown_roles)
+
+    def _perform_roles_operation(self, vms, name, method):
+        """
+        Apply operation to all virtual machines of the cloud service deployment
+        using single request, because Azure serializes operations on deployment.
+        """
+        with self.deployment_lease():
+            deployment = self.get_deployment()
+
+            try:
+                response = method(self.cloud_service_name, deployment['name'], [vm.backend_id for vm in vms])
+            except Exception as e:
+                self.get_deployment_cache().invalidate()
+                self.reraise_operation_error(e)
+            finally:
+                self.get_node_inventory().invalidate()
+
+            return self.create_operation(name, response)
+
+    def create_operation(self, name, response, vm=None):
+        request_id = self.manager._parse_response_for_async_op(response).request_id
+        if not request_id:
+            raise AzureBackendError('Azure has not returned request ID of operation %s' % name)
+        return models.Operation.objects.create(
+            settings=self.settings, cloud_service_name=self.cloud_service_name,
+            request_id=request_id, name=name, virtual_machine=vm)
+
+    @contextlib.contextmanager
+    def deployment_lease(self):
+        """
+        Serialize mutating operations on cloud service deployment, because Azure
+        rejects concurrent ones with 409 Conflict. Deployment is busy while another
+        worker issues request or operation started by it is in progress.
+        Operations on different deployments are not affected.
+        """
+        lease = DeploymentLease(self.settings.uuid.hex, self.cloud_service_name)
+        if not lease.acquire():
+            raise DeploymentBusyError('Request on deployment of cloud service %s is being issued.' %
+                                      self.cloud_service_name)
         try:
-            response = self.manager._perform_post(
-                self.manager._get_deployment_path_using_name(
-                    self.cloud_service_name, deployment_name
-                ) + '/roleinstances/' + azure._str(vm.backend_id) + '/Operations',
-                azure.AzureXmlSerializer.start_role_operation_to_xml()
-            )
-
-            self.manager.raise_for_response(response, 202)
-            self.manager._ex_complete_async_azure_operation(response)
-        except Exception as e:
-            six.reraise(AzureBackendError, e)
+            operations = models.Operation.objects.filter(
+                settings=self.settings, cloud_service_name=self.cloud_service_name,
+                status=models.Operation.States.IN_PROGRESS)
+            if operations.exists():
+                # pull status right away so that next operation starts as soon as previous one is completed
+                self.pull_operations(operations)
+                if operations.exists():
+                    raise DeploymentBusyError('Operation on deployment of cloud service %s is in progress.' %
+                                              self.cloud_service_name)
+            yield
+        finally:
+            lease.release()
+
+    def reraise_operation_error(self, error):
+        # deployment could be busy with operation started outside of Waldur
+        if getattr(error, 'status', None) == httplib.CONFLICT:
+            six.reraise(DeploymentBusyError, error)
+        six.reraise(AzureBackendError, error)
+
+    def pull_operations(self, operations):
+        """
+        Update status of operations which are still in progress.
+        """
+        States = models.Operation.States
+        for operation in operations:
+            try:
+                backend_operation = self.manager._get_operation_status(operation.request_id)
+            except LibcloudError as e:
+                six.reraise(AzureBackendError, e)
+
+            if backend_operation.status == operation.status:
+                continue
+
+            operation.status = backend_operation.status
+            if operation.status == States.FAILED:
+                operation.error_message = backend_operation.error_message or 'Operation %s has failed' % operation.name
+            operation.save(update_fields=['status', 'error_message', 'modified'])
+
+            transition = polling.OPERATION_TRANSITIONS.get(operation.name)
+            if operation.status == States.SUCCEEDED and transition:
+                duration = (operation.modified - operation.created).total_seconds()
+                polling.record_duration(transition, operation.virtual_machine, duration)
 
     @log_backend_action()
     def destroy_vm(self, vm):
-        self.manager.destroy_node(
-            self.get_vm(vm.backend_id),
-            ex_cloud_service_name=self.cloud_service_name,
-            ex_deployment_slot=self.deployment)
+        with self.deployment_lease():
+            # stale role list could lead to removal of the whole deployment
+            self.get_deployment_cache().invalidate()
+            deployment = self.get_deployment()
+            # last role could be removed only together with deployment
+            if len(deployment['roles']) > 1:
+                path = self.manager._get_role_path(self.cloud_service_name, deployment['name'], vm.backend_id)
+            else:
+                path = self.manager._get_deployment_path_using_name(self.cloud_service_name, deployment['name'])
+
+            try:
+                response = self.manager.ex_delete(path + '?comp=media')
+            except Exception as e:
+                self.reraise_operation_error(e)
+            finally:
+                self.get_deployment_cache().invalidate()
+                self.get_node_inventory().invalidate()
+
+            # operation is not bound to virtual machine which is removed as soon as role disappears
+            self.create_operation('destroy_vm', response)
 
     @log_backend_action('check if virtual machine deleted')
     def is_vm_deleted(self, vm):
@@ -324,20 +486,26 @@ class AzureBackend(AzureBaseBackend):
 
     @log_backend_action()
     def provision_vm(self, vm, backend_image_id=None, backend_size_id=None):
-        try:
-            backend_vm = self.manager.create_node(
-                name=vm.name,
-                size=self.get_size(backend_size_id),
-                image=self.get_image(backend_image_id),
-                ex_cloud_service_name=self.cloud_service_name,
-                ex_storage_service_name=self.get_storage_name(),
-                ex_deployment_slot=self.deployment,
-                ex_custom_data=vm.user_data,
-                ex_admin_user_id=vm.user_username,
-                auth=NodeAuthPassword(vm.user_password))
-        except LibcloudError as e:
-            logger.exception('Failed to provision virtual machine %s', vm.name)
-            six.reraise(AzureBackendError, e)
+        # driver polls operation status until deployment or role is created or its timeout passes,
+        # so lease is held during the whole operation
+        with self.deployment_lease():
+            try:
+                backend_vm = self.manager.create_node(
+                    name=vm.name,
+                    size=self.get_size(backend_size_id),
+                    image=self.get_image(backend_image_id),
+                    ex_cloud_service_name=self.cloud_service_name,
+                    ex_storage_service_name=self.get_storage_name(),
+                    ex_deployment_slot=self.deployment,
+                    ex_custom_data=vm.user_data,
+                    ex_admin_user_id=vm.user_username,
+                    auth=NodeAuthPassword(vm.user_password))
+            except LibcloudError as e:
+                logger.exception('Failed to provision virtual machine %s', vm.name)
+                self.reraise_operation_error(e)
+            finally:
+                self.get_deployment_cache().invalidate()
+                self.get_node_inventory().invalidate()
 
         vm.backend_id = backend_vm.id
         vm.runtime_state = backend_vm.state
@@ -348,52 +516,188 @@ class AzureBackend(AzureBaseBackend):
         vm.runtime_state = backend_vm.state
         vm.save(update_fields=['runtime_state'])
 
+    def pull_virtual_machines_runtime_state(self, vms):
+        """
+        Update runtime state of virtual machines of the cloud service
+        using single listing of role instances.
+        Only virtual machines with changed runtime state are saved, and they are saved
+        one by one so that handlers of runtime state changes are notified.
+        """
+        inventory = self.get_node_inventory()
+        inventory.invalidate()
+        backend_vms = self.list_vms()
+
+        for vm in vms:
+            backend_vm = backend_vms.get(vm.backend_id)
+            if backend_vm and backend_vm['state'] != vm.runtime_state:
+                vm.runtime_state = backend_vm['state']
+                vm.save(update_fields=['runtime_state'])
+
     def pull_vm_info(self, vm):
         """
         VM network info os available only after instance has been initiated and started.
+        Endpoints are reconciled with existing ones so that only differences are written.
         :param vm: waldur virtual machine instance to update IPs
         """
+        # transaction is not kept open during request to Azure
         backend_vm = self.get_vm(vm.backend_id)
-        endpoints = []
-        for endpoint in backend_vm.extra.get('instance_endpoints'):
-            endpoints.append(models.InstanceEndpoint(
-                name=endpoint.name,
-                local_port=int(endpoint.local_port),
-                public_port=int(endpoint.public_port),
-                protocol=endpoint.protocol,
-                instance=vm,
-            ))
-        models.InstanceEndpoint.objects.bulk_create(endpoints)
+        backend_endpoints = {
+            (endpoint.name, endpoint.protocol, int(endpoint.public_port)): int(endpoint.local_port)
+            for endpoint in backend_vm.extra.get('instance_endpoints')
+        }
+        with transaction.atomic():
+            self._update_vm_info(vm, backend_vm, backend_endpoints)
+
+    def _update_vm_info(self, vm, backend_vm, backend_endpoints):
+        endpoints = {
+            (endpoint.name, endpoint.protocol, endpoint.public_port): endpoint
+            for endpoint in vm.endpoints.all()
+        }
+
+        stale_endpoints = [endpoint.pk for key, endpoint in endpoints.items() if key not in backend_endpoints]
+        if stale_endpoints:
+            models.InstanceEndpoint.objects.filter(pk__in=stale_endpoints).delete()
+
+        new_endpoints = []
+        for key, local_port in backend_endpoints.items():
+            endpoint = endpoints.get(key)
+            if endpoint is None:
+                name, protocol, public_port = key
+                new_endpoints.append(models.InstanceEndpoint(
+                    name=name,
+                    local_port=local_port,
+                    public_port=public_port,
+                    protocol=protocol,
+                    instance=vm,
+                ))
+            elif endpoint.local_port != local_port:
+                endpoint.local_port = local_port
+                endpoint.save(update_fields=['local_port'])
+        models.InstanceEndpoint.objects.bulk_create(new_endpoints)
+
         vm.private_ips = backend_vm.private_ips
         vm.public_ips = backend_vm.public_ips
         vm.save(update_fields=['private_ips', 'public_ips'])
 
+    def get_deployment_cache(self):
+        return DeploymentCache(self.settings.uuid.hex, self.cloud_service_name, self.deployment)
+
+    def get_deployment(self):
+        """
+        Return name, status and role names of the deployment of the cloud service.
+        """
+        def load():
+            deployment = self.manager._get_deployment(
+                service_name=self.cloud_service_name, deployment_slot=self.deployment)
+            return {
+                'name': deployment.name,
+                'status': deployment.status,
+                'roles': [role.role_name for role in deployment.role_instance_list],
+            }
+
+        try:
+            return self.get_deployment_cache().get(load)
+        except Exception as e:
+            six.reraise(AzureBackendError, e)
+
+    def get_cloud_service_list(self):
+        return CloudServiceList(self.settings.uuid.hex)
+
+    def list_cloud_services(self):
+        """
+        Return names of cloud services of the subscription.
+        Identical concurrent calls are coalesced into single request.
+        """
+        try:
+            return self.get_cloud_service_list().get(
+                lambda: [service.service_name for service in self.manager.ex_list_cloud_services()])
+        except LibcloudError as e:
+            six.reraise(AzureBackendError, e)
+
+    def get_node_inventory(self, cloud_service_name=None):
+        return NodeInventory(self.settings.uuid.hex, cloud_service_name or self.cloud_service_name)
+
+    def list_vms(self, cloud_service_name=None):
+        """
+        Return role instances of the cloud service indexed by ID.
+        Result is shared between backends via node inventory snapshot.
+        """
+        cloud_service_name = cloud_service_name or self.cloud_service_name
+        inventory = self.get_node_inventory(cloud_service_name)
+        try:
+            return inventory.get(lambda: self.manager.ex_list_role_instances(cloud_service_name))
+        except LibcloudError as e:
+            six.reraise(AzureBackendError, e)
+
     def get_vm(self, vm_id):
         try:
-            vm = next(vm for vm in self.manager.list_nodes(self.cloud_service_name) if vm.id == vm_id)
-            # XXX: libcloud seems doesn't map size properly
-            vm.size = self.get_size(vm.extra['instance_size'])
-            return vm
-        except (StopIteration, LibcloudError) as e:
-            six.reraise(AzureBackendError, e.message or "Virtual machine doesn't exist")
+            record = self.list_vms()[vm_id]
+        except KeyError:
+            raise AzureBackendError("Virtual machine doesn't exist")
+        return self._deserialize_node(record)
+
+    def _deserialize_node(self, record):
+        node = Node(
+            id=record['id'],
+            name=record['name'],
+            state=record['state'],
+            public_ips=record['public_ips'],
+            private_ips=record['private_ips'],
+            driver=self.manager,
+            extra={
+                'instance_size': record['instance_size'],
+                'power_state': record['power_state'],
+                'ex_cloud_service_name': record['ex_cloud_service_name'],
+                'instance_endpoints': record['instance_endpoints'],
+            })
+        # XXX: libcloud seems doesn't map size properly
+        node.size = self.get_size(record['instance_size'])
+        return node
 
     def get_size(self, size_id):
         try:
-            return next(s for s in self.manager.list_sizes() if s.id == size_id)
-        except (StopIteration, LibcloudError) as e:
-            six.reraise(AzureBackendError, e)
+            return self.manager.ex_get_size(size_id)
+        except KeyError:
+            raise AzureBackendError("Size %s doesn't exist" % size_id)
 
-    def get_image(self, image_id):
+    def get_image_catalog(self):
+        return ImageCatalog(self.settings.uuid.hex)
+
+    def get_images_regex(self):
+        options = self.settings.options or {}
+        if 'images_regex' in options:
+            try:
+                return re.compile(options['images_regex'])
+            except re.error:
+                logger.warning(
+                    'Invalid images regexp supplied for service settings %s: %s',
+                    self.settings.uuid, options['images_regex'])
+
+    def _load_images(self):
+        images = self.manager.ex_iter_images(name_regex=self.get_images_regex())
+        # create_node reads only vm_image flag of image extra
+        return ({'id': image.id, 'name': image.name, 'vm_image': image.extra.get('vm_image', False)}
+                for image in images)
+
+    def refresh_image_catalog(self):
         try:
-            return next(s for s in self.manager.list_images() if s.id == image_id)
-        except (StopIteration, LibcloudError) as e:
-            six.reraise(AzureBackendError, e.message or "Image doesn't exist")
+            return self.get_image_catalog().refresh(self._load_images)
+        except LibcloudError as e:
+            six.reraise(AzureBackendError, e)
 
-    def get_storage(self, storage_name):
+    def schedule_image_catalog_refresh(self):
+        from .tasks import refresh_image_catalog  # tasks module depends on backend
+        refresh_image_catalog.delay(self.settings.pk)
+
+    def get_image(self, image_id):
+        catalog = self.get_image_catalog()
         try:
-            return next(s for s in self.manager.ex_list_storage_services() if s.service_name == storage_name)
-        except (StopIteration, LibcloudError) as e:
-            six.reraise(AzureBackendError, e.message or "Storage doesn't exist")
+            image = catalog.get(self._load_images, self.schedule_image_catalog_refresh)['by_id'][image_id]
+        except LibcloudError as e:
+            six.reraise(AzureBackendError, e)
+        except KeyError:
+            raise AzureBackendError("Image doesn't exist")
+        return NodeImage(id=image['id'], name=image['name'], driver=self.manager, extra={'vm_image': image['vm_image']})
 
     def get_storage_name(self, cloud_service_name=None):
         if not cloud_service_name:
@@ -403,30 +707,65 @@ class AzureBackend(AzureBaseBackend):
         return re.sub(r'[\W_-]+', '', cloud_service_name.lower())[:24]
 
     def get_resources_for_import(self):
+        return ImportableResources(self)
+
+    def iter_resources_for_import(self):
+        """
+        Yield virtual machines of the cloud service which are not imported yet ordered by name.
+        """
         if not self.cloud_service_name:
             raise AzureBackendError(
                 "Resources could be fetched only for specific cloud service, "
                 "please supply project_uuid query argument")
 
-        cur_vms = models.VirtualMachine.objects.all().values_list('backend_id', flat=True)
-        try:
-            vms = self.manager.list_nodes(self.cloud_service_name)
-        except LibcloudError as e:
-            six.reraise(AzureBackendError, e)
-
-        return [{
-            'id': vm.id,
-            'name': vm.name,
-            'flavor_name': vm.extra.get('instance_size')
-        } for vm in vms if vm.id not in cur_vms]
+        vms = sorted(self.list_vms().values(), key=lambda vm: vm['name'])
+        queryset = models.VirtualMachine.objects.filter(
+            service_project_link__service__settings=self.settings,
+            service_project_link__cloud_service_name=self.cloud_service_name)
+
+        for chunk in chunked(vms, QUERY_CHUNK_SIZE):
+            cur_ids = set(queryset.filter(backend_id__in=[vm['id'] for vm in chunk])
+                          .values_list('backend_id', flat=True))
+            for vm in chunk:
+                if vm['id'] not in cur_ids:
+                    yield {
+                        'id': vm['id'],
+                        'name': vm['name'],
+                        'flavor_name': vm['instance_size'],
+                    }
 
     def get_managed_resources(self):
         try:
-            ids = []
-            services = self.manager.ex_list_cloud_services()
-            for service in services:
-                for node in self.manager.list_nodes(service.service_name):
-                    ids.append(node.id)
-        except LibcloudError:
+            services = self.list_cloud_services()
+        except AzureBackendError as e:
+            logger.warning('Unable to list cloud services for service settings %s. Error: %s', self.settings.uuid, e)
+            return models.VirtualMachine.objects.none()
+
+        ids = []
+        for service_name, result in self.map_concurrently(self.list_vms, services):
+            if isinstance(result, Exception):
+                logger.warning('Unable to list virtual machines of cloud service %s. Error: %s', service_name, result)
+            else:
+                ids.extend(result)
+
+        return models.VirtualMachine.objects.filter(
+            service_project_link__service__settings=self.settings, backend_id__in=ids)
+
+    def map_concurrently(self, func, items):
+        """
+        Apply func to every item using thread pool of the process. All calls share single deadline.
+        :return: list of (item, result) pairs, result is an exception if call has failed or timed out.
+        """
+        if not items:
             return []
-        return models.VirtualMachine.objects.filter(backend_id__in=ids)
+
+        pool = get_fan_out_pool()
+        async_results = [(item, pool.apply_async(func, (item,))) for item in items]
+        deadline = time.time() + django_settings.WALDUR_AZURE['FAN_OUT_TIMEOUT']
+        results = []
+        for item, async_result in async_results:
+            try:
+                results.append((item, async_result.get(max(deadline - time.time(), 0))))
+            except Exception as e:
+                results.append((item, e))
+        return results
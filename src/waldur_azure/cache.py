@@ -0,0 +1,189 @@
+from __future__ import unicode_literals
+
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+# seconds a single caller is allowed to spend on reloading image catalog
+IMAGE_CATALOG_REFRESH_TIMEOUT = 5 * 60
+# seconds between checks whether concurrent caller has published value
+SINGLE_FLIGHT_POLL_INTERVAL = 0.1
+
+
+def get_ttl(name):
+    return settings.WALDUR_AZURE[name]
+
+
+class SingleFlight(object):
+    """
+    Value shared by all workers via Django cache and loaded at most once at a time.
+
+    The first caller takes a short lock, loads value and publishes it,
+    concurrent callers with identical arguments wait for published value
+    instead of repeating the same Service Management call.
+    """
+
+    def __init__(self, key, ttl):
+        self.key = key
+        self.lock_key = key + ':lock'
+        self.ttl = ttl
+
+    def get(self, loader):
+        timeout = settings.WALDUR_AZURE['SINGLE_FLIGHT_TIMEOUT']
+        deadline = time.time() + timeout
+        while True:
+            value = cache.get(self.key)
+            if value is not None:
+                return value
+
+            # lock expires by itself if caller holding it has died
+            if cache.add(self.lock_key, True, timeout):
+                try:
+                    value = cache.get(self.key)
+                    if value is None:
+                        value = loader()
+                        self.publish(value)
+                    return value
+                finally:
+                    cache.delete(self.lock_key)
+
+            if time.time() >= deadline:
+                logger.warning('Value %s has not been published in time, it is loaded again.', self.key)
+                return loader()
+            time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+
+    def publish(self, value):
+        cache.set(self.key, value, self.ttl)
+
+    def invalidate(self):
+        cache.delete(self.key)
+
+
+class CloudServiceList(SingleFlight):
+    """
+    Names of cloud services of the subscription. They are kept only for a few
+    seconds, just enough to serve callers started at the same time.
+    """
+
+    def __init__(self, settings_uuid):
+        super(CloudServiceList, self).__init__(
+            'waldur_azure:cloud_services:%s' % settings_uuid, get_ttl('SINGLE_FLIGHT_TTL'))
+
+
+class NodeInventory(SingleFlight):
+    """
+    Snapshot of role instances of a single cloud service indexed by role ID.
+
+    Snapshot is kept in Django cache so that concurrent tasks working with
+    virtual machines of the same cloud service share one listing of role instances.
+    """
+
+    def __init__(self, settings_uuid, cloud_service_name):
+        super(NodeInventory, self).__init__(
+            'waldur_azure:nodes:%s:%s' % (settings_uuid, cloud_service_name), get_ttl('NODE_INVENTORY_TTL'))
+
+    def get(self, loader):
+        return super(NodeInventory, self).get(lambda: {node['id']: node for node in loader()})
+
+
+class DeploymentCache(SingleFlight):
+    """
+    Descriptor of the deployment in the slot of cloud service: its name,
+    status and names of roles. It is used to address role operations
+    without fetching the whole deployment every time.
+    """
+
+    def __init__(self, settings_uuid, cloud_service_name, deployment_slot):
+        super(DeploymentCache, self).__init__(
+            'waldur_azure:deployment:%s:%s:%s' % (settings_uuid, cloud_service_name, deployment_slot),
+            get_ttl('DEPLOYMENT_CACHE_TTL'))
+
+
+class ImageCatalog(SingleFlight):
+    """
+    Images available for service settings indexed by ID and by name.
+    Only fields needed to provision virtual machine are kept for every image.
+
+    When catalog becomes stale it is still served to callers while
+    a single background task reloads it from Azure.
+    """
+
+    def __init__(self, settings_uuid):
+        super(ImageCatalog, self).__init__(
+            'waldur_azure:images:%s' % settings_uuid,
+            get_ttl('IMAGE_CATALOG_TTL') + get_ttl('IMAGE_CATALOG_STALE_TTL'))
+        self.refresh_lock_key = self.key + ':refresh'
+
+    def get(self, loader, schedule_refresh):
+        """
+        :param schedule_refresh: callable which schedules refresh of stale catalog in background
+        """
+        catalog = super(ImageCatalog, self).get(lambda: self.build(loader))
+
+        is_stale = catalog['expires_at'] < time.time()
+        if is_stale and cache.add(self.refresh_lock_key, True, IMAGE_CATALOG_REFRESH_TIMEOUT):
+            try:
+                schedule_refresh()
+            except Exception:
+                logger.exception('Unable to schedule refresh of Azure image catalog, stale one is used.')
+                cache.delete(self.refresh_lock_key)
+
+        return catalog
+
+    def refresh(self, loader):
+        try:
+            catalog = self.build(loader)
+            self.publish(catalog)
+            return catalog
+        finally:
+            cache.delete(self.refresh_lock_key)
+
+    def build(self, loader):
+        by_id = {}
+        by_name = {}
+        for image in loader():
+            by_id[image['id']] = image
+            # keep last image with same name (perhaps newest one)
+            if image['name'] not in by_name or by_name[image['name']]['id'] < image['id']:
+                by_name[image['name']] = image
+
+        return {'expires_at': time.time() + get_ttl('IMAGE_CATALOG_TTL'), 'by_id': by_id, 'by_name': by_name}
+
+
+class DeploymentLease(object):
+    """
+    Exclusive right of a single worker to issue mutating request on cloud
+    service deployment. It is held only until request is accepted by Azure,
+    asynchronous operation started by it is tracked by Operation model.
+    Lease expires by itself if worker holding it has died.
+    """
+    # delete key only if it still holds token of this lease
+    RELEASE_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, settings_uuid, cloud_service_name):
+        self.key = 'waldur_azure:deployment_lease:%s:%s' % (settings_uuid, cloud_service_name)
+        self.token = uuid.uuid4().hex
+
+    def acquire(self):
+        return cache.add(self.key, self.token, get_ttl('DEPLOYMENT_LEASE_TTL'))
+
+    def release(self):
+        # do not release lease taken over by another worker after expiration
+        if hasattr(cache, 'get_client') and hasattr(cache, 'prep_value'):
+            # Redis cache used in production, token is compared and deleted atomically
+            client = cache.get_client(self.key, write=True)
+            client.eval(self.RELEASE_SCRIPT, 1, cache.make_key(self.key), cache.prep_value(self.token))
+        elif cache.get(self.key) == self.token:
+            # local memory cache used in tests is not shared by workers
+            cache.delete(self.key)
@@ -12,7 +12,7 @@ class AzureCostTrackingStrategy(CostTrackingStrategy):
     @classmethod
     def get_consumable_items(cls):
         return [ConsumableItem(item_type=cls.Types.FLAVOR, key=size.name, default_price=size.price)
-                for size in backend.SizeQueryset()]
+                for size in backend.SIZES]
 
     @classmethod
     def get_configuration(cls, virtual_machine):
@@ -1,7 +1,17 @@
 from __future__ import unicode_literals
 
-import copy
-from libcloud.utils.py3 import httplib
+import atexit
+import collections
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from libcloud.utils.py3 import b, httplib
 
 try:
     from lxml import etree as ET
@@ -10,17 +20,89 @@ except ImportError:
 
 from libcloud.common.azure import AzureServiceManagementConnection as _AzureServiceManagementConnection
 from libcloud.common.azure import AzureResponse as _AzureResponse
+from libcloud.compute.base import NodeImage
+from libcloud.compute.types import NodeState
 from libcloud.compute.drivers.azure import AzureNodeDriver as _AzureNodeDriver
+from libcloud.compute.drivers.azure import AZURE_SERVICE_MANAGEMENT_HOST, AzureHTTPRequest
 from libcloud.common.types import InvalidCredsError
 from libcloud.common.types import LibcloudError, MalformedResponseError
 
+from .metrics import get_metrics_sink, get_path_template
+from .throttling import get_rate_limiter, get_retry_delay
+
+
+logger = logging.getLogger(__name__)
+
+
+_fixed_xpaths = {}
+
 
 def fixxpath(root, xpath):
     """ElementTree wants namespaces in its xpaths, so here we add them."""
     namespace, root_tag = root.tag[1:].split("}", 1)
-    fixed_xpath = "/".join(["{%s}%s" % (namespace, e)
-                            for e in xpath.split("/")])
-    return fixed_xpath
+    key = (namespace, xpath)
+    if key not in _fixed_xpaths:
+        _fixed_xpaths[key] = "/".join(["{%s}%s" % (namespace, e)
+                                       for e in xpath.split("/")])
+    return _fixed_xpaths[key]
+
+
+AZURE_NAMESPACE = 'http://schemas.microsoft.com/windowsazure'
+
+
+def azure_tag(xpath):
+    """Qualify every element of xpath with Azure namespace."""
+    return '/'.join('{%s}%s' % (AZURE_NAMESPACE, e) for e in xpath.split('/'))
+
+
+def iterparse_items(body, tags):
+    """
+    Yield elements with given tags as soon as they are parsed.
+    Yielded element is detached from the tree afterwards, so the whole
+    document is never kept in memory.
+    """
+    tags = {azure_tag(tag) for tag in tags}
+    parents = []
+    for event, element in ET.iterparse(io.BytesIO(b(body)), events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+
+        parents.pop()
+        if element.tag in tags:
+            yield element
+            if parents:
+                parents[-1].remove(element)
+
+
+def roles_operation_to_xml(operation_type, role_names, **fields):
+    """
+    Serialize operation applied to several roles of the deployment at once,
+    for example StartRolesOperation or ShutdownRolesOperation.
+    """
+    doc = ET.Element(operation_type)
+    doc.set('xmlns', AZURE_NAMESPACE)
+    ET.SubElement(doc, 'OperationType').text = operation_type
+    roles = ET.SubElement(doc, 'Roles')
+    for role_name in role_names:
+        ET.SubElement(roles, 'Name').text = role_name
+    for name, value in sorted(fields.items()):
+        ET.SubElement(doc, name).text = value
+    return ET.tostring(doc, encoding='utf-8')
+
+
+def parse_operation_status(body):
+    """
+    Parse status of asynchronous operation: InProgress, Succeeded or Failed.
+    """
+    root = ET.XML(b(body))
+    return OperationStatus(
+        request_id=root.findtext(azure_tag('ID')),
+        status=root.findtext(azure_tag('Status')),
+        http_status_code=root.findtext(azure_tag('HttpStatusCode')),
+        error_code=root.findtext(azure_tag('Error/Code')),
+        error_message=root.findtext(azure_tag('Error/Message')),
+    )
 
 
 def parse_error(body):
@@ -242,6 +324,82 @@ AZURE_COMPUTE_INSTANCE_TYPES = {
 }
 
 
+InstanceType = collections.namedtuple('InstanceType', (
+    'key', 'id', 'name', 'ram', 'disk', 'bandwidth', 'price', 'max_data_disks', 'cores'))
+
+# immutable catalog of instance types ordered by price
+INSTANCE_TYPES = tuple(sorted(
+    (InstanceType(key=key, **values) for key, values in AZURE_COMPUTE_INSTANCE_TYPES.items()),
+    key=lambda instance_type: float(instance_type.price)))
+
+
+RoleInstance = collections.namedtuple('RoleInstance', (
+    'role_name', 'instance_status', 'instance_size', 'ip_address', 'power_state', 'instance_endpoints'))
+
+Endpoint = collections.namedtuple('Endpoint', ('name', 'protocol', 'local_port', 'public_port', 'vip'))
+
+StorageService = collections.namedtuple('StorageService', ('service_name', 'url', 'location', 'status'))
+
+OperationStatus = collections.namedtuple('OperationStatus', (
+    'request_id', 'status', 'http_status_code', 'error_code', 'error_message'))
+
+
+class DeploymentParser(object):
+    """
+    Extract role instances and virtual IPs of the first deployment from
+    hosted service document using XPath expressions compiled once.
+    Requires lxml, streaming ElementTree parser is used without it.
+    """
+    ROLE_INSTANCE_FIELDS = (
+        ('role_name', 'RoleName'),
+        ('instance_status', 'InstanceStatus'),
+        ('instance_size', 'InstanceSize'),
+        ('ip_address', 'IpAddress'),
+        ('power_state', 'PowerState'),
+    )
+    ENDPOINT_FIELDS = (
+        ('name', 'Name'),
+        ('protocol', 'Protocol'),
+        ('local_port', 'LocalPort'),
+        ('public_port', 'PublicPort'),
+        ('vip', 'Vip'),
+    )
+
+    def __init__(self):
+        self.deployment = self.compile('/a:HostedService/a:Deployments/a:Deployment[1]')
+        self.role_instances = self.compile('a:RoleInstanceList/a:RoleInstance')
+        self.virtual_ips = self.compile('a:VirtualIPs/a:VirtualIP/a:Address/text()')
+        self.endpoints = self.compile('a:InstanceEndpoints/a:InstanceEndpoint')
+        self.role_instance_fields = [
+            (field, self.compile('string(a:%s)' % tag)) for field, tag in self.ROLE_INSTANCE_FIELDS]
+        self.endpoint_fields = [
+            (field, self.compile('string(a:%s)' % tag)) for field, tag in self.ENDPOINT_FIELDS]
+
+    def compile(self, expression):
+        return ET.XPath(expression, namespaces={'a': AZURE_NAMESPACE}, smart_strings=False)
+
+    def parse(self, body):
+        deployments = self.deployment(ET.fromstring(b(body)))
+        if not deployments:
+            return [], []
+
+        deployment = deployments[0]
+        role_instances = [
+            RoleInstance(
+                instance_endpoints=[
+                    Endpoint(**{field: xpath(endpoint) or None for field, xpath in self.endpoint_fields})
+                    for endpoint in self.endpoints(element)
+                ],
+                **{field: xpath(element) or None for field, xpath in self.role_instance_fields}
+            )
+            for element in self.role_instances(deployment)
+        ]
+        return role_instances, self.virtual_ips(deployment)
+
+
+deployment_parser = DeploymentParser() if hasattr(ET, 'XPath') else None
+
+
 class AzureResponse(_AzureResponse):
     """
     Fix error parsing for Azure
@@ -265,20 +423,83 @@ class AzureResponse(_AzureResponse):
             error_msg = '%s - %s' % (msg, error_msg)
 
         if self.status in [httplib.UNAUTHORIZED, httplib.FORBIDDEN]:
-            raise InvalidCredsError(error_msg)
-
-        raise LibcloudError(
-            '%s Status code: %d.' % (error_msg, self.status),
-            driver=self
-        )
+            error = InvalidCredsError(error_msg)
+        else:
+            error = LibcloudError('%s Status code: %d.' % (error_msg, self.status), driver=self)
+        # status is used by metrics and retries when response is not returned to connection
+        error.status = self.status
+        error.retry_after = self.headers.get('retry-after')
+        raise error
 
 
 class AzureServiceManagementConnection(_AzureServiceManagementConnection):
     responseCls = AzureResponse
 
+    def request(self, action, params=None, data=None, headers=None, method='GET', raw=False, stream=False):
+        """
+        Pace calls with subscription rate limiter and repeat throttled
+        and transiently failed calls with jittered exponential backoff.
+        """
+        kwargs = dict(params=params, data=data, headers=headers)
+        # stream is not supported by libcloud before 2.0
+        if stream:
+            kwargs['stream'] = stream
+
+        rate_limiter = get_rate_limiter(self.subscription_id)
+        attempt = 0
+        while True:
+            if rate_limiter:
+                rate_limiter.acquire()
+            try:
+                return self._instrumented_request(action, method=method, raw=raw, **kwargs)
+            except Exception as e:
+                delay = get_retry_delay(e, method, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                logger.info('Azure request %s %s has failed with status %s, retrying in %.1f seconds.',
+                            method, get_path_template(action), getattr(e, 'status', None), delay)
+                time.sleep(delay)
+
+    def _instrumented_request(self, action, method='GET', raw=False, **kwargs):
+        """
+        Report method, path template, status, size and latency of every call to metrics sink.
+        """
+        started = time.time()
+        status = None
+        size = 0
+        try:
+            response = super(AzureServiceManagementConnection, self).request(action, method=method, raw=raw, **kwargs)
+            status = response.status
+            size = len(response.body or '') if not raw else 0
+            return response
+        except Exception as e:
+            status = getattr(e, 'status', None)
+            raise
+        finally:
+            get_metrics_sink().observe_request(
+                self.subscription_id, method, get_path_template(action), status, size, time.time() - started)
+
 
 class AzureNodeDriver(_AzureNodeDriver):
     connectionCls = AzureServiceManagementConnection
+    # seconds to wait for asynchronous operation, such as creation of deployment
+    ASYNC_OPERATION_TIMEOUT = 30 * 60
+    # seconds between checks of asynchronous operation status
+    ASYNC_OPERATION_POLL_INTERVAL = 5
+
+    def __init__(self, subscription_id=None, key_file=None, url=None, **kwargs):
+        """
+        :param url: Service Management API URL overriding default one, for example of local emulator
+        """
+        self.url = url
+        super(AzureNodeDriver, self).__init__(subscription_id=subscription_id, key_file=key_file, **kwargs)
+
+    def _ex_connection_class_kwargs(self):
+        kwargs = super(AzureNodeDriver, self)._ex_connection_class_kwargs()
+        if self.url:
+            kwargs['url'] = self.url
+        return kwargs
 
     def raise_for_response(self, response, valid_response):
         if response.status != valid_response:
@@ -292,7 +513,9 @@ class AzureNodeDriver(_AzureNodeDriver):
 
             values = (response.error, error_msg, response.status)
             message = 'Message: %s, Body: %s, Status code: %s' % (values)
-            raise LibcloudError(message, driver=self)
+            error = LibcloudError(message, driver=self)
+            error.status = response.status
+            raise error
 
     def _parse_response_body_from_xml_text(self, response, return_type):
         """
@@ -304,14 +527,404 @@ class AzureNodeDriver(_AzureNodeDriver):
 
         return super(AzureNodeDriver, self)._parse_response_body_from_xml_text(response, return_type)
 
+    def _get_operation_status(self, request_id):
+        """
+        Replaces AzureNodeDriver's method which overwrites status of operation
+        with HTTP status code of the response.
+        """
+        response = self._perform_get('/%s/operations/%s' % (self.subscription_id, request_id), None)
+        self.raise_for_response(response, 200)
+        return parse_operation_status(response.body)
+
+    def _ex_complete_async_azure_operation(self, response=None, operation_type='create_node'):
+        """
+        Replaces AzureNodeDriver's method which passes parsed response
+        instead of request ID when operation status is polled again.
+        """
+        request_id = self._parse_response_for_async_op(response).request_id
+        deadline = time.time() + self.ASYNC_OPERATION_TIMEOUT
+        operation_status = self._get_operation_status(request_id)
+        while operation_status.status == 'InProgress':
+            if time.time() >= deadline:
+                raise LibcloudError(
+                    'Message: Async request for operation %s has not been completed in time.' % operation_type,
+                    driver=self)
+            time.sleep(self.ASYNC_OPERATION_POLL_INTERVAL)
+            operation_status = self._get_operation_status(request_id)
+
+        if operation_status.status == 'Failed':
+            raise LibcloudError(
+                'Message: Async request for operation %s has failed: %s' % (
+                    operation_type, operation_status.error_message),
+                driver=self)
+
+    def list_images(self, location=None):
+        """
+        Replaces AzureNodeDriver's list_images with streaming parser.
+        """
+        images = self.ex_iter_images()
+        if location is not None:
+            images = (image for image in images if location in (image.extra['location'] or ''))
+        return list(images)
+
+    def ex_iter_images(self, name_regex=None):
+        """
+        Yield OS and VM images one by one.
+        :param name_regex: compiled regular expression to filter images by name while parsing
+        """
+        response = self._perform_get(self._get_image_path(), None)
+        self.raise_for_response(response, 200)
+        for element in iterparse_items(response.body, ['OSImage']):
+            if name_regex and not name_regex.match(element.findtext(azure_tag('Label')) or ''):
+                continue
+            yield self._element_to_image(element)
+
+        response = self._perform_get(self._get_vmimage_path(), None)
+        self.raise_for_response(response, 200)
+        for element in iterparse_items(response.body, ['VMImage']):
+            if name_regex and not name_regex.match(element.findtext(azure_tag('Label')) or ''):
+                continue
+            yield self._element_to_vm_image(element)
+
+    def list_nodes(self, ex_cloud_service_name):
+        """
+        Replaces AzureNodeDriver's list_nodes with dedicated deployment parser.
+        Only role instances of the first deployment are returned.
+        """
+        role_instances, virtual_ips = self._get_role_instances(ex_cloud_service_name)
+        return [self._to_node(role_instance, ex_cloud_service_name, virtual_ips or None)
+                for role_instance in role_instances]
+
+    def ex_list_role_instances(self, cloud_service_name):
+        """
+        Return role instances of the first deployment as compact records
+        with the same data as list_nodes but without building Node objects.
+        """
+        role_instances, virtual_ips = self._get_role_instances(cloud_service_name)
+        return [self._role_instance_to_record(role_instance, cloud_service_name, virtual_ips)
+                for role_instance in role_instances]
+
+    def _get_role_instances(self, cloud_service_name):
+        response = self._perform_get(
+            self._get_hosted_service_path(cloud_service_name) + '?embed-detail=True', None)
+        self.raise_for_response(response, 200)
+
+        if deployment_parser is not None:
+            return deployment_parser.parse(response.body)
+
+        role_instances = []
+        virtual_ips = []
+        for element in iterparse_items(response.body, ['RoleInstance', 'VirtualIP', 'Deployment']):
+            if element.tag == azure_tag('Deployment'):
+                break
+            elif element.tag == azure_tag('RoleInstance'):
+                role_instances.append(self._element_to_role_instance(element))
+            else:
+                virtual_ips.append(element.findtext(azure_tag('Address')))
+        return role_instances, virtual_ips
+
+    def _role_instance_to_record(self, role_instance, cloud_service_name, virtual_ips):
+        endpoints = role_instance.instance_endpoints
+        return {
+            'id': role_instance.role_name,
+            'name': role_instance.role_name,
+            'state': self.NODE_STATE_MAP.get(role_instance.instance_status, NodeState.UNKNOWN),
+            'public_ips': [endpoints[0].vip] if endpoints else list(virtual_ips),
+            'private_ips': [role_instance.ip_address],
+            'instance_size': role_instance.instance_size,
+            'power_state': role_instance.power_state,
+            'ex_cloud_service_name': cloud_service_name,
+            'instance_endpoints': endpoints,
+        }
+
+    def ex_list_storage_services(self):
+        return list(self.ex_iter_storage_services())
+
+    def ex_iter_storage_services(self):
+        """
+        Yield storage services one by one.
+        """
+        response = self._perform_get(self._get_storage_service_path(), None)
+        self.raise_for_response(response, 200)
+        for element in iterparse_items(response.body, ['StorageService']):
+            yield self._element_to_storage_service(element)
+
+    def ex_get_storage_service(self, name):
+        """
+        Return single storage service without listing all of them.
+        """
+        response = self._perform_get(self._get_storage_service_path(name), None)
+        self.raise_for_response(response, 200)
+        for element in iterparse_items(response.body, ['StorageService']):
+            return self._element_to_storage_service(element)
+
+    def _element_to_storage_service(self, element):
+        return StorageService(
+            service_name=element.findtext(azure_tag('ServiceName')),
+            url=element.findtext(azure_tag('Url')),
+            location=element.findtext(azure_tag('StorageServiceProperties/Location')),
+            status=element.findtext(azure_tag('StorageServiceProperties/Status')),
+        )
+
+    def _element_to_image(self, element):
+        return NodeImage(
+            id=element.findtext(azure_tag('Name')),
+            name=element.findtext(azure_tag('Label')),
+            driver=self.connection.driver,
+            extra={
+                'os': element.findtext(azure_tag('OS')),
+                'category': element.findtext(azure_tag('Category')),
+                'description': element.findtext(azure_tag('Description')),
+                'location': element.findtext(azure_tag('Location')),
+                'affinity_group': element.findtext(azure_tag('AffinityGroup')),
+                'media_link': element.findtext(azure_tag('MediaLink')),
+                'vm_image': False,
+            }
+        )
+
+    def _element_to_vm_image(self, element):
+        return NodeImage(
+            id=element.findtext(azure_tag('Name')),
+            name=element.findtext(azure_tag('Label')),
+            driver=self.connection.driver,
+            extra={
+                'os': element.findtext(azure_tag('OSDiskConfiguration/OS')),
+                'category': element.findtext(azure_tag('Category')),
+                'location': element.findtext(azure_tag('Location')),
+                'media_link': element.findtext(azure_tag('OSDiskConfiguration/MediaLink')),
+                'affinity_group': element.findtext(azure_tag('AffinityGroup')),
+                'deployment_name': element.findtext(azure_tag('DeploymentName')),
+                'vm_image': True,
+            }
+        )
+
+    def _element_to_role_instance(self, element):
+        endpoints = [
+            Endpoint(
+                name=endpoint.findtext(azure_tag('Name')),
+                protocol=endpoint.findtext(azure_tag('Protocol')),
+                local_port=endpoint.findtext(azure_tag('LocalPort')),
+                public_port=endpoint.findtext(azure_tag('PublicPort')),
+                vip=endpoint.findtext(azure_tag('Vip')),
+            )
+            for endpoint in element.iterfind(azure_tag('InstanceEndpoints/InstanceEndpoint'))
+        ]
+        return RoleInstance(
+            role_name=element.findtext(azure_tag('RoleName')),
+            instance_status=element.findtext(azure_tag('InstanceStatus')),
+            instance_size=element.findtext(azure_tag('InstanceSize')),
+            ip_address=element.findtext(azure_tag('IpAddress')),
+            power_state=element.findtext(azure_tag('PowerState')),
+            instance_endpoints=endpoints,
+        )
+
+    def ex_start_roles(self, cloud_service_name, deployment_name, role_names):
+        """
+        Start several roles of the deployment using single asynchronous operation.
+        """
+        return self._ex_perform_roles_operation(
+            cloud_service_name, deployment_name,
+            roles_operation_to_xml('StartRolesOperation', role_names))
+
+    def ex_shutdown_roles(self, cloud_service_name, deployment_name, role_names, post_shutdown_action='Stopped'):
+        """
+        Shut down several roles of the deployment using single asynchronous operation.
+        """
+        return self._ex_perform_roles_operation(
+            cloud_service_name, deployment_name,
+            roles_operation_to_xml('ShutdownRolesOperation', role_names, PostShutdownAction=post_shutdown_action))
+
+    def _ex_perform_roles_operation(self, cloud_service_name, deployment_name, body):
+        response = self._perform_post(
+            self._get_deployment_path_using_name(cloud_service_name, deployment_name) + '/Roles/Operations',
+            body)
+        self.raise_for_response(response, 202)
+        return response
+
+    def ex_delete(self, path):
+        """
+        Request deletion and return response of asynchronous operation,
+        libcloud drops it so that caller could not track the operation.
+        """
+        request = AzureHTTPRequest()
+        request.method = 'DELETE'
+        request.host = AZURE_SERVICE_MANAGEMENT_HOST
+        request.path = path
+        request.path, request.query = self._update_request_uri_query(request)
+        request.headers = self._update_management_header(request)
+        response = self._perform_request(request)
+        self.raise_for_response(response, 202)
+        return response
+
     def list_sizes(self):
         """
         Replaces AzureNodeDriver's list_sizes due to price change in Azure.
+        Sizes are built once per driver from the precomputed catalog.
+        """
+        return list(self._get_sizes().values())
+
+    def ex_get_size(self, size_id):
         """
-        sizes = []
+        Return size by its ID or raise KeyError.
+        """
+        return self._get_sizes()[size_id]
+
+    def _get_sizes(self):
+        if not hasattr(self, '_sizes'):
+            self._sizes = collections.OrderedDict(
+                (instance_type.id, self._to_node_size(instance_type._asdict()))
+                for instance_type in INSTANCE_TYPES)
+        return self._sizes
+
+
+def get_certificate_fingerprint(certificate):
+    return hashlib.sha256(certificate or b'').hexdigest()
+
+
+class CertificateCache(object):
+    """
+    Materializes PEM certificates on disk once per process.
+
+    Files are named by the hash of their content, readable by owner only
+    and kept in tmpfs when available. Each file is reference-counted and
+    removed when the last user releases it or the process exits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._directory = None
+        self._files = {}
+
+    def acquire(self, certificate):
+        fingerprint = get_certificate_fingerprint(certificate)
+        with self._lock:
+            if fingerprint in self._files:
+                path, count = self._files[fingerprint]
+            else:
+                path, count = self._write(fingerprint, certificate), 0
+            self._files[fingerprint] = (path, count + 1)
+        return path
+
+    def release(self, certificate):
+        fingerprint = get_certificate_fingerprint(certificate)
+        with self._lock:
+            if fingerprint not in self._files:
+                return
+            path, count = self._files[fingerprint]
+            if count > 1:
+                self._files[fingerprint] = (path, count - 1)
+                return
+            del self._files[fingerprint]
+        self._remove(path)
+
+    def clear(self):
+        with self._lock:
+            directory, self._directory = self._directory, None
+            self._files.clear()
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _write(self, fingerprint, certificate):
+        if self._directory is None:
+            parent = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            self._directory = tempfile.mkdtemp(prefix='waldur-azure-', dir=parent)
+
+        path = os.path.join(self._directory, '%s.pem' % fingerprint)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as cert_file:
+            cert_file.write(certificate)
+        return path
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+certificates = CertificateCache()
+atexit.register(certificates.clear)
+
+
+class _DriverPoolEntry(object):
+    """
+    Drivers sharing the same subscription and certificate.
+
+    libcloud connections are not thread-safe, so every thread gets its own
+    driver while the certificate file is shared by all of them.
+    """
+
+    def __init__(self, subscription_id, certificate, key_file=None, endpoint=None):
+        self.subscription_id = subscription_id
+        self.key_file = key_file
+        self.endpoint = endpoint
+        self._certificate = None
+        self._local = threading.local()
+
+        if key_file is None and certificate:
+            self.key_file = certificates.acquire(certificate)
+            self._certificate = certificate
+
+    def get_driver(self):
+        driver = getattr(self._local, 'driver', None)
+        if driver is None:
+            driver = self._local.driver = AzureNodeDriver(
+                subscription_id=self.subscription_id, key_file=self.key_file, url=self.endpoint)
+        return driver
+
+    def close(self):
+        if self._certificate:
+            certificates.release(self._certificate)
+
+
+class DriverRegistry(object):
+    """
+    Process-wide registry of warm AzureNodeDriver instances.
+
+    Drivers are keyed by subscription ID, certificate fingerprint and endpoint, so
+    keep-alive connections survive between backend instances and a new
+    driver is built as soon as credentials of the owner are changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._owners = {}
+
+    def get(self, owner, subscription_id, certificate, key_file=None, endpoint=None):
+        key = (subscription_id, get_certificate_fingerprint(certificate), endpoint)
+        with self._lock:
+            previous_key = self._owners.get(owner)
+            self._owners[owner] = key
+            if previous_key is not None and previous_key != key:
+                self._discard(previous_key)
+
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _DriverPoolEntry(subscription_id, certificate, key_file, endpoint)
+
+        return entry.get_driver()
+
+    def invalidate(self, owner):
+        with self._lock:
+            key = self._owners.pop(owner, None)
+            if key is not None:
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                entry.close()
+            self._entries.clear()
+            self._owners.clear()
+
+    def _discard(self, key):
+        # the same credentials may be used by several service settings
+        if key in self._owners.values():
+            return
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.close()
 
-        for _, values in AZURE_COMPUTE_INSTANCE_TYPES.items():
-            node_size = self._to_node_size(copy.deepcopy(values))
-            sizes.append(node_size)
 
-        return sizes
+drivers = DriverRegistry()
@@ -0,0 +1,731 @@
+"""
+Stateful in-memory emulator of the subset of Azure Service Management API
+used by AzureNodeDriver: cloud services, storage services, deployments and
+roles, role operations with asynchronous request status, images and locations.
+
+It is intended for load testing, so latency, throttling and failures of
+requests and operations could be injected. Point service settings to it
+with "endpoint" option, for example "http://localhost:8080".
+"""
+from __future__ import unicode_literals
+
+import base64
+import collections
+import heapq
+import itertools
+import logging
+import random
+import re
+import ssl
+import threading
+import time
+import uuid
+from xml.sax.saxutils import escape
+
+from django.utils import six
+from django.utils.six.moves import BaseHTTPServer, socketserver
+from django.utils.six.moves.urllib.parse import parse_qsl
+from libcloud.utils.py3 import httplib
+
+try:
+    from lxml import etree as ET
+except ImportError:
+    from xml.etree import ElementTree as ET
+
+from .driver import AZURE_NAMESPACE
+
+
+logger = logging.getLogger(__name__)
+
+LOCATIONS = ('Central US', 'East US', 'West Europe')
+ROLE_SIZES = ('ExtraSmall', 'Small', 'Medium', 'Large', 'ExtraLarge')
+
+Response = collections.namedtuple('Response', ('status', 'headers', 'body'))
+
+
+class EmulatorError(Exception):
+
+    def __init__(self, status, code, message, headers=None):
+        super(EmulatorError, self).__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+        self.headers = headers or {}
+
+
+class Role(object):
+
+    def __init__(self, name, size, ip_address, endpoints):
+        self.name = name
+        self.size = size
+        self.ip_address = ip_address
+        # list of (name, protocol, local port, public port)
+        self.endpoints = endpoints
+        self.status = 'ReadyRole'
+        self.power_state = 'Started'
+
+    def set_state(self, status, power_state):
+        self.status = status
+        self.power_state = power_state
+
+
+class Deployment(object):
+
+    def __init__(self, name, slot):
+        self.name = name
+        self.slot = slot
+        self.status = 'Running'
+        self.roles = collections.OrderedDict()
+        # request ID of operation which requires exclusive access to deployment
+        self.operation = None
+
+
+class CloudService(object):
+
+    def __init__(self, name, location, vip):
+        self.name = name
+        self.location = location
+        self.vip = vip
+        self.deployment = None
+
+
+class StorageService(object):
+
+    def __init__(self, name, location):
+        self.name = name
+        self.location = location
+        self.status = 'Created'
+
+
+class Operation(object):
+
+    def __init__(self, request_id, deadline, complete, rollback, deployment=None):
+        self.request_id = request_id
+        self.deadline = deadline
+        self.complete = complete
+        self.rollback = rollback
+        self.deployment = deployment
+        self.status = 'InProgress'
+        self.error = None
+
+
+def parse_xml(body):
+    """
+    Parse request document dropping namespaces so that bodies
+    serialized by libcloud and by this module are handled the same way.
+    """
+    root = ET.fromstring(body)
+    for element in root.iter():
+        if isinstance(element.tag, six.string_types) and '}' in element.tag:
+            element.tag = element.tag.split('}', 1)[1]
+    return root
+
+
+def render(tag, *children):
+    return '<%s>%s</%s>' % (tag, ''.join(children), tag)
+
+
+def render_text(tag, value):
+    return '<%s>%s</%s>' % (tag, escape(six.text_type(value)), tag)
+
+
+def render_document(tag, *children):
+    return '<%s xmlns="%s">%s</%s>' % (tag, AZURE_NAMESPACE, ''.join(children), tag)
+
+
+def encode_label(value):
+    return base64.b64encode(value.encode('utf-8')).decode('ascii')
+
+
+class ServiceManagementEmulator(object):
+    """
+    Asynchronous operations are completed lazily by the first request received
+    after operation duration has passed, so emulator does not need own threads.
+    Like Azure, it rejects concurrent operations on the same deployment.
+
+    :param latency: mean delay of every response in seconds
+    :param operation_duration: seconds asynchronous operation stays in progress
+    :param throttle_rate: share of requests rejected with 503 ServerBusy
+    :param failure_rate: share of requests failed with 500 InternalError
+    :param operation_failure_rate: share of asynchronous operations completed with Failed status
+    """
+
+    def __init__(self, subscription_id=None, latency=0, operation_duration=0, throttle_rate=0,
+                 failure_rate=0, operation_failure_rate=0, images_count=10, seed=None):
+        self.subscription_id = subscription_id
+        self.latency = latency
+        self.operation_duration = operation_duration
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.operation_failure_rate = operation_failure_rate
+        self.random = random.Random(seed)
+
+        self.lock = threading.RLock()
+        self.cloud_services = collections.OrderedDict()
+        self.storage_services = collections.OrderedDict()
+        self.operations = {}
+        self.pending_operations = []
+        self.operations_counter = itertools.count()
+        self.addresses_counter = itertools.count(1)
+        self.images = [
+            ('emulator-ubuntu-%s' % index, 'Ubuntu Server %s' % index, 'Linux')
+            if index % 2 == 0 else
+            ('emulator-windows-server-%s' % index, 'Windows Server %s' % index, 'Windows')
+            for index in range(images_count)
+        ]
+        self.routes = [(method, re.compile(r'^/[^/]+/%s$' % pattern), getattr(self, handler_name))
+                       for method, pattern, handler_name in self.ROUTES]
+
+    ROUTES = (
+        ('GET', r'locations', 'list_locations'),
+        ('GET', r'services/hostedservices', 'list_cloud_services'),
+        ('POST', r'services/hostedservices', 'create_cloud_service'),
+        ('GET', r'services/hostedservices/(?P<service>[^/]+)', 'get_cloud_service'),
+        ('GET', r'services/hostedservices/(?P<service>[^/]+)/deploymentslots/(?P<slot>[^/]+)',
+         'get_deployment_by_slot'),
+        ('POST', r'services/hostedservices/(?P<service>[^/]+)/deployments', 'create_deployment'),
+        ('GET', r'services/hostedservices/(?P<service>[^/]+)/deployments/(?P<deployment>[^/]+)',
+         'get_deployment'),
+        ('DELETE', r'services/hostedservices/(?P<service>[^/]+)/deployments/(?P<deployment>[^/]+)',
+         'delete_deployment'),
+        ('POST', r'services/hostedservices/(?P<service>[^/]+)/deployments/(?P<deployment>[^/]+)/roles',
+         'add_role'),
+        ('DELETE', r'services/hostedservices/(?P<service>[^/]+)/deployments/(?P<deployment>[^/]+)'
+                   r'/roles/(?P<role>[^/]+)', 'delete_role'),
+        ('POST', r'services/hostedservices/(?P<service>[^/]+)/deployments/(?P<deployment>[^/]+)'
+                 r'/roleinstances/(?P<role>[^/]+)/Operations', 'perform_role_operation'),
+        ('POST', r'services/hostedservices/(?P<service>[^/]+)/deployments/(?P<deployment>[^/]+)'
+                 r'/roleinstances/(?P<role>[^/]+)', 'reboot_role'),
+        ('POST', r'services/hostedservices/(?P<service>[^/]+)/deployments/(?P<deployment>[^/]+)'
+                 r'/Roles/Operations', 'perform_roles_operation'),
+        ('GET', r'services/storageservices', 'list_storage_services'),
+        ('POST', r'services/storageservices', 'create_storage_service'),
+        ('GET', r'services/storageservices/operations/isavailable/(?P<name>[^/]+)', 'check_storage_name'),
+        ('GET', r'services/storageservices/(?P<name>[^/]+)', 'get_storage_service'),
+        ('GET', r'services/images', 'list_images'),
+        ('GET', r'services/vmimages', 'list_vm_images'),
+        ('GET', r'operations/(?P<request_id>[^/]+)', 'get_operation'),
+    )
+
+    def populate(self, cloud_services_count, roles_count, location=LOCATIONS[0]):
+        """
+        Create cloud services with storage and running deployment of roles_count virtual machines each.
+        """
+        with self.lock:
+            for service_index in range(cloud_services_count):
+                name = 'cloud-%s' % service_index
+                cloud_service = self.add_cloud_service(name, location)
+                self.storage_services[name] = StorageService(name, location)
+                if not roles_count:
+                    continue
+
+                deployment = cloud_service.deployment = Deployment(name, 'Production')
+                for role_index in range(roles_count):
+                    role = self.make_role('vm-%s' % role_index, 'Small', [
+                        ('SSH', 'tcp', '22', six.text_type(22 if role_index == 0 else 40000 + role_index))])
+                    deployment.roles[role.name] = role
+
+    def add_cloud_service(self, name, location):
+        index = len(self.cloud_services) + 1
+        cloud_service = CloudService(name, location, '10.%s.%s.%s' % (index >> 16 & 255, index >> 8 & 255, index & 255))
+        self.cloud_services[name] = cloud_service
+        return cloud_service
+
+    def make_role(self, name, size, endpoints):
+        index = next(self.addresses_counter)
+        return Role(name, size, '192.168.%s.%s' % (index >> 8 & 255, index & 255), endpoints)
+
+    # Request processing
+
+    def handle(self, method, path, body=b''):
+        if self.latency:
+            time.sleep(self.random.uniform(0.5, 1.5) * self.latency)
+
+        path, _, query = path.partition('?')
+        try:
+            handler, kwargs = self.resolve(method, path)
+            self.inject_faults()
+            with self.lock:
+                self.complete_operations()
+                return handler(query=dict(parse_qsl(query)), body=body, **kwargs)
+        except EmulatorError as e:
+            return Response(e.status, e.headers, render_document(
+                'Error', render_text('Code', e.code), render_text('Message', e.message)))
+
+    def resolve(self, method, path):
+        if self.subscription_id and path.split('/')[1] != self.subscription_id:
+            raise EmulatorError(httplib.FORBIDDEN, 'ForbiddenError', 'The server failed to authenticate the request.')
+
+        for route_method, regex, handler in self.routes:
+            match = regex.match(path)
+            if match and route_method == method:
+                return handler, match.groupdict()
+        raise EmulatorError(httplib.NOT_FOUND, 'ResourceNotFound', 'The requested resource %s does not exist.' % path)
+
+    def inject_faults(self):
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            raise EmulatorError(httplib.SERVICE_UNAVAILABLE, 'ServerBusy', 'The server is currently unable to '
+                                'receive requests. Please retry your request.', {'Retry-After': '1'})
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise EmulatorError(httplib.INTERNAL_SERVER_ERROR, 'InternalError', 'The server encountered an '
+                                'internal error. Please retry the request.')
+
+    def respond(self, body='', status=httplib.OK, headers=None):
+        return Response(status, headers or {}, body)
+
+    # Asynchronous operations
+
+    def start_operation(self, complete, rollback, deployment=None):
+        """
+        Register operation which calls complete or rollback when its duration passes.
+        Deployment is locked until operation is completed.
+        """
+        if deployment is not None:
+            self.check_deployment_is_free(deployment)
+
+        request_id = uuid.uuid4().hex
+        operation = Operation(request_id, time.time() + self.operation_duration, complete, rollback, deployment)
+        self.operations[request_id] = operation
+        heapq.heappush(self.pending_operations, (operation.deadline, next(self.operations_counter), operation))
+        if deployment is not None:
+            deployment.operation = request_id
+
+        self.complete_operations()
+        return self.respond(status=httplib.ACCEPTED, headers={'x-ms-request-id': request_id})
+
+    def check_deployment_is_free(self, deployment):
+        if deployment.operation:
+            raise EmulatorError(
+                httplib.CONFLICT, 'ConflictError',
+                'Windows Azure is currently performing an operation with x-ms-requestid %s on this deployment '
+                'that requires exclusive access.' % deployment.operation)
+
+    def complete_operations(self):
+        now = time.time()
+        while self.pending_operations and self.pending_operations[0][0] <= now:
+            _, _, operation = heapq.heappop(self.pending_operations)
+            if operation.deployment is not None:
+                operation.deployment.operation = None
+
+            if self.operation_failure_rate and self.random.random() < self.operation_failure_rate:
+                operation.rollback()
+                operation.status = 'Failed'
+                operation.error = ('InternalError', 'The operation has failed.')
+            else:
+                operation.complete()
+                operation.status = 'Succeeded'
+
+    def get_operation(self, request_id, **kwargs):
+        operation = self.operations.get(request_id)
+        if operation is None:
+            raise EmulatorError(httplib.NOT_FOUND, 'ResourceNotFound', 'The operation %s does not exist.' % request_id)
+
+        children = [
+            render_text('ID', operation.request_id),
+            render_text('Status', operation.status),
+        ]
+        if operation.status == 'Succeeded':
+            children.append(render_text('HttpStatusCode', httplib.OK))
+        elif operation.status == 'Failed':
+            children.append(render_text('HttpStatusCode', httplib.INTERNAL_SERVER_ERROR))
+            children.append(render('Error', render_text('Code', operation.error[0]),
+                                   render_text('Message', operation.error[1])))
+        return self.respond(render_document('Operation', *children))
+
+    # Locations and images
+
+    def list_locations(self, **kwargs):
+        return self.respond(render_document('Locations', *[
+            render(
+                'Location',
+                render_text('Name', location),
+                render_text('DisplayName', location),
+                render('AvailableServices', render_text('AvailableService', 'Compute'),
+                       render_text('AvailableService', 'Storage')),
+                render('ComputeCapabilities', render('VirtualMachinesRoleSizes', *[
+                    render_text('RoleSize', size) for size in ROLE_SIZES])),
+            )
+            for location in LOCATIONS
+        ]))
+
+    def list_images(self, **kwargs):
+        return self.respond(render_document('Images', *[
+            render(
+                'OSImage',
+                render_text('Name', image_id),
+                render_text('Label', label),
+                render_text('OS', os),
+                render_text('Category', 'Public'),
+                render_text('Location', ';'.join(LOCATIONS)),
+                render_text('LogicalSizeInGB', 30),
+            )
+            for image_id, label, os in self.images
+        ]))
+
+    def list_vm_images(self, **kwargs):
+        return self.respond(render_document('VMImages'))
+
+    # Cloud services and deployments
+
+    def get_cloud_service_or_404(self, name):
+        try:
+            return self.cloud_services[name]
+        except KeyError:
+            raise EmulatorError(httplib.NOT_FOUND, 'ResourceNotFound', 'The hosted service does not exist.')
+
+    def get_deployment_or_404(self, cloud_service, deployment_name=None, slot=None):
+        deployment = cloud_service.deployment
+        if deployment is None or (deployment_name and deployment.name != deployment_name) or \
+                (slot and deployment.slot.lower() != slot.lower()):
+            raise EmulatorError(httplib.NOT_FOUND, 'ResourceNotFound', 'No deployments were found.')
+        return deployment
+
+    def get_role_or_404(self, deployment, name):
+        try:
+            return deployment.roles[name]
+        except KeyError:
+            raise EmulatorError(httplib.NOT_FOUND, 'ResourceNotFound', 'The role %s does not exist.' % name)
+
+    def render_cloud_service_properties(self, cloud_service):
+        return render(
+            'HostedServiceProperties',
+            render_text('Label', encode_label(cloud_service.name)),
+            render_text('Location', cloud_service.location),
+            render_text('Status', 'Created'),
+        )
+
+    def render_role_instance(self, cloud_service, role):
+        return render(
+            'RoleInstance',
+            render_text('RoleName', role.name),
+            render_text('InstanceName', role.name),
+            render_text('InstanceStatus', role.status),
+            render_text('InstanceSize', role.size),
+            render_text('IpAddress', role.ip_address),
+            render('InstanceEndpoints', *[
+                render(
+                    'InstanceEndpoint',
+                    render_text('Name', name),
+                    render_text('Vip', cloud_service.vip),
+                    render_text('PublicPort', public_port),
+                    render_text('LocalPort', local_port),
+                    render_text('Protocol', protocol),
+                )
+                for name, protocol, local_port, public_port in role.endpoints
+            ]),
+            render_text('PowerState', role.power_state),
+        )
+
+    def render_deployment(self, cloud_service):
+        deployment = cloud_service.deployment
+        return (
+            render_text('Name', deployment.name),
+            render_text('DeploymentSlot', deployment.slot),
+            render_text('Status', deployment.status),
+            render_text('Label', encode_label(deployment.name)),
+            render('RoleInstanceList', *[
+                self.render_role_instance(cloud_service, role) for role in deployment.roles.values()]),
+            render('RoleList', *[
+                render('Role', render_text('RoleName', role.name), render_text('RoleType', 'PersistentVMRole'),
+                       render_text('RoleSize', role.size))
+                for role in deployment.roles.values()
+            ]),
+            render('VirtualIPs', render('VirtualIP', render_text('Address', cloud_service.vip))),
+        )
+
+    def render_cloud_service(self, cloud_service, embed_detail=False):
+        children = [
+            render_text('Url', 'https://management.core.windows.net/services/hostedservices/%s' % cloud_service.name),
+            render_text('ServiceName', cloud_service.name),
+            self.render_cloud_service_properties(cloud_service),
+        ]
+        if embed_detail and cloud_service.deployment:
+            children.append(render('Deployments', render('Deployment', *self.render_deployment(cloud_service))))
+        return children
+
+    def list_cloud_services(self, **kwargs):
+        return self.respond(render_document('HostedServices', *[
+            render('HostedService', *self.render_cloud_service(cloud_service))
+            for cloud_service in self.cloud_services.values()
+        ]))
+
+    def create_cloud_service(self, body, **kwargs):
+        document = parse_xml(body)
+        name = document.findtext('ServiceName')
+        if name in self.cloud_services:
+            raise EmulatorError(httplib.CONFLICT, 'ConflictError', 'The specified DNS name is already taken.')
+        self.add_cloud_service(name, document.findtext('Location') or LOCATIONS[0])
+        return self.respond(status=httplib.CREATED)
+
+    def get_cloud_service(self, service, query, **kwargs):
+        cloud_service = self.get_cloud_service_or_404(service)
+        embed_detail = query.get('embed-detail', '').lower() == 'true'
+        return self.respond(render_document(
+            'HostedService', *self.render_cloud_service(cloud_service, embed_detail)))
+
+    def get_deployment_by_slot(self, service, slot, **kwargs):
+        cloud_service = self.get_cloud_service_or_404(service)
+        self.get_deployment_or_404(cloud_service, slot=slot)
+        return self.respond(render_document('Deployment', *self.render_deployment(cloud_service)))
+
+    def get_deployment(self, service, deployment, **kwargs):
+        cloud_service = self.get_cloud_service_or_404(service)
+        self.get_deployment_or_404(cloud_service, deployment_name=deployment)
+        return self.respond(render_document('Deployment', *self.render_deployment(cloud_service)))
+
+    def parse_role(self, element, deployment):
+        endpoints = []
+        used_ports = {public_port for role in deployment.roles.values()
+                      for _, _, _, public_port in role.endpoints} if deployment else set()
+        for endpoint in element.iterfind('ConfigurationSets/ConfigurationSet/InputEndpoints/InputEndpoint'):
+            public_port = endpoint.findtext('Port')
+            if public_port in used_ports:
+                raise EmulatorError(httplib.CONFLICT, 'ConflictError',
+                                    'Port %s is already in use by one of the endpoints in this deployment.' %
+                                    public_port)
+            endpoints.append((endpoint.findtext('Name'), endpoint.findtext('Protocol'),
+                              endpoint.findtext('LocalPort'), public_port))
+        role = self.make_role(element.findtext('RoleName'), element.findtext('RoleSize') or 'Small', endpoints)
+        role.set_state('Provisioning', 'Starting')
+        return role
+
+    def create_deployment(self, service, body, **kwargs):
+        cloud_service = self.get_cloud_service_or_404(service)
+        if cloud_service.deployment is not None:
+            raise EmulatorError(httplib.CONFLICT, 'ConflictError',
+                                'The deployment slot is already occupied by another deployment.')
+
+        document = parse_xml(body)
+        deployment = Deployment(document.findtext('Name'), document.findtext('DeploymentSlot') or 'Production')
+        deployment.status = 'Deploying'
+        for element in document.iterfind('RoleList/Role'):
+            role = self.parse_role(element, deployment)
+            deployment.roles[role.name] = role
+        cloud_service.deployment = deployment
+
+        def complete():
+            deployment.status = 'Running'
+            for role in deployment.roles.values():
+                role.set_state('ReadyRole', 'Started')
+
+        def rollback():
+            cloud_service.deployment = None
+
+        return self.start_operation(complete, rollback, deployment)
+
+    def delete_deployment(self, service, deployment, **kwargs):
+        cloud_service = self.get_cloud_service_or_404(service)
+        deployment = self.get_deployment_or_404(cloud_service, deployment_name=deployment)
+        self.check_deployment_is_free(deployment)
+        deployment.status = 'Deleting'
+        for role in deployment.roles.values():
+            role.set_state('DeletingVM', 'Stopping')
+
+        def complete():
+            cloud_service.deployment = None
+
+        def rollback():
+            deployment.status = 'Running'
+            for role in deployment.roles.values():
+                role.set_state('ReadyRole', 'Started')
+
+        return self.start_operation(complete, rollback, deployment)
+
+    def add_role(self, service, deployment, body, **kwargs):
+        cloud_service = self.get_cloud_service_or_404(service)
+        deployment = self.get_deployment_or_404(cloud_service, deployment_name=deployment)
+        self.check_deployment_is_free(deployment)
+        role = self.parse_role(parse_xml(body), deployment)
+        if role.name in deployment.roles:
+            raise EmulatorError(httplib.CONFLICT, 'ConflictError', 'A role named %s already exists.' % role.name)
+        deployment.roles[role.name] = role
+
+        def complete():
+            role.set_state('ReadyRole', 'Started')
+
+        def rollback():
+            deployment.roles.pop(role.name, None)
+
+        return self.start_operation(complete, rollback, deployment)
+
+    def delete_role(self, service, deployment, role, **kwargs):
+        cloud_service = self.get_cloud_service_or_404(service)
+        deployment = self.get_deployment_or_404(cloud_service, deployment_name=deployment)
+        role = self.get_role_or_404(deployment, role)
+        if len(deployment.roles) == 1:
+            raise EmulatorError(httplib.BAD_REQUEST, 'BadRequest',
+                                'The last role in the deployment cannot be deleted, delete the deployment instead.')
+        self.check_deployment_is_free(deployment)
+        status, power_state = role.status, role.power_state
+        role.set_state('DeletingVM', 'Stopping')
+
+        def complete():
+            deployment.roles.pop(role.name, None)
+
+        def rollback():
+            role.set_state(status, power_state)
+
+        return self.start_operation(complete, rollback, deployment)
+
+    # Role operations
+
+    ROLE_OPERATIONS = {
+        # operation type: (transitional state, final state)
+        'StartRoleOperation': (('StartingVM', 'Starting'), ('ReadyRole', 'Started')),
+        'ShutdownRoleOperation': (('StoppingVM', 'Stopping'), ('StoppedVM', 'Stopped')),
+        'RestartRoleOperation': (('RestartingRole', 'Started'), ('ReadyRole', 'Started')),
+    }
+
+    def apply_role_operation(self, deployment, roles, operation_type):
+        try:
+            transitional_state, final_state = self.ROLE_OPERATIONS[operation_type]
+        except KeyError:
+            raise EmulatorError(httplib.BAD_REQUEST, 'BadRequest', 'Operation %s is not supported.' % operation_type)
+
+        self.check_deployment_is_free(deployment)
+        previous_states = [(role, role.status, role.power_state) for role in roles]
+        for role in roles:
+            role.set_state(*transitional_state)
+
+        def complete():
+            for role in roles:
+                role.set_state(*final_state)
+
+        def rollback():
+            for role, status, power_state in previous_states:
+                role.set_state(status, power_state)
+
+        return self.start_operation(complete, rollback, deployment)
+
+    def get_role_operation_target(self, service, deployment, role):
+        cloud_service = self.get_cloud_service_or_404(service)
+        deployment = self.get_deployment_or_404(cloud_service, deployment_name=deployment)
+        return deployment, self.get_role_or_404(deployment, role)
+
+    def perform_role_operation(self, service, deployment, role, body, **kwargs):
+        deployment, role = self.get_role_operation_target(service, deployment, role)
+        operation_type = parse_xml(body).findtext('OperationType')
+        return self.apply_role_operation(deployment, [role], operation_type)
+
+    def reboot_role(self, service, deployment, role, query, **kwargs):
+        if query.get('comp') != 'reboot':
+            raise EmulatorError(httplib.BAD_REQUEST, 'BadRequest', 'Operation is not supported.')
+        deployment, role = self.get_role_operation_target(service, deployment, role)
+        return self.apply_role_operation(deployment, [role], 'RestartRoleOperation')
+
+    def perform_roles_operation(self, service, deployment, body, **kwargs):
+        cloud_service = self.get_cloud_service_or_404(service)
+        deployment = self.get_deployment_or_404(cloud_service, deployment_name=deployment)
+        document = parse_xml(body)
+        roles = [self.get_role_or_404(deployment, name.text) for name in document.iterfind('Roles/Name')]
+        operation_type = document.findtext('OperationType').replace('Roles', 'Role')
+        return self.apply_role_operation(deployment, roles, operation_type)
+
+    # Storage services
+
+    def render_storage_service(self, storage_service):
+        return (
+            render_text('Url', 'https://management.core.windows.net/services/storageservices/%s' %
+                        storage_service.name),
+            render_text('ServiceName', storage_service.name),
+            render(
+                'StorageServiceProperties',
+                render_text('Label', encode_label(storage_service.name)),
+                render_text('Location', storage_service.location),
+                render_text('Status', storage_service.status),
+            ),
+        )
+
+    def list_storage_services(self, **kwargs):
+        return self.respond(render_document('StorageServices', *[
+            render('StorageService', *self.render_storage_service(storage_service))
+            for storage_service in self.storage_services.values()
+        ]))
+
+    def get_storage_service(self, name, **kwargs):
+        try:
+            storage_service = self.storage_services[name]
+        except KeyError:
+            raise EmulatorError(httplib.NOT_FOUND, 'ResourceNotFound', 'The storage account does not exist.')
+        return self.respond(render_document('StorageService', *self.render_storage_service(storage_service)))
+
+    def check_storage_name(self, name, **kwargs):
+        return self.respond(render_document(
+            'AvailabilityResponse', render_text('Result', 'false' if name in self.storage_services else 'true')))
+
+    def create_storage_service(self, body, **kwargs):
+        document = parse_xml(body)
+        name = document.findtext('ServiceName')
+        if name in self.storage_services:
+            raise EmulatorError(httplib.CONFLICT, 'ConflictError', 'The storage account named %s is already taken.' %
+                                name)
+        storage_service = self.storage_services[name] = StorageService(
+            name, document.findtext('Location') or LOCATIONS[0])
+        storage_service.status = 'Creating'
+
+        def complete():
+            storage_service.status = 'Created'
+
+        def rollback():
+            self.storage_services.pop(name, None)
+
+        return self.start_operation(complete, rollback)
+
+
+class EmulatorRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep connections alive as libcloud does
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        response = self.server.emulator.handle(method, self.path, body)
+        payload = response.body.encode('utf-8')
+
+        self.send_response(response.status)
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class EmulatorServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    HTTP server of emulator. TLS is enabled when server certificate is given,
+    client certificates are required when certificate authority is given as well.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, emulator, certfile=None, client_ca_file=None):
+        BaseHTTPServer.HTTPServer.__init__(self, address, EmulatorRequestHandler)
+        self.emulator = emulator
+        self.secure = bool(certfile)
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            context.load_cert_chain(certfile)
+            if client_ca_file:
+                context.verify_mode = ssl.CERT_REQUIRED
+                context.load_verify_locations(client_ca_file)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return '%s://%s:%s' % ('https' if self.secure else 'http', host, port)
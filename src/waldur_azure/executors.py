@@ -2,10 +2,13 @@ from __future__ import unicode_literals
 
 from celery import chain
 
-from waldur_core.core import executors as core_executors, tasks as core_tasks
+from waldur_core.core import executors as core_executors, tasks as core_tasks, utils as core_utils
 from waldur_core.structure import executors as structure_executors
 
-from . import models
+from . import models, polling, tasks
+
+
+Transitions = models.TransitionStatistics.Transitions
 
 
 class VirtualMachineStartExecutor(core_executors.ActionExecutor):
@@ -14,12 +17,13 @@ class VirtualMachineStartExecutor(core_executors.ActionExecutor):
     @classmethod
     def get_task_signature(cls, instance, serialized_instance, **kwargs):
         return chain(
-            core_tasks.BackendMethodTask().si(
+            tasks.DeploymentBackendMethodTask().si(
                 serialized_instance, backend_method='start_vm', state_transition='begin_updating',
             ),
-            core_tasks.PollRuntimeStateTask().si(
+            tasks.PollOperationTask().si(serialized_instance, operation_name='start_vm').set(
+                countdown=polling.get_first_check(Transitions.START, instance)),
+            tasks.PollRuntimeStateTask().si(
                 serialized_instance,
-                backend_pull_method='pull_virtual_machine_runtime_state',
                 success_state='running',
                 erred_state='erred'
             ),
@@ -32,12 +36,13 @@ class VirtualMachineStopExecutor(core_executors.ActionExecutor):
     @classmethod
     def get_task_signature(cls, instance, serialized_instance, **kwargs):
         return chain(
-            core_tasks.BackendMethodTask().si(
+            tasks.DeploymentBackendMethodTask().si(
                 serialized_instance, backend_method='stop_vm', state_transition='begin_updating',
             ),
-            core_tasks.PollRuntimeStateTask().si(
+            tasks.PollOperationTask().si(serialized_instance, operation_name='stop_vm').set(
+                countdown=polling.get_first_check(Transitions.STOP, instance)),
+            tasks.PollRuntimeStateTask().si(
                 serialized_instance,
-                backend_pull_method='pull_virtual_machine_runtime_state',
                 success_state='stopped',
                 erred_state='error'
             ),
@@ -50,35 +55,87 @@ class VirtualMachineRestartExecutor(core_executors.ActionExecutor):
     @classmethod
     def get_task_signature(cls, instance, serialized_instance, **kwargs):
         return chain(
-            core_tasks.BackendMethodTask().si(
+            tasks.DeploymentBackendMethodTask().si(
                 serialized_instance, backend_method='reboot_vm', state_transition='begin_updating',
             ),
-            core_tasks.PollRuntimeStateTask().si(
+            tasks.PollOperationTask().si(serialized_instance, operation_name='reboot_vm').set(
+                countdown=polling.get_first_check(Transitions.RESTART, instance)),
+            tasks.PollRuntimeStateTask().si(
                 serialized_instance,
-                backend_pull_method='pull_virtual_machine_runtime_state',
                 success_state='running',
                 erred_state='error'
             ),
         )
 
 
+class VirtualMachinesActionExecutor(object):
+    """
+    Apply action to virtual machines of the same cloud service deployment
+    using single role operation tracked by single chain.
+    """
+    action = ''
+    backend_method = None
+    transition = None
+    success_state = None
+    erred_state = None
+
+    @classmethod
+    def execute(cls, virtual_machines, countdown=2):
+        for virtual_machine in virtual_machines:
+            virtual_machine.schedule_updating()
+            virtual_machine.action = cls.action
+            virtual_machine.action_details = {}
+            virtual_machine.save()
+
+        serialized_virtual_machines = [core_utils.serialize_instance(vm) for vm in virtual_machines]
+        signature = chain(
+            tasks.VirtualMachinesBackendMethodTask().si(
+                serialized_virtual_machines, backend_method=cls.backend_method, state_transition='begin_updating'),
+            tasks.PollOperationStatusTask().s().set(countdown=polling.get_first_check(cls.transition)),
+            tasks.PollVirtualMachinesRuntimeStateTask().si(
+                serialized_virtual_machines, success_state=cls.success_state, erred_state=cls.erred_state),
+        )
+        link = [core_tasks.StateTransitionTask().si(
+            serialized_vm, state_transition='set_ok', action='', action_details={})
+            for serialized_vm in serialized_virtual_machines]
+        link_error = [core_tasks.ErrorStateTransitionTask().s(serialized_vm)
+                      for serialized_vm in serialized_virtual_machines]
+        return signature.apply_async(link=link, link_error=link_error, countdown=countdown)
+
+
+class VirtualMachinesStartExecutor(VirtualMachinesActionExecutor):
+    action = 'Start'
+    backend_method = 'start_vms'
+    transition = Transitions.START
+    success_state = 'running'
+    erred_state = 'erred'
+
+
+class VirtualMachinesStopExecutor(VirtualMachinesActionExecutor):
+    action = 'Stop'
+    backend_method = 'stop_vms'
+    transition = Transitions.STOP
+    success_state = 'stopped'
+    erred_state = 'error'
+
+
 class VirtualMachineCreateExecutor(core_executors.CreateExecutor):
 
     @classmethod
     def get_task_signature(cls, instance, serialized_instance, **kwargs):
         return chain(
-            core_tasks.BackendMethodTask().si(
+            tasks.DeploymentBackendMethodTask().si(
                 serialized_instance,
                 backend_method='provision_vm',
                 state_transition='begin_creating',
                 **kwargs
             ),
-            core_tasks.PollRuntimeStateTask().si(
+            tasks.PollRuntimeStateTask().si(
                 serialized_instance,
-                backend_pull_method='pull_virtual_machine_runtime_state',
                 success_state='running',
                 erred_state='error',
-            ).set(countdown=30),
+                transition=Transitions.CREATE,
+            ).set(countdown=polling.get_first_check(Transitions.CREATE, instance)),
             core_tasks.BackendMethodTask().si(
                 serialized_instance,
                 backend_method='pull_vm_info',
@@ -86,13 +143,45 @@ class VirtualMachineCreateExecutor(core_executors.CreateExecutor):
         )
 
 
+class VirtualMachinesCreateExecutor(object):
+    """
+    Provision virtual machines of the same cloud service one after another,
+    because Azure allows only one operation on deployment at a time.
+    Every virtual machine is tracked until it is OK right after its own provisioning,
+    so that failure of a later one does not set erred already provisioned ones.
+    """
+
+    @classmethod
+    def execute(cls, virtual_machines, backend_image_id, backend_size_id, countdown=2):
+        serialized_virtual_machines = [core_utils.serialize_instance(vm) for vm in virtual_machines]
+        vm_tasks = []
+        for serialized_vm in serialized_virtual_machines:
+            vm_tasks.extend([
+                tasks.DeploymentBackendMethodTask().si(
+                    serialized_vm,
+                    backend_method='provision_vm',
+                    state_transition='begin_creating',
+                    backend_image_id=backend_image_id,
+                    backend_size_id=backend_size_id,
+                ),
+                tasks.PollRuntimeStateTask().si(serialized_vm, success_state='running', erred_state='error'),
+                core_tasks.BackendMethodTask().si(serialized_vm, backend_method='pull_vm_info'),
+                core_tasks.StateTransitionTask().si(
+                    serialized_vm, state_transition='set_ok', action='', action_details={}),
+            ])
+
+        signature = chain(*vm_tasks)
+        link_error = tasks.ErrorVirtualMachinesTask().s(serialized_virtual_machines)
+        return signature.apply_async(link_error=link_error, countdown=countdown)
+
+
 class VirtualMachineDeleteExecutor(core_executors.DeleteExecutor):
 
     @classmethod
     def get_task_signature(cls, instance, serialized_instance, **kwargs):
         if instance.backend_id:
             return chain(
-                core_tasks.BackendMethodTask().si(
+                tasks.DeploymentBackendMethodTask().si(
                     serialized_instance, backend_method='destroy_vm', state_transition='begin_deleting'),
                 core_tasks.PollBackendCheckTask().si(serialized_instance, 'is_vm_deleted'),
             )
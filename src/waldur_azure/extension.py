@@ -3,6 +3,56 @@ from waldur_core.core import WaldurExtension
 
 class AzureExtension(WaldurExtension):
 
+    class Settings:
+        WALDUR_AZURE = {
+            # seconds to keep a snapshot of cloud service virtual machines
+            'NODE_INVENTORY_TTL': 15,
+            # seconds to keep name and roles of cloud service deployment
+            'DEPLOYMENT_CACHE_TTL': 10 * 60,
+            # seconds to consider image catalog fresh
+            'IMAGE_CATALOG_TTL': 60 * 60,
+            # seconds to serve outdated image catalog while it is being refreshed
+            'IMAGE_CATALOG_STALE_TTL': 24 * 60 * 60,
+            # seconds to reuse result of read call by callers started at the same time
+            'SINGLE_FLIGHT_TTL': 5,
+            # seconds to wait for concurrent caller to publish result of identical read call
+            'SINGLE_FLIGHT_TIMEOUT': 30,
+            # maximum number of concurrent requests while listing cloud services
+            'FAN_OUT_WORKERS': 8,
+            # seconds to wait for a single cloud service listing
+            'FAN_OUT_TIMEOUT': 60,
+            # seconds between pulls of runtime state of virtual machines in transition,
+            # beat schedule is built while settings are loaded, so it always uses default value
+            'RUNTIME_STATE_PULL_INTERVAL': 30,
+            # seconds after which asynchronous operation still in progress is considered failed
+            'OPERATION_TIMEOUT': 60 * 60,
+            # dotted path to class receiving latency and status of Service Management calls
+            'METRICS_SINK': 'waldur_azure.metrics.InMemoryMetricsSink',
+            # maximum number of Service Management calls per second and subscription, None disables limiter
+            'RATE_LIMIT': 10,
+            # number of repeats of throttled or transiently failed call
+            'RETRY_MAX_ATTEMPTS': 4,
+            # seconds to wait before first repeat, doubled for every next one
+            'RETRY_BACKOFF': 1,
+            # maximum seconds to wait before repeat
+            'RETRY_MAX_BACKOFF': 30,
+            # seconds a worker may hold exclusive right to issue request on cloud service deployment,
+            # it should exceed ASYNC_OPERATION_TIMEOUT of driver as lease is held while it waits for provisioning
+            'DEPLOYMENT_LEASE_TTL': 35 * 60,
+            # seconds between attempts of operation waiting for busy cloud service deployment
+            'DEPLOYMENT_QUEUE_INTERVAL': 2,
+            # seconds after which operation waiting for busy cloud service deployment fails
+            'DEPLOYMENT_QUEUE_TIMEOUT': 60 * 60,
+            # seconds to wait before the first check of virtual machine transition without history,
+            # initial interval between checks, its growth factor, its maximum and seconds to give up
+            'POLLING': {
+                'create': {'first_check': 60, 'interval': 15, 'factor': 1.5, 'max_interval': 60, 'deadline': 30 * 60},
+                'start': {'first_check': 5, 'interval': 5, 'factor': 1.5, 'max_interval': 30, 'deadline': 15 * 60},
+                'stop': {'first_check': 2, 'interval': 3, 'factor': 1.5, 'max_interval': 30, 'deadline': 15 * 60},
+                'restart': {'first_check': 10, 'interval': 5, 'factor': 1.5, 'max_interval': 30, 'deadline': 15 * 60},
+            },
+        }
+
     @staticmethod
     def django_app():
         return 'waldur_azure'
@@ -12,6 +62,22 @@ class AzureExtension(WaldurExtension):
         from .urls import register_in
         return register_in
 
+    @staticmethod
+    def celery_tasks():
+        from datetime import timedelta
+        return {
+            'waldur-azure-pull-runtime-states': {
+                'task': 'waldur_azure.pull_runtime_states',
+                'schedule': timedelta(seconds=AzureExtension.Settings.WALDUR_AZURE['RUNTIME_STATE_PULL_INTERVAL']),
+                'args': (),
+            },
+            'waldur-azure-pull-operations': {
+                'task': 'waldur_azure.pull_operations',
+                'schedule': timedelta(seconds=10),
+                'args': (),
+            },
+        }
+
     @staticmethod
     def get_cleanup_executor():
         from .executors import AzureCleanupExecutor
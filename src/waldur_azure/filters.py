@@ -3,6 +3,6 @@ from waldur_core.structure import filters as structure_filters
 from . import models
 
 
-class ImageFilter(structure_filters.BaseServicePropertyFilter):
-    class Meta(structure_filters.BaseServicePropertyFilter.Meta):
+class ImageFilter(structure_filters.ServicePropertySettingsFilter):
+    class Meta(structure_filters.ServicePropertySettingsFilter.Meta):
         model = models.Image
@@ -1,3 +1,6 @@
+from .apps import AzureConfig
+from .driver import drivers
+
 
 def copy_cloud_service_name_on_service_creation(sender, instance, created=False, **kwargs):
     if not created:
@@ -10,3 +13,10 @@ def copy_cloud_service_name_on_service_creation(sender, instance, created=False,
     cloud_service_name = service_project_link.service.settings.options['cloud_service_name']
     instance.cloud_service_name = cloud_service_name
     instance.save()
+
+
+def invalidate_driver_on_settings_deletion(sender, instance, **kwargs):
+    if instance.type != AzureConfig.service_name:
+        return
+
+    drivers.invalidate(instance.uuid.hex)
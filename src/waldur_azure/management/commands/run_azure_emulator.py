@@ -0,0 +1,58 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from waldur_azure.emulator import EmulatorServer, ServiceManagementEmulator
+
+
+class Command(BaseCommand):
+    help = ("Run local emulator of Azure Service Management API for load testing. "
+            "Point service settings to it with \"endpoint\" option.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', dest='host', default='127.0.0.1')
+        parser.add_argument('--port', dest='port', type=int, default=8080)
+        parser.add_argument('--subscription', dest='subscription_id', default=None,
+                            help='Reject requests for other subscriptions.')
+        parser.add_argument('--cloud-services', dest='cloud_services', type=int, default=1,
+                            help='Number of cloud services created on start.')
+        parser.add_argument('--vms', dest='vms', type=int, default=0,
+                            help='Number of running virtual machines in every cloud service.')
+        parser.add_argument('--images', dest='images', type=int, default=10)
+        parser.add_argument('--latency', dest='latency', type=float, default=0,
+                            help='Mean delay of every response in seconds.')
+        parser.add_argument('--operation-duration', dest='operation_duration', type=float, default=5,
+                            help='Seconds asynchronous operation stays in progress.')
+        parser.add_argument('--throttle-rate', dest='throttle_rate', type=float, default=0,
+                            help='Share of requests rejected with 503 ServerBusy.')
+        parser.add_argument('--failure-rate', dest='failure_rate', type=float, default=0,
+                            help='Share of requests failed with 500 InternalError.')
+        parser.add_argument('--operation-failure-rate', dest='operation_failure_rate', type=float, default=0,
+                            help='Share of asynchronous operations which fail.')
+        parser.add_argument('--seed', dest='seed', type=int, default=None)
+        parser.add_argument('--certfile', dest='certfile', default=None,
+                            help='PEM file with server certificate and key, enables HTTPS.')
+        parser.add_argument('--client-ca', dest='client_ca_file', default=None,
+                            help='PEM file with CA certificates used to verify client certificates.')
+
+    def handle(self, *args, **options):
+        emulator = ServiceManagementEmulator(
+            subscription_id=options['subscription_id'],
+            latency=options['latency'],
+            operation_duration=options['operation_duration'],
+            throttle_rate=options['throttle_rate'],
+            failure_rate=options['failure_rate'],
+            operation_failure_rate=options['operation_failure_rate'],
+            images_count=options['images'],
+            seed=options['seed'])
+        emulator.populate(options['cloud_services'], options['vms'])
+
+        server = EmulatorServer(
+            (options['host'], options['port']), emulator, options['certfile'], options['client_ca_file'])
+        self.stdout.write('Azure Service Management emulator is listening on %s' % server.url)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,88 @@
+from __future__ import unicode_literals
+
+import collections
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .throttling import THROTTLING_STATUSES
+
+
+# upper bounds of latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+# segments of Service Management paths which are not resource names
+PATH_KEYWORDS = {
+    'services', 'hostedservices', 'deployments', 'deploymentslots', 'roleinstances', 'roles', 'Roles',
+    'Operations', 'operations', 'storageservices', 'images', 'vmimages', 'disks', 'certificates',
+    'isavailable', 'production', 'staging', 'Production', 'Staging',
+}
+
+
+def get_path_template(path):
+    """
+    Replace subscription ID and resource names in request path with placeholders
+    so that calls to different resources are aggregated together.
+    """
+    path = path.split('?', 1)[0]
+    segments = path.strip('/').split('/')
+    template = ['{subscription_id}'] + [
+        segment if segment in PATH_KEYWORDS else '{name}' for segment in segments[1:]]
+    return '/' + '/'.join(template)
+
+
+class MetricsSink(object):
+    """
+    Receiver of Service Management call measurements.
+    """
+
+    def observe_request(self, subscription_id, method, path, status, size, latency):
+        raise NotImplementedError()
+
+
+class InMemoryMetricsSink(MetricsSink):
+    """
+    Keep Prometheus-style counters and latency histograms in process memory.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = collections.Counter()
+            self.bytes = collections.Counter()
+            self.throttled = collections.Counter()
+            self.latency_buckets = collections.defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+            self.latency_sum = collections.Counter()
+
+    def observe_request(self, subscription_id, method, path, status, size, latency):
+        call = (subscription_id, method, path)
+        with self.lock:
+            self.requests[call + (status,)] += 1
+            self.bytes[call] += size
+            self.latency_sum[call] += latency
+            buckets = self.latency_buckets[call]
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    buckets[index] += 1
+            if status in THROTTLING_STATUSES:
+                self.throttled[call] += 1
+
+    def get_latency_count(self, subscription_id, method, path):
+        return self.latency_buckets[(subscription_id, method, path)][-1]
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_metrics_sink():
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = import_string(settings.WALDUR_AZURE['METRICS_SINK'])()
+    return _sink
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2018-07-20 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def connect_images_to_settings(apps, schema_editor):
+    # Images used to be shared by all Azure service settings, so every settings get their own copy.
+    # Existing rows are kept for the first settings, so that their UUIDs remain valid.
+    # Images are not referenced by foreign keys of other models.
+    Image = apps.get_model('waldur_azure', 'Image')
+    ServiceSettings = apps.get_model('structure', 'ServiceSettings')
+
+    settings_list = list(ServiceSettings.objects.filter(type='Azure').order_by('pk'))
+    if not settings_list:
+        # there are no settings to pull images again from
+        Image.objects.all().delete()
+        return
+
+    first_settings, other_settings = settings_list[0], settings_list[1:]
+    images = list(Image.objects.all())
+    Image.objects.all().update(settings=first_settings)
+    Image.objects.bulk_create([
+        Image(settings=settings, backend_id=image.backend_id, name=image.name)
+        for settings in other_settings for image in images
+    ])
+
+    if schema_editor.connection.vendor == 'postgresql':
+        # pending checks of deferred foreign keys prevent further alteration of the table
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('structure', '0052_customer_subnets'),
+        ('waldur_azure', '0002_immutable_default_json'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='settings',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='structure.ServiceSettings'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='backend_id',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.RunPython(connect_images_to_settings, reverse_code=migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='image',
+            name='settings',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='structure.ServiceSettings'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='image',
+            unique_together=set([('settings', 'backend_id')]),
+        ),
+    ]
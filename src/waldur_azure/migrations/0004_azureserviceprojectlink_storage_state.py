@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2018-07-23 09:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waldur_azure', '0003_image_settings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='azureserviceprojectlink',
+            name='storage_state',
+            field=models.CharField(blank=True, choices=[('creating', 'Creating'), ('created', 'Created'), ('erred', 'Erred')], max_length=30),
+        ),
+    ]
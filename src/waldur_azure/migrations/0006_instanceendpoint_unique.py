@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2018-07-25 08:31
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def delete_duplicate_endpoints(apps, schema_editor):
+    InstanceEndpoint = apps.get_model('waldur_azure', 'InstanceEndpoint')
+    seen = set()
+    duplicates = []
+    for endpoint in InstanceEndpoint.objects.order_by('pk').iterator():
+        key = (endpoint.instance_id, endpoint.name, endpoint.protocol, endpoint.public_port)
+        if key in seen:
+            duplicates.append(endpoint.pk)
+        else:
+            seen.add(key)
+    InstanceEndpoint.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waldur_azure', '0005_operation'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_endpoints, reverse_code=migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='instanceendpoint',
+            unique_together=set([('instance', 'name', 'protocol', 'public_port')]),
+        ),
+    ]
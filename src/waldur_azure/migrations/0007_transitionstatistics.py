@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2018-07-26 09:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waldur_azure', '0006_instanceendpoint_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransitionStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transition', models.CharField(choices=[('create', 'Create'), ('start', 'Start'), ('stop', 'Stop'), ('restart', 'Restart')], max_length=30)),
+                ('image_name', models.CharField(blank=True, max_length=150)),
+                ('cores', models.PositiveSmallIntegerField(default=0)),
+                ('ram', models.PositiveIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('average', models.FloatField(default=0, help_text='Seconds')),
+            ],
+            options={
+                'verbose_name_plural': 'transition statistics',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='transitionstatistics',
+            unique_together=set([('transition', 'image_name', 'cores', 'ram')]),
+        ),
+    ]
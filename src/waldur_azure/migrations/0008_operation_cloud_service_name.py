@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2018-08-02 11:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waldur_azure', '0007_transitionstatistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='operation',
+            name='cloud_service_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
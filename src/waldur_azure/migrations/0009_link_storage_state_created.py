@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2018-08-06 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def mark_synced_link_storage_created(apps, schema_editor):
+    # links synchronized before storage state was tracked waited until storage account was created
+    AzureServiceProjectLink = apps.get_model('waldur_azure', 'AzureServiceProjectLink')
+    AzureServiceProjectLink.objects.filter(storage_state='').exclude(cloud_service_name='').update(
+        storage_state='created')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('waldur_azure', '0008_operation_cloud_service_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_synced_link_storage_created, reverse_code=migrations.RunPython.noop),
+    ]
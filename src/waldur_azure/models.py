@@ -2,7 +2,9 @@ from __future__ import unicode_literals
 
 from django.core.validators import MaxValueValidator
 from django.db import models
+from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
+from model_utils.models import TimeStampedModel
 
 from waldur_core.core import models as core_models
 from waldur_core.core.fields import JSONField
@@ -35,9 +37,22 @@ class AzureService(structure_models.Service):
 
 
 class AzureServiceProjectLink(structure_models.ServiceProjectLink):
+
+    class StorageStates(object):
+        CREATING = 'creating'
+        CREATED = 'created'
+        ERRED = 'erred'
+
+        CHOICES = (
+            (CREATING, 'Creating'),
+            (CREATED, 'Created'),
+            (ERRED, 'Erred'),
+        )
+
     service = models.ForeignKey(AzureService)
 
     cloud_service_name = models.CharField(max_length=255, blank=True)
+    storage_state = models.CharField(max_length=30, blank=True, choices=StorageStates.CHOICES)
 
     def get_backend(self):
         return super(AzureServiceProjectLink, self).get_backend(
@@ -48,7 +63,7 @@ class AzureServiceProjectLink(structure_models.ServiceProjectLink):
         return 'azure-spl'
 
 
-class Image(structure_models.GeneralServiceProperty):
+class Image(structure_models.ServiceProperty):
     @classmethod
     def get_url_name(cls):
         return 'azure-image'
@@ -88,6 +103,9 @@ class InstanceEndpoint(core_models.BackendModelMixin, models.Model):
     name = models.CharField(max_length=255, blank=True, choices=Name.CHOICES)
     instance = models.ForeignKey('VirtualMachine', related_name='endpoints', on_delete=models.PROTECT)
 
+    class Meta(object):
+        unique_together = ('instance', 'name', 'protocol', 'public_port')
+
     @classmethod
     def get_backend_fields(cls):
         return super(InstanceEndpoint, cls).get_backend_fields() + (
@@ -121,3 +139,70 @@ class VirtualMachine(structure_models.VirtualMachine):
     @classmethod
     def get_backend_fields(cls):
         return super(VirtualMachine, cls).get_backend_fields() + ('public_ips', 'private_ips', 'endpoints')
+
+
+@python_2_unicode_compatible
+class Operation(core_models.ErrorMessageMixin, TimeStampedModel):
+    """
+    Asynchronous Service Management operation identified by x-ms-request-id.
+    Its status is pulled by periodic task so that workers are not blocked.
+    """
+
+    class States(object):
+        IN_PROGRESS = 'InProgress'
+        SUCCEEDED = 'Succeeded'
+        FAILED = 'Failed'
+
+        CHOICES = (
+            (IN_PROGRESS, 'In progress'),
+            (SUCCEEDED, 'Succeeded'),
+            (FAILED, 'Failed'),
+        )
+
+    settings = models.ForeignKey(structure_models.ServiceSettings, related_name='+', on_delete=models.CASCADE)
+    request_id = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255)
+    cloud_service_name = models.CharField(max_length=255, blank=True)
+    virtual_machine = models.ForeignKey(
+        VirtualMachine, related_name='operations', null=True, blank=True, on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=30, choices=States.CHOICES, default=States.IN_PROGRESS, db_index=True)
+
+    def __str__(self):
+        return '%s (%s)' % (self.name, self.request_id)
+
+
+@python_2_unicode_compatible
+class TransitionStatistics(models.Model):
+    """
+    Exponentially weighted average of time virtual machines of the same
+    image and size spend in transition. Polling of their state is scheduled
+    using it. Blank image and zero size aggregate all virtual machines.
+    """
+
+    class Transitions(object):
+        CREATE = 'create'
+        START = 'start'
+        STOP = 'stop'
+        RESTART = 'restart'
+
+        CHOICES = (
+            (CREATE, 'Create'),
+            (START, 'Start'),
+            (STOP, 'Stop'),
+            (RESTART, 'Restart'),
+        )
+
+    transition = models.CharField(max_length=30, choices=Transitions.CHOICES)
+    image_name = models.CharField(max_length=150, blank=True)
+    cores = models.PositiveSmallIntegerField(default=0)
+    ram = models.PositiveIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    average = models.FloatField(default=0, help_text=_('Seconds'))
+
+    class Meta(object):
+        unique_together = ('transition', 'image_name', 'cores', 'ram')
+        verbose_name_plural = 'transition statistics'
+
+    def __str__(self):
+        return '%s %s (%s cores, %s MiB)' % (self.transition, self.image_name or '*', self.cores, self.ram)
@@ -0,0 +1,118 @@
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import models
+
+
+Transitions = models.TransitionStatistics.Transitions
+
+# transitions of virtual machines caused by operations of backend methods
+OPERATION_TRANSITIONS = {
+    'start_vm': Transitions.START,
+    'start_vms': Transitions.START,
+    'stop_vm': Transitions.STOP,
+    'stop_vms': Transitions.STOP,
+    'reboot_vm': Transitions.RESTART,
+}
+
+# weight of the latest completion time in moving average
+SMOOTHING = 0.2
+# number of completions after which average is trusted
+MIN_SAMPLES = 3
+# share of expected completion time to wait before the first check
+FIRST_CHECK_SHARE = 0.8
+# share of expected completion time to wait between subsequent checks
+INTERVAL_SHARE = 0.1
+
+
+class PollingSchedule(object):
+    """
+    Delays between checks of virtual machine transition.
+
+    Without history the first check and interval are taken from POLLING settings.
+    Otherwise the first check is done shortly before transition is expected
+    to be completed. Interval grows exponentially up to max_interval and
+    checks stop at deadline.
+    """
+
+    def __init__(self, transition, expected_duration=None):
+        options = settings.WALDUR_AZURE['POLLING'][transition]
+        self.factor = options['factor']
+        self.max_interval = options['max_interval']
+        self.deadline = options['deadline']
+        if expected_duration:
+            self.first_check = FIRST_CHECK_SHARE * expected_duration
+            self.interval = min(max(INTERVAL_SHARE * expected_duration, options['interval']), self.max_interval)
+        else:
+            self.first_check = options['first_check']
+            self.interval = options['interval']
+
+    def get_delay(self, attempt, elapsed=0):
+        """
+        Return seconds to wait before check number attempt, counting from zero,
+        or None if transition has not been completed before deadline.
+        """
+        remaining = self.deadline - elapsed
+        if remaining <= 0:
+            return None
+        if attempt == 0:
+            delay = self.first_check
+        else:
+            delay = min(self.interval * self.factor ** (attempt - 1), self.max_interval)
+        return min(delay, remaining)
+
+
+def get_profile(virtual_machine=None):
+    if virtual_machine is None:
+        return {'image_name': '', 'cores': 0, 'ram': 0}
+    return {'image_name': virtual_machine.image_name, 'cores': virtual_machine.cores, 'ram': virtual_machine.ram}
+
+
+def get_profiles(virtual_machine=None):
+    """
+    Profile of virtual machine image and size followed by profile aggregating all virtual machines.
+    """
+    if virtual_machine is None:
+        return [get_profile()]
+    return [get_profile(virtual_machine), get_profile()]
+
+
+def get_expected_duration(transition, virtual_machine=None):
+    """
+    Return average seconds of transition for virtual machines of the same image and size,
+    of all virtual machines if there is not enough history for them or None without history.
+    """
+    statistics = models.TransitionStatistics.objects.filter(transition=transition, count__gte=MIN_SAMPLES)
+    for profile in get_profiles(virtual_machine):
+        average = statistics.filter(**profile).values_list('average', flat=True).first()
+        if average is not None:
+            return average
+
+
+def get_schedule(transition, virtual_machine=None):
+    return PollingSchedule(transition, get_expected_duration(transition, virtual_machine))
+
+
+def get_first_check(transition, virtual_machine=None):
+    return get_schedule(transition, virtual_machine).get_delay(0)
+
+
+def record_duration(transition, virtual_machine, duration):
+    """
+    Add completion time of transition to averages of virtual machine profile and of all virtual machines.
+    """
+    for profile in get_profiles(virtual_machine):
+        statistics = models.TransitionStatistics.objects.filter(transition=transition, **profile)
+        update = dict(count=F('count') + 1, average=F('average') + SMOOTHING * (duration - F('average')))
+        if statistics.update(**update):
+            continue
+        try:
+            with transaction.atomic():
+                models.TransitionStatistics.objects.create(
+                    transition=transition, count=1, average=duration, **profile)
+        except IntegrityError:
+            # statistics has been created by concurrent task
+            statistics.update(**update)
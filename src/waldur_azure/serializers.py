@@ -10,6 +10,7 @@ from rest_framework.reverse import reverse
 
 from waldur_core.core import serializers as core_serializers
 from waldur_core.structure import serializers as structure_serializers
+from waldur_core.structure.managers import filter_queryset_for_user
 
 from . import models
 from .backend import AzureBackendError, SizeQueryset
@@ -25,7 +26,8 @@ class ServiceSerializer(core_serializers.ExtraFieldOptionsMixin,
     SERVICE_ACCOUNT_EXTRA_FIELDS = {
         'location': '',
         'cloud_service_name': '',
-        'images_regex': ''
+        'images_regex': '',
+        'endpoint': '',
     }
 
     location = serializers.ChoiceField(
@@ -56,7 +58,11 @@ class ServiceSerializer(core_serializers.ExtraFieldOptionsMixin,
             },
             'images_regex': {
                 'help_text': _('Regular expression to limit images list')
-            }
+            },
+            'endpoint': {
+                'help_text': _('Service Management API URL, for example of local emulator '
+                               '(default: "https://management.core.windows.net")')
+            },
         }
 
     def validate_certificate(self, value):
@@ -171,14 +177,20 @@ class VirtualMachineSerializer(structure_serializers.BaseResourceSerializer):
             'image_name'
         )
 
+    @staticmethod
+    def eager_load(queryset):
+        queryset = structure_serializers.BaseResourceSerializer.eager_load(queryset)
+        return queryset.prefetch_related('endpoints')
+
     def validate(self, attrs):
         attrs = super(VirtualMachineSerializer, self).validate(attrs)
 
-        if not re.match(r'[a-zA-Z][a-zA-Z0-9-]{0,13}[a-zA-Z0-9]$', attrs['name']):
-            raise serializers.ValidationError(
-                {'name': _("The name can contain only letters, numbers, and hyphens. "
-                           "The name must be shorter than 15 characters and start with "
-                           "a letter and must end with a letter or a number.")})
+        for name in self.get_names(attrs):
+            if not re.match(r'[a-zA-Z][a-zA-Z0-9-]{0,13}[a-zA-Z0-9]$', name):
+                raise serializers.ValidationError(
+                    {'name': _("The name can contain only letters, numbers, and hyphens. "
+                               "The name must be shorter than 15 characters and start with "
+                               "a letter and must end with a letter or a number.")})
 
         # passwords must contain characters from at least three of the following four categories:
         groups = (r'[a-z]', r'[A-Z]', r'[0-9]', r'[^a-zA-Z\d\s:]')
@@ -192,8 +204,21 @@ class VirtualMachineSerializer(structure_serializers.BaseResourceSerializer):
         if re.match(r'Administrator|Admin', attrs['user_username'], re.I):
             raise serializers.ValidationError({'user_username': _('Invalid administrator username.')})
 
+        image = attrs.get('image')
+        spl = attrs.get('service_project_link')
+        if image and spl and image.settings != spl.service.settings:
+            raise serializers.ValidationError({'image': _('Image must belong to the same service settings.')})
+
+        # storage account is created asynchronously by PollLinkStorageTask
+        if spl and spl.storage_state != models.AzureServiceProjectLink.StorageStates.CREATED:
+            raise serializers.ValidationError({
+                'service_project_link': _('Storage account of service project link is not created yet.')})
+
         return attrs
 
+    def get_names(self, attrs):
+        return [attrs['name']]
+
     @transaction.atomic
     def create(self, validated_data):
         image = validated_data['image']
@@ -205,6 +230,66 @@ class VirtualMachineSerializer(structure_serializers.BaseResourceSerializer):
         return super(VirtualMachineSerializer, self).create(validated_data)
 
 
+class VirtualMachineBatchCreateSerializer(VirtualMachineSerializer):
+    """
+    Create several identical virtual machines in the same cloud service.
+    Name is used as template where {index} is replaced with ordinal number
+    of virtual machine starting from 1.
+    """
+    INDEX_PLACEHOLDER = '{index}'
+
+    count = serializers.IntegerField(min_value=1, max_value=100, write_only=True)
+
+    class Meta(VirtualMachineSerializer.Meta):
+        fields = VirtualMachineSerializer.Meta.fields + ('count',)
+
+    def get_names(self, attrs):
+        template = attrs['name']
+        if self.INDEX_PLACEHOLDER not in template:
+            template += '-' + self.INDEX_PLACEHOLDER
+        return [template.replace(self.INDEX_PLACEHOLDER, str(index)) for index in range(1, attrs['count'] + 1)]
+
+    def validate(self, attrs):
+        attrs = super(VirtualMachineBatchCreateSerializer, self).validate(attrs)
+
+        spl = attrs.get('service_project_link')
+        names = self.get_names(attrs)
+        if spl and models.VirtualMachine.objects.filter(service_project_link=spl, name__in=names).exists():
+            raise serializers.ValidationError({'name': _('Virtual machines with such names already exist.')})
+
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        create = super(VirtualMachineBatchCreateSerializer, self).create
+        return [create(dict(validated_data, name=name)) for name in self.get_names(validated_data)]
+
+
+class VirtualMachinesActionSerializer(serializers.Serializer):
+    virtual_machines = serializers.HyperlinkedRelatedField(
+        view_name='azure-virtualmachine-detail',
+        lookup_field='uuid',
+        queryset=models.VirtualMachine.objects.all(),
+        many=True)
+
+    def get_fields(self):
+        fields = super(VirtualMachinesActionSerializer, self).get_fields()
+        try:
+            user = self.context['request'].user
+        except (KeyError, AttributeError):
+            return fields
+
+        # virtual machines of other customers are reported as missing
+        relation = fields['virtual_machines'].child_relation
+        relation.queryset = filter_queryset_for_user(relation.queryset, user)
+        return fields
+
+    def validate_virtual_machines(self, virtual_machines):
+        if not virtual_machines:
+            raise serializers.ValidationError(_('At least one virtual machine should be specified.'))
+        return virtual_machines
+
+
 class VirtualMachineImportSerializer(structure_serializers.BaseResourceImportSerializer):
 
     class Meta(structure_serializers.BaseResourceImportSerializer.Meta):
@@ -0,0 +1,310 @@
+from __future__ import unicode_literals
+
+from datetime import timedelta
+import logging
+import time
+
+from celery import Task as CeleryTask, shared_task
+from django.conf import settings as django_settings
+from django.utils import timezone
+
+from waldur_core.core import tasks as core_tasks, utils as core_utils
+from waldur_core.core.exceptions import RuntimeStateException
+from waldur_core.structure import models as structure_models
+
+from . import models, polling
+from .backend import AzureBackendError, DeploymentBusyError
+
+
+logger = logging.getLogger(__name__)
+
+TRANSITIONAL_STATES = (models.VirtualMachine.States.CREATING, models.VirtualMachine.States.UPDATING)
+
+
+def requeue_deployment_operation(task, error, kwargs):
+    """
+    Repeat task issuing operation on busy cloud service deployment after a short delay
+    so that it is started right after the previous operation is completed.
+    """
+    interval = django_settings.WALDUR_AZURE['DEPLOYMENT_QUEUE_INTERVAL']
+    timeout = django_settings.WALDUR_AZURE['DEPLOYMENT_QUEUE_TIMEOUT']
+    task.retry(exc=error, countdown=interval, kwargs=kwargs, max_retries=timeout // interval)
+
+
+class DeploymentBackendMethodTask(core_tasks.BackendMethodTask):
+    """
+    Call backend method issuing operation on cloud service deployment, waiting in queue
+    while deployment is busy instead of failing with conflict.
+    """
+
+    def execute(self, instance, backend_method, *args, **kwargs):
+        try:
+            return super(DeploymentBackendMethodTask, self).execute(instance, backend_method, *args, **kwargs)
+        except DeploymentBusyError as e:
+            # state transition has been applied already, so it is not repeated
+            requeue_deployment_operation(self, e, kwargs=self.kwargs)
+
+
+class PollRuntimeStateTask(core_tasks.PollRuntimeStateTask):
+    """
+    Wait until runtime state pulled by pull_runtime_states becomes final
+    instead of fetching the whole deployment for every virtual machine.
+
+    If transition is specified, checks follow its polling schedule and
+    completion time is recorded to statistics of the transition.
+    """
+
+    @classmethod
+    def get_description(cls, instance, success_state, *args, **kwargs):
+        return 'Wait until runtime state of instance "%s" becomes "%s"' % (instance, success_state)
+
+    def execute(self, instance, success_state, erred_state, transition=None, started=None):
+        instance.refresh_from_db()
+        if transition and started is None:
+            # the first check is delayed by executor according to the same schedule
+            started = time.time() - polling.get_first_check(transition, instance)
+
+        if instance.runtime_state not in (success_state, erred_state):
+            if not transition:
+                self.retry()
+            schedule = polling.get_schedule(transition, instance)
+            delay = schedule.get_delay(self.request.retries + 1, time.time() - started)
+            if delay is None:
+                raise RuntimeStateException(
+                    '%s (PK: %s) runtime state has not become %s in %s seconds.' % (
+                        instance.__class__.__name__, instance.pk, success_state, schedule.deadline))
+            self.retry(countdown=delay, kwargs=dict(self.request.kwargs, started=started))
+        elif instance.runtime_state == erred_state:
+            raise RuntimeStateException(
+                '%s (PK: %s) runtime state become erred: %s' % (
+                    instance.__class__.__name__, instance.pk, erred_state))
+
+        if transition:
+            polling.record_duration(transition, instance, time.time() - started)
+        return instance
+
+
+class PollOperationTask(core_tasks.Task):
+    """
+    Wait until the latest operation of virtual machine is completed.
+    Operation status is pulled in batch by pull_operations task
+    so that this task only checks database following polling schedule
+    of the virtual machine transition.
+    """
+    max_retries = 720
+    default_retry_delay = 5
+
+    @classmethod
+    def get_description(cls, instance, operation_name, *args, **kwargs):
+        return 'Wait for operation "%s" of instance "%s"' % (operation_name, instance)
+
+    def execute(self, instance, operation_name):
+        operation = instance.operations.filter(name=operation_name).latest('created')
+        if operation.status == models.Operation.States.IN_PROGRESS:
+            retry_operation_polling(self, operation, instance)
+        elif operation.status == models.Operation.States.FAILED:
+            raise AzureBackendError(operation.error_message)
+        return instance
+
+
+def retry_operation_polling(task, operation, virtual_machine=None):
+    """
+    Retry task polling operation in progress after delay given by polling schedule
+    of the transition caused by operation or after default delay for other operations.
+    """
+    transition = polling.OPERATION_TRANSITIONS.get(operation.name)
+    if not transition:
+        task.retry()
+
+    schedule = polling.get_schedule(transition, virtual_machine)
+    elapsed = (timezone.now() - operation.created).total_seconds()
+    delay = schedule.get_delay(task.request.retries + 1, elapsed)
+    if delay is None:
+        raise AzureBackendError('Operation %s has not been completed in %s seconds.' % (
+            operation.name, schedule.deadline))
+    task.retry(countdown=delay)
+
+
+class VirtualMachinesTask(CeleryTask):
+    """
+    Base task for operations applied to several virtual machines at once.
+    """
+
+    def run(self, serialized_virtual_machines, *args, **kwargs):
+        virtual_machines = [core_utils.deserialize_instance(serialized_vm)
+                            for serialized_vm in serialized_virtual_machines]
+        return self.execute(virtual_machines, *args, **kwargs)
+
+    def execute(self, virtual_machines, *args, **kwargs):
+        raise NotImplementedError('%s should implement method `execute`' % self.__class__.__name__)
+
+
+class VirtualMachinesBackendMethodTask(VirtualMachinesTask):
+    """
+    Call backend method with virtual machines of the same cloud service
+    and return request ID of the operation started by it.
+    """
+
+    def execute(self, virtual_machines, backend_method, state_transition=None):
+        if state_transition:
+            transition_task = core_tasks.StateTransitionTask()
+            for virtual_machine in virtual_machines:
+                transition_task.state_transition(virtual_machine, state_transition)
+
+        backend = virtual_machines[0].get_backend()
+        try:
+            operation = getattr(backend, backend_method)(virtual_machines)
+        except DeploymentBusyError as e:
+            requeue_deployment_operation(self, e, kwargs={'backend_method': backend_method})
+        return operation.request_id
+
+
+class ErrorVirtualMachinesTask(VirtualMachinesTask):
+    """
+    Set erred virtual machines which were not processed by failed chain.
+
+    This task should not be called as immutable, because it expects result_uuid
+    as input argument.
+    """
+
+    def run(self, result_id, serialized_virtual_machines):
+        self.result = self.AsyncResult(result_id)
+        return super(ErrorVirtualMachinesTask, self).run(serialized_virtual_machines)
+
+    def execute(self, virtual_machines):
+        transition_task = core_tasks.StateTransitionTask()
+        for virtual_machine in virtual_machines:
+            if virtual_machine.state == models.VirtualMachine.States.OK:
+                continue
+            virtual_machine.error_message = self.result.result
+            virtual_machine.save(update_fields=['error_message'])
+            transition_task.state_transition(virtual_machine, 'set_erred', action='', action_details={})
+
+
+class PollOperationStatusTask(CeleryTask):
+    """
+    Wait until operation with request ID returned by previous task is completed.
+    """
+    max_retries = 720
+    default_retry_delay = 5
+
+    def run(self, request_id):
+        operation = models.Operation.objects.get(request_id=request_id)
+        if operation.status == models.Operation.States.IN_PROGRESS:
+            retry_operation_polling(self, operation)
+        elif operation.status == models.Operation.States.FAILED:
+            raise AzureBackendError(operation.error_message)
+
+
+class PollVirtualMachinesRuntimeStateTask(VirtualMachinesTask):
+    """
+    Wait until runtime state of all virtual machines becomes final.
+    """
+    max_retries = 300
+    default_retry_delay = 5
+
+    def execute(self, virtual_machines, success_state, erred_state):
+        runtime_states = set(models.VirtualMachine.objects.filter(
+            pk__in=[virtual_machine.pk for virtual_machine in virtual_machines]
+        ).values_list('runtime_state', flat=True))
+
+        if erred_state in runtime_states:
+            raise RuntimeStateException('Runtime state of virtual machines become erred: %s' % erred_state)
+        elif runtime_states != {success_state}:
+            self.retry()
+
+
+class PollLinkStorageTask(core_tasks.Task):
+    """
+    Wait until storage account of service project link is created
+    rescheduling itself instead of blocking worker.
+    """
+    max_retries = 100
+    default_retry_delay = 30
+
+    @classmethod
+    def get_description(cls, service_project_link, *args, **kwargs):
+        return 'Poll storage of service project link "%s"' % service_project_link
+
+    def execute(self, service_project_link):
+        backend = service_project_link.get_backend()
+        backend.pull_link_storage_state(service_project_link)
+        if service_project_link.storage_state == models.AzureServiceProjectLink.StorageStates.CREATING:
+            self.retry()
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        service_project_link = core_utils.deserialize_instance(args[0])
+        service_project_link.storage_state = models.AzureServiceProjectLink.StorageStates.ERRED
+        service_project_link.save(update_fields=['storage_state'])
+
+
+def get_transitional_virtual_machines():
+    return models.VirtualMachine.objects.filter(state__in=TRANSITIONAL_STATES).exclude(backend_id='')
+
+
+@shared_task(name='waldur_azure.pull_runtime_states')
+def pull_runtime_states():
+    cloud_services = get_transitional_virtual_machines().values_list(
+        'service_project_link__service__settings', 'service_project_link__cloud_service_name').distinct()
+    for settings_id, cloud_service_name in cloud_services:
+        pull_cloud_service_runtime_states.delay(settings_id, cloud_service_name)
+
+
+@shared_task(name='waldur_azure.pull_cloud_service_runtime_states')
+def pull_cloud_service_runtime_states(settings_id, cloud_service_name):
+    try:
+        settings = structure_models.ServiceSettings.objects.get(pk=settings_id)
+    except structure_models.ServiceSettings.DoesNotExist:
+        return
+
+    virtual_machines = get_transitional_virtual_machines().filter(
+        service_project_link__service__settings=settings,
+        service_project_link__cloud_service_name=cloud_service_name)
+    backend = settings.get_backend(cloud_service_name=cloud_service_name)
+    try:
+        backend.pull_virtual_machines_runtime_state(virtual_machines)
+    except AzureBackendError as e:
+        logger.warning('Unable to pull runtime state of virtual machines of cloud service %s. Error: %s',
+                       cloud_service_name, e)
+
+
+@shared_task(name='waldur_azure.refresh_image_catalog')
+def refresh_image_catalog(settings_id):
+    try:
+        settings = structure_models.ServiceSettings.objects.get(pk=settings_id)
+    except structure_models.ServiceSettings.DoesNotExist:
+        return
+
+    try:
+        settings.get_backend().refresh_image_catalog()
+    except AzureBackendError as e:
+        logger.warning('Unable to refresh image catalog of service settings %s. Error: %s', settings, e)
+
+
+@shared_task(name='waldur_azure.pull_operations')
+def pull_operations():
+    States = models.Operation.States
+    timeout = timedelta(seconds=django_settings.WALDUR_AZURE['OPERATION_TIMEOUT'])
+    models.Operation.objects.filter(status=States.IN_PROGRESS, created__lt=timezone.now() - timeout).update(
+        status=States.FAILED, error_message='Operation has not been completed in time.')
+
+    settings_ids = models.Operation.objects.filter(status=States.IN_PROGRESS).values_list(
+        'settings', flat=True).distinct()
+    for settings_id in settings_ids:
+        pull_service_settings_operations.delay(settings_id)
+
+
+@shared_task(name='waldur_azure.pull_service_settings_operations')
+def pull_service_settings_operations(settings_id):
+    try:
+        settings = structure_models.ServiceSettings.objects.get(pk=settings_id)
+    except structure_models.ServiceSettings.DoesNotExist:
+        return
+
+    operations = models.Operation.objects.filter(
+        settings=settings, status=models.Operation.States.IN_PROGRESS).select_related('virtual_machine')
+    backend = settings.get_backend()
+    try:
+        backend.pull_operations(operations)
+    except AzureBackendError as e:
+        logger.warning('Unable to pull operations of service settings %s. Error: %s', settings, e)
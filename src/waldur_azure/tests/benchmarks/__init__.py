@@ -0,0 +1,14 @@
+"""
+Offline benchmarks of Azure driver and backend.
+
+Service Management is replaced with canned XML responses replayed at the
+connection layer, so benchmarks do not need network access or credentials.
+Module names do not match the test discovery pattern, so benchmarks are
+run only when requested explicitly:
+
+    waldur test waldur_azure.tests.benchmarks.bench_driver
+    waldur test waldur_azure.tests.benchmarks.bench_backend
+
+Scales are configured with WALDUR_AZURE_BENCHMARK_SCALES environment
+variable, for example WALDUR_AZURE_BENCHMARK_SCALES=10,1000,10000.
+"""
@@ -0,0 +1,33 @@
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import timeit
+
+
+DEFAULT_SCALES = (10, 1000, 10000)
+
+
+def get_scales():
+    scales = os.environ.get('WALDUR_AZURE_BENCHMARK_SCALES')
+    if not scales:
+        return DEFAULT_SCALES
+    return tuple(int(scale) for scale in scales.split(','))
+
+
+class BenchmarkMixin(object):
+    """
+    Measure callable at every scale and report the best of several runs.
+    """
+    repeat = 3
+
+    def measure(self, name, scale, func, setup=None):
+        timings = []
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            timings.append(timeit.timeit(func, number=1))
+        best = min(timings)
+        sys.stderr.write('\n%-60s %8d %10.4f s %12.1f us/object' % (
+            '%s.%s' % (self.__class__.__name__, name), scale, best, best / scale * 10 ** 6))
+        return best
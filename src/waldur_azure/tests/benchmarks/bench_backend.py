@@ -0,0 +1,102 @@
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+import mock
+
+from . import responses
+from .base import BenchmarkMixin, get_scales
+from .. import factories, fixtures
+from ... import models, serializers
+from ...backend import AzureBackend
+
+
+class BackendBenchmark(BenchmarkMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.fixture = fixtures.AzureFixture()
+        self.spl = self.fixture.spl
+        self.spl.cloud_service_name = 'cloud'
+        self.spl.save()
+
+        self.connection = responses.ReplayConnection()
+        self.driver = responses.get_driver(self.connection)
+        patcher = mock.patch.object(AzureBackend, 'manager', new_callable=mock.PropertyMock)
+        patcher.start().return_value = self.driver
+        self.addCleanup(patcher.stop)
+
+        self.backend = self.spl.get_backend()
+
+    def register_cloud_service(self, name, roles_count, offset=0):
+        self.connection.register(
+            responses.get_path('services/hostedservices/%s' % name),
+            responses.hosted_service_xml(name, ['vm-%s' % index for index in range(offset, offset + roles_count)]))
+
+    def create_virtual_machines(self, backend_ids):
+        models.VirtualMachine.objects.all().delete()
+        models.VirtualMachine.objects.bulk_create(
+            factories.VirtualMachineFactory.build(service_project_link=self.spl, backend_id=backend_id)
+            for backend_id in backend_ids)
+
+    def test_pull_images(self):
+        def setup():
+            cache.clear()
+            models.Image.objects.all().delete()
+
+        for scale in get_scales():
+            self.connection.routes = []
+            self.connection.register(responses.get_path('services/images'), responses.images_xml(scale // 2))
+            self.connection.register(responses.get_path('services/vmimages'), responses.vm_images_xml(scale // 2))
+
+            self.measure('pull_images', scale, self.backend.pull_images, setup)
+
+    def test_get_vm(self):
+        for scale in get_scales():
+            self.connection.routes = []
+            self.register_cloud_service('cloud', scale)
+
+            self.measure('get_vm', scale, lambda: self.backend.get_vm('vm-0'),
+                         self.backend.get_node_inventory().invalidate)
+
+    def test_get_managed_resources(self):
+        cloud_services = ['cloud-%s' % index for index in range(10)]
+
+        def setup():
+            for cloud_service in cloud_services:
+                self.backend.get_node_inventory(cloud_service).invalidate()
+
+        for scale in get_scales():
+            roles_count = max(scale // len(cloud_services), 1)
+            self.connection.routes = []
+            self.connection.register(
+                responses.get_path('services/hostedservices'), responses.hosted_services_xml(cloud_services))
+            for index, cloud_service in enumerate(cloud_services):
+                self.register_cloud_service(cloud_service, roles_count, offset=index * roles_count)
+            self.create_virtual_machines(['vm-%s' % index for index in range(scale)])
+
+            self.measure('get_managed_resources', scale, self.backend.get_managed_resources, setup)
+
+    def test_get_resources_for_import(self):
+        for scale in get_scales():
+            self.connection.routes = []
+            self.register_cloud_service('cloud', scale)
+            self.create_virtual_machines(['vm-%s' % index for index in range(0, scale, 2)])
+
+            self.measure('get_resources_for_import', scale, self.backend.get_resources_for_import,
+                         self.backend.get_node_inventory().invalidate)
+
+    def test_virtual_machine_serializer(self):
+        request = Request(APIRequestFactory().get('/'))
+        request.user = self.fixture.staff
+
+        def serialize():
+            queryset = serializers.VirtualMachineSerializer.eager_load(models.VirtualMachine.objects.all())
+            return serializers.VirtualMachineSerializer(queryset, many=True, context={'request': request}).data
+
+        for scale in get_scales():
+            self.create_virtual_machines(['vm-%s' % index for index in range(scale)])
+
+            self.measure('VirtualMachineSerializer', scale, serialize)
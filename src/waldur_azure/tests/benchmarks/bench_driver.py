@@ -0,0 +1,51 @@
+from __future__ import unicode_literals
+
+import unittest
+
+from libcloud.compute.drivers.azure import AzureNodeDriver as _AzureNodeDriver
+
+from . import responses
+from .base import BenchmarkMixin, get_scales
+
+
+class DriverBenchmark(BenchmarkMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.connection = responses.ReplayConnection()
+        self.driver = responses.get_driver(self.connection)
+
+    def test_list_nodes(self):
+        for scale in get_scales():
+            self.connection.routes = []
+            self.connection.register(
+                responses.get_path('services/hostedservices/cloud'),
+                responses.hosted_service_xml('cloud', ['vm-%s' % index for index in range(scale)]))
+
+            self.measure('libcloud list_nodes', scale, lambda: _AzureNodeDriver.list_nodes(self.driver, 'cloud'))
+            self.measure('list_nodes', scale, lambda: self.driver.list_nodes('cloud'))
+            self.measure('ex_list_role_instances', scale, lambda: self.driver.ex_list_role_instances('cloud'))
+
+    def test_list_images(self):
+        for scale in get_scales():
+            self.connection.routes = []
+            self.connection.register(responses.get_path('services/images'), responses.images_xml(scale))
+            self.connection.register(responses.get_path('services/vmimages'), responses.vm_images_xml(scale))
+
+            self.measure('list_images', scale, self.driver.list_images)
+
+    def test_list_storage_services(self):
+        for scale in get_scales():
+            self.connection.routes = []
+            self.connection.register(
+                responses.get_path('services/storageservices'), responses.storage_services_xml(scale))
+
+            self.measure('ex_list_storage_services', scale, self.driver.ex_list_storage_services)
+
+    def test_get_operation_status(self):
+        self.connection.register(responses.get_path('operations/') + '.*', responses.operation_xml('request'))
+        for scale in get_scales():
+            def get_statuses():
+                for index in range(scale):
+                    self.driver._get_operation_status('request-%s' % index)
+
+            self.measure('_get_operation_status', scale, get_statuses)
@@ -0,0 +1,126 @@
+from __future__ import unicode_literals
+
+import re
+
+from libcloud.utils.py3 import httplib
+
+from ...driver import AZURE_NAMESPACE, AzureNodeDriver
+
+
+SUBSCRIPTION_ID = 'subscription'
+
+
+def document(tag, items):
+    return '<%s xmlns="%s">%s</%s>' % (tag, AZURE_NAMESPACE, ''.join(items), tag)
+
+
+def role_instance_xml(name):
+    return (
+        '<RoleInstance><RoleName>{0}</RoleName><InstanceName>{0}</InstanceName>'
+        '<InstanceStatus>ReadyRole</InstanceStatus><InstanceSize>Small</InstanceSize>'
+        '<IpAddress>10.0.0.4</IpAddress><PowerState>Started</PowerState>'
+        '<InstanceEndpoints>'
+        '<InstanceEndpoint><Name>SSH</Name><Vip>1.2.3.4</Vip><PublicPort>22</PublicPort>'
+        '<LocalPort>22</LocalPort><Protocol>tcp</Protocol></InstanceEndpoint>'
+        '<InstanceEndpoint><Name>Remote Desktop</Name><Vip>1.2.3.4</Vip><PublicPort>3389</PublicPort>'
+        '<LocalPort>3389</LocalPort><Protocol>tcp</Protocol></InstanceEndpoint>'
+        '</InstanceEndpoints></RoleInstance>'
+    ).format(name)
+
+
+def hosted_service_xml(name, role_names):
+    return (
+        '<HostedService xmlns="%s"><ServiceName>%s</ServiceName>'
+        '<Deployments><Deployment><Name>%s</Name><DeploymentSlot>Production</DeploymentSlot>'
+        '<Status>Running</Status><RoleInstanceList>%s</RoleInstanceList>'
+        '<VirtualIPs><VirtualIP><Address>1.2.3.4</Address></VirtualIP></VirtualIPs>'
+        '</Deployment></Deployments></HostedService>'
+    ) % (AZURE_NAMESPACE, name, name, ''.join(role_instance_xml(role_name) for role_name in role_names))
+
+
+def hosted_services_xml(names):
+    return document('HostedServices', [
+        '<HostedService><ServiceName>%s</ServiceName>'
+        '<HostedServiceProperties><Location>Central US</Location></HostedServiceProperties>'
+        '</HostedService>' % name
+        for name in names
+    ])
+
+
+def images_xml(count):
+    return document('Images', [
+        '<OSImage><Name>image-id-%s</Name><Label>Image %s</Label><OS>Linux</OS>'
+        '<Category>Public</Category><Location>Central US;East US 2</Location>'
+        '<LogicalSizeInGB>30</LogicalSizeInGB></OSImage>' % (index, index)
+        for index in range(count)
+    ])
+
+
+def vm_images_xml(count):
+    return document('VMImages', [
+        '<VMImage><Name>vm-image-id-%s</Name><Label>VM Image %s</Label>'
+        '<Category>User</Category><Location>Central US</Location>'
+        '<OSDiskConfiguration><OS>Windows</OS></OSDiskConfiguration></VMImage>' % (index, index)
+        for index in range(count)
+    ])
+
+
+def storage_services_xml(count):
+    return document('StorageServices', [
+        '<StorageService><Url>https://example.com/storage-%s</Url><ServiceName>storage%s</ServiceName>'
+        '<StorageServiceProperties><Location>Central US</Location><Status>Created</Status>'
+        '</StorageServiceProperties></StorageService>' % (index, index)
+        for index in range(count)
+    ])
+
+
+def operation_xml(request_id, status='Succeeded', error_message=None):
+    # HTTP status code of operation is not its status, libcloud used to confuse them
+    error = ''
+    if error_message:
+        error = '<Error><Code>ConflictError</Code><Message>%s</Message></Error>' % error_message
+    return (
+        '<Operation xmlns="%s"><ID>%s</ID><Status>%s</Status><HttpStatusCode>200</HttpStatusCode>%s</Operation>'
+    ) % (AZURE_NAMESPACE, request_id, status, error)
+
+
+class CannedResponse(object):
+
+    def __init__(self, body, status=httplib.OK, headers=None):
+        self.body = body
+        self.status = status
+        self.headers = headers or {}
+        self.error = httplib.responses.get(status)
+
+
+class ReplayConnection(object):
+    """
+    Service Management connection replaying canned responses matched by request path without query.
+    """
+
+    def __init__(self):
+        self.routes = []
+        self.requests_count = 0
+        self.driver = None
+
+    def register(self, path_regex, body, status=httplib.OK, headers=None):
+        self.routes.append((re.compile(path_regex + '$'), CannedResponse(body, status, headers)))
+
+    def request(self, action, data=None, headers=None, method='GET'):
+        self.requests_count += 1
+        for path_regex, response in self.routes:
+            if path_regex.match(action.split('?', 1)[0]):
+                return response
+        raise AssertionError('Unexpected request: %s %s' % (method, action))
+
+
+def get_driver(connection):
+    driver = AzureNodeDriver.__new__(AzureNodeDriver)
+    driver.subscription_id = SUBSCRIPTION_ID
+    driver.connection = connection
+    connection.driver = driver
+    return driver
+
+
+def get_path(resource):
+    return re.escape('/%s/%s' % (SUBSCRIPTION_ID, resource))
@@ -42,6 +42,7 @@ class AzureServiceProjectLinkFactory(factory.DjangoModelFactory):
 
     service = factory.SubFactory(AzureServiceFactory)
     project = factory.SubFactory(structure_factories.ProjectFactory)
+    storage_state = models.AzureServiceProjectLink.StorageStates.CREATED
 
     @classmethod
     def get_url(cls, spl=None, action=None):
@@ -78,7 +79,11 @@ class VirtualMachineFactory(factory.DjangoModelFactory):
 
     @classmethod
     def get_list_url(cls):
-        return 'http://testserver' + reverse('aws-virtualmachine-list')
+        return 'http://testserver' + reverse('azure-virtualmachine-list')
+
+    @classmethod
+    def get_list_action_url(cls, action):
+        return cls.get_list_url() + action + '/'
 
 
 class InstanceEndpoint(factory.DjangoModelFactory):
@@ -90,3 +95,18 @@ class InstanceEndpoint(factory.DjangoModelFactory):
     local_port = factory.fuzzy.FuzzyInteger(1000, 65535)
     public_port = factory.fuzzy.FuzzyInteger(1000, 65535)
     instance = factory.SubFactory(VirtualMachineFactory)
+
+
+class ImageFactory(factory.DjangoModelFactory):
+    class Meta(object):
+        model = models.Image
+
+    name = factory.Sequence(lambda n: 'image%s' % n)
+    backend_id = factory.Sequence(lambda n: 'image-id%s' % n)
+    settings = factory.SubFactory(AzureServiceSettingsFactory)
+
+    @classmethod
+    def get_url(cls, image=None):
+        if image is None:
+            image = ImageFactory()
+        return 'http://testserver' + reverse('azure-image-detail', kwargs={'uuid': image.uuid})
@@ -0,0 +1,523 @@
+import itertools
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models.signals import post_save
+from django.test import TestCase
+from libcloud.common.types import LibcloudError
+from libcloud.compute.base import NodeImage, NodeSize
+from libcloud.compute.types import NodeState
+from libcloud.utils.py3 import httplib
+import mock
+
+from . import factories, fixtures
+from .. import models
+from ..backend import AzureBackend, AzureBackendError, DeploymentBusyError, get_fan_out_pool
+from ..cache import DeploymentLease
+from ..driver import AzureNodeDriver, Endpoint
+from .benchmarks import responses
+
+
+class BaseBackendTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.fixture = fixtures.AzureFixture()
+        self.spl = self.fixture.spl
+        self.spl.cloud_service_name = 'cloud'
+        self.spl.save()
+
+        self.manager = mock.Mock()
+        self.manager.ex_get_size.return_value = NodeSize(
+            'Small', 'Small Instance', 1792, 70, None, '0.051', None, extra={'cores': 1})
+        patcher = mock.patch.object(AzureBackend, 'manager', new_callable=mock.PropertyMock)
+        patcher.start().return_value = self.manager
+        self.addCleanup(patcher.stop)
+
+        request_ids = itertools.count(1)
+        self.manager._parse_response_for_async_op.side_effect = lambda response: mock.Mock(
+            request_id='request-%s' % next(request_ids))
+
+        # operation status is parsed by driver from Service Management response
+        driver = AzureNodeDriver.__new__(AzureNodeDriver)
+        driver.subscription_id = responses.SUBSCRIPTION_ID
+        driver._perform_get = mock.Mock(side_effect=lambda path, response_type: mock.Mock(
+            status=httplib.OK, body=responses.operation_xml(path.rsplit('/', 1)[1], *self.operation_status)))
+        self.manager._get_operation_status.side_effect = driver._get_operation_status
+        self.set_operation_status('Succeeded')
+
+        self.backend = self.spl.get_backend()
+
+    def set_operation_status(self, status, error_message=None):
+        self.operation_status = (status, error_message)
+
+    def get_role_instance(self, role_name, state=NodeState.RUNNING):
+        return {
+            'id': role_name,
+            'name': role_name,
+            'state': state,
+            'public_ips': ['10.0.0.1'],
+            'private_ips': ['192.168.0.1'],
+            'instance_size': 'Small',
+            'instance_endpoints': [],
+            'power_state': 'Started',
+            'ex_cloud_service_name': 'cloud',
+        }
+
+
+class NodeInventoryTest(BaseBackendTest):
+
+    def test_virtual_machines_of_cloud_service_are_fetched_once(self):
+        self.manager.ex_list_role_instances.return_value = [
+            self.get_role_instance('vm-1'), self.get_role_instance('vm-2')]
+
+        self.assertEqual(self.backend.get_vm('vm-1').id, 'vm-1')
+        self.assertEqual(self.backend.get_vm('vm-2').id, 'vm-2')
+
+        self.manager.ex_list_role_instances.assert_called_once_with('cloud')
+
+    def test_missing_virtual_machine_raises_backend_error(self):
+        self.manager.ex_list_role_instances.return_value = [self.get_role_instance('vm-1')]
+
+        self.assertRaises(AzureBackendError, self.backend.get_vm, 'vm-2')
+
+    def test_inventory_is_invalidated_after_virtual_machine_is_destroyed(self):
+        self.manager.ex_list_role_instances.return_value = [self.get_role_instance('vm-1')]
+        vm = self.fixture.virtual_machine
+        vm.backend_id = 'vm-1'
+
+        self.backend.destroy_vm(vm)
+        self.manager.ex_list_role_instances.return_value = []
+
+        self.assertRaises(AzureBackendError, self.backend.get_vm, 'vm-1')
+
+
+class SingleFlightTest(BaseBackendTest):
+
+    def setUp(self):
+        super(SingleFlightTest, self).setUp()
+        self.manager.ex_list_cloud_services.return_value = [mock.Mock(service_name='cloud')]
+        self.flight = self.backend.get_cloud_service_list()
+        # another worker is loading cloud services
+        cache.add(self.flight.lock_key, True)
+
+    def test_caller_reuses_result_published_by_concurrent_caller(self):
+        with mock.patch('waldur_azure.cache.time.sleep', side_effect=lambda _: self.flight.publish(['other'])):
+            self.assertEqual(self.backend.list_cloud_services(), ['other'])
+
+        self.assertFalse(self.manager.ex_list_cloud_services.called)
+
+    def test_caller_loads_result_itself_if_concurrent_caller_has_failed(self):
+        with mock.patch('waldur_azure.cache.time.sleep', side_effect=lambda _: cache.delete(self.flight.lock_key)):
+            self.assertEqual(self.backend.list_cloud_services(), ['cloud'])
+
+        self.assertFalse(cache.get(self.flight.lock_key))
+
+    def test_caller_loads_result_itself_if_it_is_not_published_in_time(self):
+        with mock.patch('waldur_azure.cache.time.time', side_effect=itertools.count(step=60)):
+            self.assertEqual(self.backend.list_cloud_services(), ['cloud'])
+
+    def test_result_is_not_shared_after_invalidation(self):
+        self.flight.publish(['other'])
+        self.flight.invalidate()
+        cache.delete(self.flight.lock_key)
+
+        self.assertEqual(self.backend.list_cloud_services(), ['cloud'])
+
+
+class ImageCatalogTest(BaseBackendTest):
+
+    def setUp(self):
+        super(ImageCatalogTest, self).setUp()
+        self.manager.ex_iter_images.side_effect = lambda name_regex=None: iter([
+            NodeImage('image-1', 'Ubuntu', self.manager, extra={'vm_image': False}),
+            NodeImage('image-2', 'Windows', self.manager, extra={'vm_image': False}),
+        ])
+
+    def test_images_are_fetched_once_for_provisioning_burst(self):
+        self.assertEqual(self.backend.get_image('image-1').name, 'Ubuntu')
+        self.assertEqual(self.backend.get_image('image-2').name, 'Windows')
+
+        self.assertEqual(self.manager.ex_iter_images.call_count, 1)
+
+    def test_missing_image_raises_backend_error(self):
+        self.assertRaises(AzureBackendError, self.backend.get_image, 'image-3')
+
+    @mock.patch('waldur_azure.tasks.refresh_image_catalog')
+    def test_stale_catalog_is_served_while_it_is_refreshed_in_background(self, refresh_mock):
+        self.backend.get_image('image-1')
+
+        with mock.patch('waldur_azure.cache.time.time', return_value=time.time() + 24 * 60 * 60):
+            self.assertEqual(self.backend.get_image('image-1').name, 'Ubuntu')
+            self.backend.get_image('image-2')
+
+        self.assertEqual(self.manager.ex_iter_images.call_count, 1)
+        refresh_mock.delay.assert_called_once_with(self.spl.service.settings.pk)
+
+        self.backend.refresh_image_catalog()
+        self.assertEqual(self.manager.ex_iter_images.call_count, 2)
+
+    def test_only_fields_used_for_provisioning_are_cached(self):
+        self.backend.get_image('image-1')
+
+        image = self.backend.get_image_catalog().get(None, None)['by_id']['image-1']
+        self.assertEqual(image, {'id': 'image-1', 'name': 'Ubuntu', 'vm_image': False})
+
+
+class ImagesSynchronizationTest(BaseBackendTest):
+
+    def setUp(self):
+        super(ImagesSynchronizationTest, self).setUp()
+        self.settings = self.fixture.service.settings
+
+    def set_backend_images(self, *images):
+        images = [NodeImage(image_id, name, self.manager, extra={}) for image_id, name in images]
+        self.manager.ex_iter_images.side_effect = lambda name_regex=None: iter([
+            image for image in images if not name_regex or name_regex.match(image.name)])
+
+    def test_new_images_are_created(self):
+        self.set_backend_images(('image-1', 'Ubuntu'), ('image-2', 'Windows'))
+
+        self.backend.pull_images()
+
+        images = models.Image.objects.filter(settings=self.settings)
+        self.assertEqual(set(images.values_list('backend_id', 'name')),
+                         {('image-1', 'Ubuntu'), ('image-2', 'Windows')})
+
+    def test_stale_images_are_deleted_and_renamed_images_are_updated(self):
+        models.Image.objects.create(settings=self.settings, backend_id='image-1', name='Old Ubuntu')
+        models.Image.objects.create(settings=self.settings, backend_id='image-2', name='Windows')
+        self.set_backend_images(('image-1', 'Ubuntu'))
+
+        self.backend.pull_images()
+
+        images = models.Image.objects.filter(settings=self.settings)
+        self.assertEqual(list(images.values_list('backend_id', 'name')), [('image-1', 'Ubuntu')])
+
+    def test_images_of_other_settings_are_not_touched(self):
+        other_settings = factories.AzureServiceSettingsFactory()
+        models.Image.objects.create(settings=other_settings, backend_id='image-1', name='Ubuntu')
+        self.set_backend_images(('image-2', 'Windows'))
+
+        self.backend.pull_images()
+
+        self.assertTrue(models.Image.objects.filter(settings=other_settings, backend_id='image-1').exists())
+
+    def test_images_are_filtered_by_regex(self):
+        self.settings.options = {'images_regex': 'Ubuntu'}
+        self.settings.save()
+        self.set_backend_images(('image-1', 'Ubuntu'), ('image-2', 'Windows'))
+
+        self.backend.pull_images()
+
+        self.assertEqual(list(models.Image.objects.filter(settings=self.settings).values_list('backend_id', flat=True)),
+                         ['image-1'])
+
+
+class EndpointReconciliationTest(BaseBackendTest):
+
+    def setUp(self):
+        super(EndpointReconciliationTest, self).setUp()
+        self.vm = factories.VirtualMachineFactory(service_project_link=self.spl, backend_id='vm-1')
+
+    def pull_vm_info(self, *endpoints):
+        role_instance = self.get_role_instance('vm-1')
+        role_instance['instance_endpoints'] = list(endpoints)
+        self.manager.ex_list_role_instances.return_value = [role_instance]
+        self.backend.get_node_inventory().invalidate()
+        self.backend.pull_vm_info(self.vm)
+
+    def test_repeated_pull_does_not_duplicate_endpoints(self):
+        rdp = Endpoint('Remote Desktop', 'tcp', '3389', '50001', '10.0.0.1')
+        self.pull_vm_info(rdp)
+        self.pull_vm_info(rdp)
+
+        self.assertEqual(self.vm.endpoints.count(), 1)
+
+    def test_only_differences_are_written(self):
+        rdp = Endpoint('Remote Desktop', 'tcp', '3389', '50001', '10.0.0.1')
+        ssh = Endpoint('SSH', 'tcp', '22', '50002', '10.0.0.1')
+        self.pull_vm_info(rdp, ssh)
+        rdp_endpoint = self.vm.endpoints.get(name='Remote Desktop')
+
+        self.pull_vm_info(rdp._replace(local_port='3390'))
+
+        self.assertEqual(list(self.vm.endpoints.values_list('pk', 'local_port')), [(rdp_endpoint.pk, 3390)])
+
+    @mock.patch('waldur_azure.backend.transaction')
+    def test_transaction_is_opened_after_virtual_machine_is_fetched(self, transaction_mock):
+        atomic = transaction_mock.atomic.return_value
+
+        def list_role_instances(cloud_service_name):
+            self.assertFalse(atomic.__enter__.called)
+            return [self.get_role_instance('vm-1')]
+
+        self.manager.ex_list_role_instances.side_effect = list_role_instances
+        self.backend.pull_vm_info(self.vm)
+
+        self.assertTrue(atomic.__enter__.called)
+
+
+class RuntimeStatePullTest(BaseBackendTest):
+
+    def test_runtime_state_of_all_virtual_machines_is_pulled_with_single_request(self):
+        vm1 = factories.VirtualMachineFactory(
+            service_project_link=self.spl, backend_id='vm-1', runtime_state=NodeState.PENDING)
+        vm2 = factories.VirtualMachineFactory(
+            service_project_link=self.spl, backend_id='vm-2', runtime_state=NodeState.PENDING)
+        self.manager.ex_list_role_instances.return_value = [
+            self.get_role_instance('vm-1', NodeState.RUNNING),
+            self.get_role_instance('vm-2', NodeState.STOPPED),
+        ]
+
+        self.backend.pull_virtual_machines_runtime_state(models.VirtualMachine.objects.filter(pk__in=[vm1.pk, vm2.pk]))
+
+        vm1.refresh_from_db()
+        vm2.refresh_from_db()
+        self.assertEqual(vm1.runtime_state, NodeState.RUNNING)
+        self.assertEqual(vm2.runtime_state, NodeState.STOPPED)
+        self.manager.ex_list_role_instances.assert_called_once_with('cloud')
+
+    def test_handlers_are_notified_only_about_changed_runtime_state(self):
+        vm1 = factories.VirtualMachineFactory(
+            service_project_link=self.spl, backend_id='vm-1', runtime_state=NodeState.PENDING)
+        vm2 = factories.VirtualMachineFactory(
+            service_project_link=self.spl, backend_id='vm-2', runtime_state=NodeState.RUNNING)
+        self.manager.ex_list_role_instances.return_value = [
+            self.get_role_instance('vm-1', NodeState.RUNNING),
+            self.get_role_instance('vm-2', NodeState.RUNNING),
+        ]
+        handler = mock.Mock()
+        post_save.connect(handler, sender=models.VirtualMachine, weak=False)
+        self.addCleanup(post_save.disconnect, handler, sender=models.VirtualMachine)
+
+        self.backend.pull_virtual_machines_runtime_state(models.VirtualMachine.objects.filter(pk__in=[vm1.pk, vm2.pk]))
+
+        self.assertEqual([kwargs['instance'].pk for args, kwargs in handler.call_args_list], [vm1.pk])
+
+
+class DriverTest(TestCase):
+
+    @mock.patch('waldur_azure.backend.drivers')
+    def test_driver_is_taken_from_registry_once_per_thread(self, drivers_mock):
+        backend = fixtures.AzureFixture().spl.get_backend()
+
+        self.assertIs(backend.manager, backend.manager)
+        self.assertEqual(drivers_mock.get.call_count, 1)
+
+
+class ManagedResourcesTest(BaseBackendTest):
+
+    def test_concurrent_calls_share_single_deadline(self):
+        with self.settings(WALDUR_AZURE=dict(settings.WALDUR_AZURE, FAN_OUT_TIMEOUT=0.2)):
+            started = time.time()
+            results = self.backend.map_concurrently(lambda item: time.sleep(1), ['cloud-1', 'cloud-2', 'cloud-3'])
+
+        self.assertLess(time.time() - started, 0.5)
+        self.assertTrue(all(isinstance(result, Exception) for item, result in results))
+
+    def test_threads_of_pool_are_reused_by_backends(self):
+        other_backend = AzureBackend(self.spl.service.settings, cloud_service_name='other')
+
+        threads = [result for backend in (self.backend, other_backend)
+                   for item, result in backend.map_concurrently(lambda item: threading.current_thread(), ['cloud'])]
+
+        pool_threads = get_fan_out_pool()._pool
+        self.assertTrue(all(thread in pool_threads for thread in threads))
+
+    def test_virtual_machines_of_available_cloud_services_are_returned_on_partial_failure(self):
+        vm = factories.VirtualMachineFactory(service_project_link=self.spl, backend_id='vm-1')
+        factories.VirtualMachineFactory(backend_id='vm-1')
+        self.manager.ex_list_cloud_services.return_value = [
+            mock.Mock(service_name='cloud'), mock.Mock(service_name='broken')]
+
+        def list_role_instances(cloud_service_name):
+            if cloud_service_name == 'broken':
+                raise LibcloudError('Service is not available')
+            return [self.get_role_instance('vm-1')]
+
+        self.manager.ex_list_role_instances.side_effect = list_role_instances
+
+        self.assertEqual(list(self.backend.get_managed_resources()), [vm])
+
+    def test_empty_queryset_is_returned_if_cloud_services_are_not_available(self):
+        self.manager.ex_list_cloud_services.side_effect = LibcloudError('Service is not available')
+
+        self.assertFalse(self.backend.get_managed_resources().exists())
+
+
+class ResourcesForImportTest(BaseBackendTest):
+
+    def test_only_virtual_machines_missing_in_cloud_service_are_returned_ordered_by_name(self):
+        factories.VirtualMachineFactory(service_project_link=self.spl, backend_id='vm-1')
+        # virtual machine with the same ID in another service settings does not hide the one to import
+        factories.VirtualMachineFactory(backend_id='vm-3')
+        self.manager.ex_list_role_instances.return_value = [
+            self.get_role_instance('vm-3'), self.get_role_instance('vm-1'), self.get_role_instance('vm-2')]
+
+        resources = self.backend.get_resources_for_import()
+
+        self.assertEqual([resource['id'] for resource in resources], ['vm-2', 'vm-3'])
+        self.assertEqual(resources[0]['flavor_name'], 'Small')
+
+    def test_resources_are_paginated_without_building_whole_list(self):
+        self.manager.ex_list_role_instances.return_value = [
+            self.get_role_instance('vm-%s' % index) for index in range(1, 4)]
+
+        page = Paginator(self.backend.get_resources_for_import(), 2).page(2)
+
+        self.assertEqual(page.paginator.count, 3)
+        self.assertEqual([resource['id'] for resource in page.object_list], ['vm-3'])
+
+
+class BaseOperationTest(BaseBackendTest):
+
+    def setUp(self):
+        super(BaseOperationTest, self).setUp()
+        self.vm = factories.VirtualMachineFactory(service_project_link=self.spl, backend_id='vm-1')
+        self.manager._perform_post.return_value = mock.Mock(status=202)
+        deployment = mock.Mock(status='Running', role_instance_list=[mock.Mock(role_name='vm-1')])
+        deployment.name = 'deployment'
+        self.manager._get_deployment.return_value = deployment
+
+
+class OperationTest(BaseOperationTest):
+
+    def test_operation_is_recorded_without_waiting_for_completion(self):
+        self.backend.stop_vm(self.vm)
+
+        operation = models.Operation.objects.get(request_id='request-1')
+        self.assertEqual(operation.virtual_machine, self.vm)
+        self.assertEqual(operation.status, models.Operation.States.IN_PROGRESS)
+        self.assertFalse(self.manager._ex_complete_async_azure_operation.called)
+
+    def test_failed_operation_status_is_pulled(self):
+        self.backend.start_vm(self.vm)
+        self.set_operation_status('Failed', 'Role is busy')
+
+        self.backend.pull_operations(models.Operation.objects.all())
+
+        operation = models.Operation.objects.get(request_id='request-1')
+        self.assertEqual(operation.status, models.Operation.States.FAILED)
+        self.assertEqual(operation.error_message, 'Role is busy')
+
+    def test_failed_batched_operation_is_detected(self):
+        other_vm = factories.VirtualMachineFactory(service_project_link=self.spl, backend_id='vm-2')
+        self.backend.start_vms([self.vm, other_vm])
+        self.set_operation_status('Failed', 'Role vm-2 is busy')
+
+        self.backend.pull_operations(models.Operation.objects.all())
+
+        operation = models.Operation.objects.get(request_id='request-1')
+        self.assertEqual(operation.name, 'start_vms')
+        self.assertEqual(operation.status, models.Operation.States.FAILED)
+        self.assertEqual(operation.error_message, 'Role vm-2 is busy')
+
+    def test_duration_of_succeeded_operation_is_recorded(self):
+        self.backend.stop_vm(self.vm)
+        self.set_operation_status('Succeeded')
+
+        self.backend.pull_operations(models.Operation.objects.all())
+
+        statistics = models.TransitionStatistics.objects.get(
+            transition='stop', image_name=self.vm.image_name, cores=self.vm.cores, ram=self.vm.ram)
+        self.assertEqual(statistics.count, 1)
+
+
+class DeploymentLeaseTest(BaseOperationTest):
+
+    def test_operation_is_rejected_while_previous_one_is_in_progress(self):
+        self.set_operation_status('InProgress')
+        self.backend.stop_vm(self.vm)
+
+        self.assertRaises(DeploymentBusyError, self.backend.start_vm, self.vm)
+        self.assertEqual(models.Operation.objects.count(), 1)
+
+    def test_deployment_stays_busy_while_operation_is_in_progress(self):
+        self.set_operation_status('InProgress')
+        self.backend.stop_vm(self.vm)
+
+        self.assertRaises(DeploymentBusyError, self.backend.destroy_vm, self.vm)
+        operation = models.Operation.objects.get(request_id='request-1')
+        self.assertEqual(operation.status, models.Operation.States.IN_PROGRESS)
+
+        self.set_operation_status('Succeeded')
+        self.backend.destroy_vm(self.vm)
+
+        operation.refresh_from_db()
+        self.assertEqual(operation.status, models.Operation.States.SUCCEEDED)
+
+    @mock.patch.object(AzureBackend, 'get_image')
+    @mock.patch.object(AzureBackend, 'get_size')
+    def test_lease_is_held_until_virtual_machine_is_provisioned(self, get_size_mock, get_image_mock):
+        lease = DeploymentLease(self.spl.service.settings.uuid.hex, 'cloud')
+
+        def create_node(**kwargs):
+            # driver polls operation status inside create_node until role is added
+            self.assertFalse(lease.acquire())
+            return mock.Mock(id='vm-2', state=NodeState.PENDING)
+
+        self.manager.create_node.side_effect = create_node
+        vm = factories.VirtualMachineFactory(service_project_link=self.spl, backend_id='')
+
+        self.backend.provision_vm(vm)
+
+        self.assertEqual(self.manager.create_node.call_count, 1)
+        self.assertTrue(lease.acquire())
+
+    def test_lease_outlives_provisioning_wait_of_driver(self):
+        self.assertGreater(settings.WALDUR_AZURE['DEPLOYMENT_LEASE_TTL'], AzureNodeDriver.ASYNC_OPERATION_TIMEOUT)
+
+    def test_lease_taken_over_by_another_worker_is_not_released(self):
+        lease = DeploymentLease(self.spl.service.settings.uuid.hex, 'cloud')
+        lease.acquire()
+        # lease has expired and has been acquired by another worker
+        cache.delete(lease.key)
+        other_lease = DeploymentLease(self.spl.service.settings.uuid.hex, 'cloud')
+        other_lease.acquire()
+
+        lease.release()
+
+        self.assertEqual(cache.get(lease.key), other_lease.token)
+
+    def test_operation_is_started_as_soon_as_previous_one_is_completed(self):
+        self.backend.stop_vm(self.vm)
+        self.backend.start_vm(self.vm)
+
+        operation = models.Operation.objects.get(request_id='request-1')
+        self.assertEqual(operation.status, models.Operation.States.SUCCEEDED)
+        self.assertTrue(models.Operation.objects.filter(request_id='request-2').exists())
+
+    def test_operations_on_different_deployments_are_not_serialized(self):
+        self.set_operation_status('InProgress')
+        self.backend.stop_vm(self.vm)
+
+        AzureBackend(self.spl.service.settings, cloud_service_name='other').start_vm(self.vm)
+
+        self.assertEqual(models.Operation.objects.count(), 2)
+
+    def test_conflict_response_is_reported_as_busy_deployment(self):
+        error = LibcloudError('ConflictError')
+        error.status = 409
+        self.manager._perform_post.side_effect = error
+
+        self.assertRaises(DeploymentBusyError, self.backend.stop_vm, self.vm)
+
+
+class DeploymentCacheTest(BaseOperationTest):
+
+    def test_deployment_is_fetched_once_for_consecutive_role_operations(self):
+        self.backend.stop_vm(self.vm)
+        self.backend.start_vm(self.vm)
+
+        self.assertEqual(self.manager._get_deployment.call_count, 1)
+
+    def test_deployment_is_fetched_again_after_virtual_machine_is_destroyed(self):
+        self.backend.stop_vm(self.vm)
+        self.backend.destroy_vm(self.vm)
+        self.backend.start_vm(self.vm)
+
+        self.assertEqual(self.manager._get_deployment.call_count, 3)
@@ -1,10 +1,19 @@
 import mock
 import httplib
+import os
+import re
+import stat
 import unittest
 
+from django.core.cache import cache
 from libcloud.common.types import LibcloudError
+from libcloud.compute.types import NodeState
 
-from ..driver import AzureResponse
+from ..driver import AZURE_COMPUTE_INSTANCE_TYPES, AzureNodeDriver, AzureResponse, AzureServiceManagementConnection, \
+    CertificateCache, DriverRegistry
+from ..metrics import InMemoryMetricsSink, get_path_template
+from ..throttling import RateLimiter, get_retry_delay
+from .benchmarks import responses
 
 
 @unittest.skip
@@ -32,3 +41,355 @@ class ErrorMessageParsingTest(unittest.TestCase):
             self.assertEqual(e.value, 'ResourceNotFound: The resource service name hostedservices is not supported. Status code: 404.')
         else:
             self.fail('Exception is not thrown')
+
+
+@mock.patch('waldur_azure.driver.AzureNodeDriver')
+class DriverRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = DriverRegistry()
+
+    def tearDown(self):
+        self.registry.clear()
+
+    def test_driver_is_reused_for_the_same_credentials(self, driver_mock):
+        driver_mock.side_effect = lambda **kwargs: mock.Mock()
+
+        first = self.registry.get('settings', 'subscription', b'certificate', key_file='/tmp/cert.pem')
+        second = self.registry.get('settings', 'subscription', b'certificate', key_file='/tmp/cert.pem')
+
+        self.assertIs(first, second)
+        self.assertEqual(driver_mock.call_count, 1)
+
+    def test_driver_is_rebuilt_when_certificate_is_changed(self, driver_mock):
+        driver_mock.side_effect = lambda **kwargs: mock.Mock()
+
+        first = self.registry.get('settings', 'subscription', b'certificate', key_file='/tmp/cert.pem')
+        second = self.registry.get('settings', 'subscription', b'new certificate', key_file='/tmp/cert.pem')
+
+        self.assertIsNot(first, second)
+        self.assertEqual(len(self.registry._entries), 1)
+
+    def test_driver_is_rebuilt_after_invalidation(self, driver_mock):
+        driver_mock.side_effect = lambda **kwargs: mock.Mock()
+
+        first = self.registry.get('settings', 'subscription', b'certificate', key_file='/tmp/cert.pem')
+        self.registry.invalidate('settings')
+        second = self.registry.get('settings', 'subscription', b'certificate', key_file='/tmp/cert.pem')
+
+        self.assertIsNot(first, second)
+
+    def test_driver_is_pointed_to_endpoint_of_service_settings(self, driver_mock):
+        self.registry.get('settings', 'subscription', b'certificate', key_file='/tmp/cert.pem',
+                          endpoint='http://127.0.0.1:8080')
+
+        driver_mock.assert_called_once_with(
+            subscription_id='subscription', key_file='/tmp/cert.pem', url='http://127.0.0.1:8080')
+
+
+class CertificateCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = CertificateCache()
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def test_certificate_is_written_once_for_the_same_content(self):
+        first = self.cache.acquire(b'certificate')
+        second = self.cache.acquire(b'certificate')
+
+        self.assertEqual(first, second)
+        with open(first, 'rb') as cert_file:
+            self.assertEqual(cert_file.read(), b'certificate')
+
+    def test_certificate_file_is_readable_by_owner_only(self):
+        path = self.cache.acquire(b'certificate')
+
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+    def test_certificate_file_is_removed_when_last_reference_is_released(self):
+        path = self.cache.acquire(b'certificate')
+        self.cache.acquire(b'certificate')
+
+        self.cache.release(b'certificate')
+        self.assertTrue(os.path.exists(path))
+
+        self.cache.release(b'certificate')
+        self.assertFalse(os.path.exists(path))
+
+
+class SizeCatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = AzureNodeDriver.__new__(AzureNodeDriver)
+        self.driver.connection = mock.Mock()
+
+    def test_sizes_are_ordered_by_price(self):
+        prices = [float(size.price) for size in self.driver.list_sizes()]
+
+        self.assertEqual(prices, sorted(prices))
+        self.assertEqual(len(prices), len(AZURE_COMPUTE_INSTANCE_TYPES))
+
+    def test_size_is_found_by_id(self):
+        size = self.driver.ex_get_size('Standard_D1')
+
+        self.assertEqual(size.name, 'D1 Faster Compute Instance')
+        self.assertEqual(size.extra['cores'], 1)
+
+    def test_sizes_are_built_once_per_driver(self):
+        self.assertIs(self.driver.ex_get_size('Small'), self.driver.list_sizes()[1])
+
+
+class StreamingParserTest(unittest.TestCase):
+    HOSTED_SERVICE = (
+        '<HostedService xmlns="http://schemas.microsoft.com/windowsazure">'
+        '<ServiceName>cloud</ServiceName>'
+        '<Deployments><Deployment><Name>cloud</Name>'
+        '<RoleInstanceList>'
+        '<RoleInstance><RoleName>vm-1</RoleName><InstanceStatus>ReadyRole</InstanceStatus>'
+        '<InstanceSize>Small</InstanceSize><IpAddress>10.0.0.4</IpAddress><PowerState>Started</PowerState>'
+        '<InstanceEndpoints><InstanceEndpoint><Name>SSH</Name><Vip>1.2.3.4</Vip><PublicPort>22</PublicPort>'
+        '<LocalPort>22</LocalPort><Protocol>tcp</Protocol></InstanceEndpoint></InstanceEndpoints></RoleInstance>'
+        '<RoleInstance><RoleName>vm-2</RoleName><InstanceStatus>StoppedVM</InstanceStatus>'
+        '<InstanceSize>Medium</InstanceSize><IpAddress>10.0.0.5</IpAddress><PowerState>Stopped</PowerState>'
+        '</RoleInstance>'
+        '</RoleInstanceList>'
+        '<VirtualIPs><VirtualIP><Address>1.2.3.4</Address></VirtualIP></VirtualIPs>'
+        '</Deployment></Deployments></HostedService>'
+    )
+
+    IMAGES = (
+        '<Images xmlns="http://schemas.microsoft.com/windowsazure">'
+        '<OSImage><Name>ubuntu-id</Name><Label>Ubuntu</Label><OS>Linux</OS></OSImage>'
+        '<OSImage><Name>windows-id</Name><Label>Windows</Label><OS>Windows</OS></OSImage>'
+        '</Images>'
+    )
+
+    VM_IMAGES = (
+        '<VMImages xmlns="http://schemas.microsoft.com/windowsazure">'
+        '<VMImage><Name>custom-id</Name><Label>Custom</Label>'
+        '<OSDiskConfiguration><OS>Linux</OS></OSDiskConfiguration></VMImage>'
+        '</VMImages>'
+    )
+
+    STORAGE_SERVICES = (
+        '<StorageServices xmlns="http://schemas.microsoft.com/windowsazure">'
+        '<StorageService><Url>https://example.com/storage</Url><ServiceName>storage</ServiceName>'
+        '<StorageServiceProperties><Location>Central US</Location><Status>Created</Status>'
+        '</StorageServiceProperties></StorageService>'
+        '</StorageServices>'
+    )
+
+    def setUp(self):
+        self.driver = AzureNodeDriver.__new__(AzureNodeDriver)
+        self.driver.connection = mock.Mock()
+        self.driver.subscription_id = 'subscription'
+        self.driver._perform_get = mock.Mock()
+
+    def set_responses(self, *bodies):
+        self.driver._perform_get.side_effect = [mock.Mock(status=httplib.OK, body=body) for body in bodies]
+
+    def test_nodes_are_parsed(self):
+        self.set_responses(self.HOSTED_SERVICE)
+
+        nodes = self.driver.list_nodes('cloud')
+
+        self.assertEqual([node.id for node in nodes], ['vm-1', 'vm-2'])
+        self.assertEqual(nodes[0].extra['instance_endpoints'][0].public_port, '22')
+        self.assertEqual(nodes[0].private_ips, ['10.0.0.4'])
+        self.assertEqual(nodes[1].public_ips, ['1.2.3.4'])
+
+    def test_role_instances_are_parsed_to_records(self):
+        self.set_responses(self.HOSTED_SERVICE)
+
+        records = self.driver.ex_list_role_instances('cloud')
+
+        self.assertEqual([record['id'] for record in records], ['vm-1', 'vm-2'])
+        self.assertEqual(records[0]['state'], NodeState.RUNNING)
+        self.assertEqual(records[0]['instance_endpoints'][0].name, 'SSH')
+        self.assertEqual(records[1]['public_ips'], ['1.2.3.4'])
+        self.assertEqual(records[1]['instance_size'], 'Medium')
+
+    def test_images_are_filtered_while_parsing(self):
+        self.set_responses(self.IMAGES, self.VM_IMAGES)
+
+        images = list(self.driver.ex_iter_images(name_regex=re.compile('Ubuntu|Custom')))
+
+        self.assertEqual([image.id for image in images], ['ubuntu-id', 'custom-id'])
+        self.assertTrue(images[1].extra['vm_image'])
+        self.assertEqual(images[1].extra['os'], 'Linux')
+
+    def test_storage_services_are_parsed(self):
+        self.set_responses(self.STORAGE_SERVICES)
+
+        storages = self.driver.ex_list_storage_services()
+
+        self.assertEqual(storages[0].service_name, 'storage')
+        self.assertEqual(storages[0].status, 'Created')
+
+    def test_operation_status_is_parsed_instead_of_http_status(self):
+        self.set_responses(responses.operation_xml('request-1', 'InProgress'))
+
+        operation = self.driver._get_operation_status('request-1')
+
+        self.assertEqual(operation.status, 'InProgress')
+        self.assertEqual(operation.http_status_code, '200')
+
+    def test_failed_async_operation_raises_error_with_its_message(self):
+        self.driver._parse_response_for_async_op = mock.Mock(return_value=mock.Mock(request_id='request-1'))
+        self.set_responses(responses.operation_xml('request-1', 'Failed', 'Role is busy'))
+
+        with self.assertRaises(LibcloudError) as cm:
+            self.driver._ex_complete_async_azure_operation(mock.Mock())
+        self.assertIn('Role is busy', cm.exception.value)
+
+    def test_async_operation_is_polled_until_it_is_completed(self):
+        self.driver._parse_response_for_async_op = mock.Mock(return_value=mock.Mock(request_id='request-1'))
+        self.driver.ASYNC_OPERATION_POLL_INTERVAL = 0
+        self.set_responses(responses.operation_xml('request-1', 'InProgress'),
+                           responses.operation_xml('request-1', 'Succeeded'))
+
+        self.driver._ex_complete_async_azure_operation(mock.Mock())
+
+        self.assertEqual(self.driver._perform_get.call_count, 2)
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sink = InMemoryMetricsSink()
+        patcher = mock.patch('waldur_azure.driver.get_metrics_sink', return_value=self.sink)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.connection = AzureServiceManagementConnection.__new__(AzureServiceManagementConnection)
+        self.connection.subscription_id = 'subscription'
+
+    def test_resource_names_are_replaced_in_path_template(self):
+        self.assertEqual(
+            get_path_template('/subscription/services/hostedservices/cloud/deployments/cloud/roleinstances/vm-1'
+                              '/Operations?comp=media'),
+            '/{subscription_id}/services/hostedservices/{name}/deployments/{name}/roleinstances/{name}/Operations')
+
+    @mock.patch('libcloud.common.azure.AzureServiceManagementConnection.request')
+    def test_successful_call_is_recorded(self, request_mock):
+        request_mock.return_value = mock.Mock(status=httplib.OK, body='<Images />')
+
+        self.connection._instrumented_request('/subscription/services/images')
+
+        call = ('subscription', 'GET', '/{subscription_id}/services/images')
+        self.assertEqual(self.sink.requests[call + (httplib.OK,)], 1)
+        self.assertEqual(self.sink.bytes[call], len('<Images />'))
+        self.assertEqual(self.sink.get_latency_count(*call), 1)
+
+    @mock.patch('libcloud.common.azure.AzureServiceManagementConnection.request')
+    def test_stream_is_forwarded_only_when_it_is_requested(self, request_mock):
+        request_mock.return_value = mock.Mock(status=httplib.OK, body='<Images />')
+
+        with mock.patch('waldur_azure.driver.get_rate_limiter', return_value=None):
+            self.connection.request('/subscription/services/images')
+
+        self.assertNotIn('stream', request_mock.call_args[1])
+
+    @mock.patch('libcloud.common.azure.AzureServiceManagementConnection.request')
+    def test_throttled_call_is_recorded(self, request_mock):
+        error = LibcloudError('Too many requests')
+        error.status = 429
+        request_mock.side_effect = error
+
+        with self.assertRaises(LibcloudError):
+            self.connection._instrumented_request('/subscription/operations/request-1')
+
+        self.assertEqual(self.sink.throttled[('subscription', 'GET', '/{subscription_id}/operations/{name}')], 1)
+
+
+class FakeClock(object):
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock(100.5)
+        patcher = mock.patch('waldur_azure.throttling.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requests_within_rate_are_admitted_without_waiting(self):
+        limiter = RateLimiter('subscription', 3)
+
+        for _ in range(3):
+            limiter.acquire()
+
+        self.assertEqual(self.clock.now, 100.5)
+
+    def test_request_over_rate_waits_for_next_window(self):
+        limiter = RateLimiter('subscription', 2)
+
+        for _ in range(3):
+            limiter.acquire()
+
+        self.assertGreaterEqual(self.clock.now, 101)
+        self.assertLess(self.clock.now, 102)
+
+    def test_request_is_sent_anyway_when_timeout_is_passed(self):
+        limiter = RateLimiter('subscription', 1)
+        limiter.acquire()
+
+        with mock.patch('waldur_azure.throttling.logger') as logger_mock:
+            limiter.acquire(timeout=0)
+
+        self.assertEqual(self.clock.now, 100.5)
+        self.assertTrue(logger_mock.warning.called)
+
+    def test_subscriptions_are_limited_separately(self):
+        RateLimiter('subscription', 1).acquire()
+        RateLimiter('other-subscription', 1).acquire()
+
+        self.assertEqual(self.clock.now, 100.5)
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = AzureServiceManagementConnection.__new__(AzureServiceManagementConnection)
+        self.connection.subscription_id = 'subscription'
+
+        for name, value in (('waldur_azure.driver.get_rate_limiter', None), ('waldur_azure.driver.time.sleep', None)):
+            patcher = mock.patch(name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_error(self, status, retry_after=None):
+        error = LibcloudError('Request has failed')
+        error.status = status
+        error.retry_after = retry_after
+        return error
+
+    def test_retry_after_header_is_honored(self):
+        self.assertEqual(get_retry_delay(self.get_error(503, retry_after='7'), 'POST', 0), 7)
+
+    def test_server_error_is_not_repeated_for_unsafe_request(self):
+        self.assertIsNone(get_retry_delay(self.get_error(500), 'POST', 0))
+        self.assertIsNotNone(get_retry_delay(self.get_error(500), 'GET', 0))
+
+    def test_throttled_request_is_repeated(self):
+        response = mock.Mock()
+        with mock.patch.object(AzureServiceManagementConnection, '_instrumented_request',
+                               side_effect=[self.get_error(429), response]) as request_mock:
+            self.assertIs(self.connection.request('/subscription/services/images'), response)
+        self.assertEqual(request_mock.call_count, 2)
+
+    def test_request_is_not_repeated_after_maximum_attempts(self):
+        with mock.patch.object(AzureServiceManagementConnection, '_instrumented_request',
+                               side_effect=self.get_error(429)) as request_mock:
+            with self.assertRaises(LibcloudError):
+                self.connection.request('/subscription/services/images')
+        self.assertEqual(request_mock.call_count, 5)
@@ -0,0 +1,102 @@
+import tempfile
+import threading
+
+from django.core.cache import cache
+from django.test import TestCase
+from libcloud.common.types import LibcloudError
+from libcloud.compute.types import NodeState
+
+from ..driver import AzureNodeDriver
+from ..emulator import EmulatorServer, ServiceManagementEmulator
+
+
+class EmulatorTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.emulator = ServiceManagementEmulator(subscription_id='subscription', seed=1)
+        self.emulator.populate(cloud_services_count=1, roles_count=2)
+
+        self.server = EmulatorServer(('127.0.0.1', 0), self.emulator)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        # certificate is required by libcloud but it is not checked by emulator
+        key_file = tempfile.NamedTemporaryFile(suffix='.pem')
+        self.addCleanup(key_file.close)
+        self.driver = AzureNodeDriver(subscription_id='subscription', key_file=key_file.name, url=self.server.url)
+
+    def test_role_instances_of_cloud_service_are_listed(self):
+        records = self.driver.ex_list_role_instances('cloud-0')
+
+        self.assertEqual([record['id'] for record in records], ['vm-0', 'vm-1'])
+        self.assertEqual(records[0]['state'], NodeState.RUNNING)
+
+    def test_roles_are_stopped_when_operation_is_completed(self):
+        response = self.driver.ex_shutdown_roles('cloud-0', 'cloud-0', ['vm-0', 'vm-1'])
+        request_id = self.driver._parse_response_for_async_op(response).request_id
+
+        self.assertEqual(self.driver._get_operation_status(request_id).status, 'Succeeded')
+        states = {record['id']: record['state'] for record in self.driver.ex_list_role_instances('cloud-0')}
+        self.assertEqual(states, {'vm-0': NodeState.STOPPED, 'vm-1': NodeState.STOPPED})
+
+    def test_operation_is_in_progress_until_its_duration_passes(self):
+        self.emulator.operation_duration = 60
+        response = self.driver.ex_shutdown_roles('cloud-0', 'cloud-0', ['vm-0'])
+        request_id = self.driver._parse_response_for_async_op(response).request_id
+
+        self.assertEqual(self.driver._get_operation_status(request_id).status, 'InProgress')
+        self.assertEqual(self.driver.ex_list_role_instances('cloud-0')[0]['state'], NodeState.RUNNING)
+
+    def test_driver_waits_until_operation_is_completed(self):
+        self.emulator.operation_duration = 0.2
+        self.driver.ASYNC_OPERATION_POLL_INTERVAL = 0.05
+        response = self.driver.ex_shutdown_roles('cloud-0', 'cloud-0', ['vm-0'])
+
+        self.driver._ex_complete_async_azure_operation(response, 'shutdown')
+
+        # deployment is free again, so the next operation is not rejected with conflict
+        self.driver.ex_start_roles('cloud-0', 'cloud-0', ['vm-0'])
+
+    def test_batched_role_operations_run_back_to_back_without_conflict(self):
+        self.emulator.operation_duration = 0.2
+        self.driver.ASYNC_OPERATION_POLL_INTERVAL = 0.05
+
+        for method in (self.driver.ex_shutdown_roles, self.driver.ex_start_roles):
+            response = method('cloud-0', 'cloud-0', ['vm-0', 'vm-1'])
+            self.driver._ex_complete_async_azure_operation(response, method.__name__)
+            request_id = self.driver._parse_response_for_async_op(response).request_id
+            self.assertEqual(self.driver._get_operation_status(request_id).status, 'Succeeded')
+
+        states = {record['state'] for record in self.driver.ex_list_role_instances('cloud-0')}
+        self.assertEqual(states, {NodeState.RUNNING})
+
+    def test_concurrent_operation_on_deployment_is_rejected(self):
+        self.emulator.operation_duration = 60
+        self.driver.ex_shutdown_roles('cloud-0', 'cloud-0', ['vm-0'])
+
+        with self.assertRaises(LibcloudError) as cm:
+            self.driver.ex_start_roles('cloud-0', 'cloud-0', ['vm-1'])
+        self.assertEqual(cm.exception.status, 409)
+
+    def test_throttled_response_has_retry_after_header(self):
+        self.emulator.throttle_rate = 1
+
+        response = self.emulator.handle('GET', '/subscription/services/hostedservices')
+
+        self.assertEqual(response.status, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    def test_failed_operation_is_rolled_back(self):
+        self.emulator.operation_failure_rate = 1
+
+        response = self.driver.ex_shutdown_roles('cloud-0', 'cloud-0', ['vm-0'])
+        request_id = self.driver._parse_response_for_async_op(response).request_id
+
+        operation = self.driver._get_operation_status(request_id)
+        self.assertEqual(operation.status, 'Failed')
+        self.assertEqual(operation.error_message, 'The operation has failed.')
+        self.assertEqual(self.driver.ex_list_role_instances('cloud-0')[0]['state'], NodeState.RUNNING)
@@ -0,0 +1,60 @@
+from django.test import TestCase
+
+from . import factories
+from .. import models, polling
+
+Transitions = models.TransitionStatistics.Transitions
+
+
+class PollingScheduleTest(TestCase):
+
+    def test_configured_delays_are_used_without_history(self):
+        schedule = polling.get_schedule(Transitions.START)
+
+        self.assertEqual(schedule.get_delay(0), 5)
+        self.assertEqual(schedule.get_delay(1, elapsed=5), 5)
+        self.assertEqual(schedule.get_delay(2, elapsed=10), 7.5)
+
+    def test_interval_does_not_exceed_maximum(self):
+        schedule = polling.get_schedule(Transitions.START)
+
+        self.assertEqual(schedule.get_delay(20, elapsed=100), 30)
+
+    def test_polling_stops_at_deadline(self):
+        schedule = polling.get_schedule(Transitions.START)
+
+        self.assertEqual(schedule.get_delay(10, elapsed=schedule.deadline - 1), 1)
+        self.assertIsNone(schedule.get_delay(11, elapsed=schedule.deadline))
+
+    def test_first_check_is_done_shortly_before_expected_completion(self):
+        schedule = polling.PollingSchedule(Transitions.CREATE, expected_duration=300)
+
+        self.assertEqual(schedule.get_delay(0), 240)
+        self.assertEqual(schedule.get_delay(1, elapsed=240), 30)
+
+
+class TransitionStatisticsTest(TestCase):
+
+    def setUp(self):
+        self.vm = factories.VirtualMachineFactory(image_name='Ubuntu', cores=1, ram=1792)
+
+    def test_duration_is_recorded_for_profile_and_all_virtual_machines(self):
+        polling.record_duration(Transitions.STOP, self.vm, 20)
+        polling.record_duration(Transitions.STOP, self.vm, 30)
+
+        profile = models.TransitionStatistics.objects.get(transition=Transitions.STOP, image_name='Ubuntu')
+        self.assertEqual(profile.count, 2)
+        self.assertAlmostEqual(profile.average, 22)
+        self.assertEqual(models.TransitionStatistics.objects.get(transition=Transitions.STOP, image_name='').count, 2)
+
+    def test_average_of_all_virtual_machines_is_used_without_profile_history(self):
+        other_vm = factories.VirtualMachineFactory(image_name='CentOS', cores=2, ram=3584)
+        for _ in range(polling.MIN_SAMPLES):
+            polling.record_duration(Transitions.STOP, other_vm, 40)
+
+        self.assertEqual(polling.get_expected_duration(Transitions.STOP, self.vm), 40)
+
+    def test_history_is_ignored_until_enough_samples_are_recorded(self):
+        polling.record_duration(Transitions.STOP, self.vm, 40)
+
+        self.assertIsNone(polling.get_expected_duration(Transitions.STOP, self.vm))
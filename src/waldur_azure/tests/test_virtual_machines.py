@@ -1,10 +1,17 @@
 from ddt import data, ddt
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from rest_framework import test, status
 from libcloud.compute.types import NodeState
 import mock
 
+from waldur_core.core import utils as core_utils
+from waldur_core.structure.tests import factories as structure_factories
+
 from . import fixtures, factories
-from .. import models
+from .. import executors, models
+from ..backend import SIZES
 
 
 @ddt
@@ -166,3 +173,146 @@ class VirtualMachineStopTest(test.APITransactionTestCase):
         response = self.client.post(url)
 
         self.assertEquals(response.status_code, status.HTTP_409_CONFLICT)
+
+
+@mock.patch('waldur_azure.executors.VirtualMachinesStopExecutor.execute')
+class VirtualMachinesBulkStopTest(test.APITransactionTestCase):
+
+    def setUp(self):
+        self.fixture = fixtures.AzureFixture()
+        self.client.force_authenticate(self.fixture.owner)
+        self.url = factories.VirtualMachineFactory.get_list_action_url('bulk_stop')
+
+    def test_virtual_machines_are_grouped_by_cloud_service(self, stop_executor_mock):
+        vm1 = factories.VirtualMachineFactory(service_project_link=self.fixture.spl)
+        vm2 = factories.VirtualMachineFactory(service_project_link=self.fixture.spl)
+        other_spl = factories.AzureServiceProjectLinkFactory(
+            service=self.fixture.service,
+            project=structure_factories.ProjectFactory(customer=self.fixture.customer),
+            cloud_service_name='other')
+        vm3 = factories.VirtualMachineFactory(service_project_link=other_spl)
+
+        response = self.client.post(self.url, {'virtual_machines': [
+            factories.VirtualMachineFactory.get_url(vm) for vm in (vm1, vm2, vm3)]})
+
+        self.assertEquals(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(stop_executor_mock.call_count, 2)
+        stop_executor_mock.assert_any_call([vm1, vm2])
+
+    def test_virtual_machine_of_another_customer_is_not_found(self, stop_executor_mock):
+        vm = factories.VirtualMachineFactory()
+
+        response = self.client.post(self.url, {'virtual_machines': [factories.VirtualMachineFactory.get_url(vm)]})
+
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('virtual_machines', response.data)
+        self.assertFalse(stop_executor_mock.called)
+
+    def test_nothing_is_scheduled_if_any_virtual_machine_is_not_running(self, stop_executor_mock):
+        vm1 = factories.VirtualMachineFactory(service_project_link=self.fixture.spl)
+        vm2 = factories.VirtualMachineFactory(
+            service_project_link=self.fixture.spl, runtime_state=NodeState.STOPPED)
+
+        response = self.client.post(self.url, {'virtual_machines': [
+            factories.VirtualMachineFactory.get_url(vm) for vm in (vm1, vm2)]})
+
+        self.assertEquals(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(stop_executor_mock.called)
+
+
+@mock.patch('waldur_azure.executors.VirtualMachinesCreateExecutor.execute')
+class VirtualMachinesBatchCreateTest(test.APITransactionTestCase):
+
+    def setUp(self):
+        self.fixture = fixtures.AzureFixture()
+        self.client.force_authenticate(self.fixture.owner)
+        self.url = factories.VirtualMachineFactory.get_list_action_url('batch_create')
+        image = factories.ImageFactory(settings=self.fixture.service.settings)
+        self.payload = {
+            'name': 'lab-{index}',
+            'count': 3,
+            'service_project_link': factories.AzureServiceProjectLinkFactory.get_url(self.fixture.spl),
+            'image': factories.ImageFactory.get_url(image),
+            'size': 'http://testserver' + reverse('azure-size-detail', kwargs={'uuid': SIZES[0].uuid}),
+            'user_username': 'student',
+            'user_password': 'Secret-123',
+        }
+
+    def test_virtual_machines_are_created_and_provisioned_together(self, create_executor_mock):
+        response = self.client.post(self.url, self.payload)
+
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(sorted(vm['name'] for vm in response.data), ['lab-1', 'lab-2', 'lab-3'])
+        self.assertEqual(models.VirtualMachine.objects.filter(service_project_link=self.fixture.spl).count(), 3)
+        self.assertEqual(create_executor_mock.call_count, 1)
+
+    def test_nothing_is_created_if_any_name_is_taken(self, create_executor_mock):
+        factories.VirtualMachineFactory(service_project_link=self.fixture.spl, name='lab-2')
+
+        response = self.client.post(self.url, self.payload)
+
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(models.VirtualMachine.objects.filter(service_project_link=self.fixture.spl).count(), 1)
+
+    def test_nothing_is_created_while_storage_account_is_being_created(self, create_executor_mock):
+        self.fixture.spl.storage_state = models.AzureServiceProjectLink.StorageStates.CREATING
+        self.fixture.spl.save(update_fields=['storage_state'])
+
+        response = self.client.post(self.url, self.payload)
+
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('service_project_link', response.data)
+        self.assertFalse(models.VirtualMachine.objects.filter(service_project_link=self.fixture.spl).exists())
+        self.assertFalse(create_executor_mock.called)
+
+
+class VirtualMachinesCreateExecutorTest(test.APITransactionTestCase):
+
+    def setUp(self):
+        self.fixture = fixtures.AzureFixture()
+        States = models.VirtualMachine.States
+        self.virtual_machines = [
+            factories.VirtualMachineFactory(service_project_link=self.fixture.spl, state=States.CREATION_SCHEDULED)
+            for _ in range(2)]
+
+    @mock.patch('waldur_azure.executors.chain')
+    def test_virtual_machine_is_set_ok_before_next_one_is_provisioned(self, chain_mock):
+        executors.VirtualMachinesCreateExecutor.execute(self.virtual_machines, 'image-id', 'Small')
+
+        steps = [(signature.args[0], signature.kwargs.get('backend_method') or
+                  signature.kwargs.get('state_transition') or signature.kwargs.get('success_state'))
+                 for signature in chain_mock.call_args[0]]
+        vm1, vm2 = [core_utils.serialize_instance(vm) for vm in self.virtual_machines]
+        self.assertEqual(steps, [
+            (vm1, 'provision_vm'), (vm1, 'running'), (vm1, 'pull_vm_info'), (vm1, 'set_ok'),
+            (vm2, 'provision_vm'), (vm2, 'running'), (vm2, 'pull_vm_info'), (vm2, 'set_ok'),
+        ])
+
+
+class VirtualMachineListQueryCountTest(test.APITransactionTestCase):
+
+    def setUp(self):
+        self.fixture = fixtures.AzureFixture()
+        self.client.force_authenticate(self.fixture.staff)
+        self.url = factories.VirtualMachineFactory.get_list_url()
+
+    def create_virtual_machines(self, count):
+        for _ in range(count):
+            vm = factories.VirtualMachineFactory(service_project_link=self.fixture.spl)
+            factories.InstanceEndpoint(instance=vm)
+
+    def get_query_count(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_depend_on_number_of_virtual_machines(self):
+        self.create_virtual_machines(1)
+        # warm up caches which are filled on first request
+        self.get_query_count()
+        expected_count = self.get_query_count()
+
+        self.create_virtual_machines(9)
+
+        self.assertEqual(self.get_query_count(), expected_count)
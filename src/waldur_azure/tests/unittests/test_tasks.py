@@ -0,0 +1,12 @@
+import unittest
+
+from ...tasks import PollRuntimeStateTask
+
+
+class PollRuntimeStateTaskTest(unittest.TestCase):
+
+    def test_description_matches_task_arguments(self):
+        description = PollRuntimeStateTask.get_description(
+            'virtual-machine', success_state='running', erred_state='error', transition='create')
+
+        self.assertEqual(description, 'Wait until runtime state of instance "virtual-machine" becomes "running"')
@@ -0,0 +1,83 @@
+from __future__ import unicode_literals
+
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from libcloud.utils.py3 import httplib
+
+
+logger = logging.getLogger(__name__)
+
+THROTTLING_STATUSES = (429, httplib.SERVICE_UNAVAILABLE)
+TRANSIENT_STATUSES = (httplib.INTERNAL_SERVER_ERROR, httplib.BAD_GATEWAY, httplib.GATEWAY_TIMEOUT)
+
+
+class RateLimiter(object):
+    """
+    Fixed window counter shared by all workers via Django cache.
+    At most RATE_LIMIT requests of the subscription are admitted within every
+    second of wall clock, so up to twice as many can be sent around window
+    boundary. Requests throttled by Azure in that case are repeated by driver.
+    """
+
+    def __init__(self, subscription_id, rate):
+        self.prefix = 'waldur_azure:rate:%s' % subscription_id
+        self.rate = rate
+
+    def acquire(self, timeout=60):
+        """
+        Wait until request is admitted in current window. Call is not blocked longer than timeout
+        so that limiter misconfiguration does not stall workers forever.
+        """
+        deadline = time.time() + timeout
+        while True:
+            now = time.time()
+            key = '%s:%d' % (self.prefix, now)
+            cache.add(key, 0, 2)
+            try:
+                requests_count = cache.incr(key)
+            except ValueError:
+                # key has expired between add and incr
+                continue
+
+            if requests_count <= self.rate:
+                return
+            if now >= deadline:
+                logger.warning('Rate limit of Azure subscription is exceeded, request is sent anyway.')
+                return
+            # spread waiting callers over the next second
+            time.sleep(int(now) + 1 - now + random.uniform(0, 1.0 / self.rate))
+
+
+def get_rate_limiter(subscription_id):
+    rate = settings.WALDUR_AZURE['RATE_LIMIT']
+    if rate:
+        return RateLimiter(subscription_id, rate)
+
+
+def get_retry_delay(error, method, attempt):
+    """
+    Return seconds to wait before repeating failed request or None if it should not be repeated.
+    Throttled requests are always repeated because Azure has not accepted them,
+    other server errors are repeated only for GET requests which are safe to repeat.
+    """
+    options = settings.WALDUR_AZURE
+    if attempt >= options['RETRY_MAX_ATTEMPTS']:
+        return None
+
+    status = getattr(error, 'status', None)
+    if status not in THROTTLING_STATUSES and not (status in TRANSIENT_STATUSES and method == 'GET'):
+        return None
+
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after:
+        try:
+            return min(float(retry_after), options['RETRY_MAX_BACKOFF'])
+        except ValueError:
+            pass
+
+    backoff = min(options['RETRY_BACKOFF'] * 2 ** attempt, options['RETRY_MAX_BACKOFF'])
+    return random.uniform(backoff / 2.0, backoff)
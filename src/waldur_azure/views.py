@@ -1,8 +1,11 @@
+import collections
+
 from django.http import HttpResponse
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import decorators, exceptions, viewsets, response, status, serializers as rf_serializers
 
-from waldur_core.core import validators as core_validators
+from waldur_core.core import exceptions as core_exceptions, mixins as core_mixins, validators as core_validators
+from waldur_core.structure import permissions as structure_permissions
 from waldur_core.structure import views as structure_views
 
 from . import models, serializers, executors, filters
@@ -36,7 +39,7 @@ class SizeViewSet(viewsets.ReadOnlyModelViewSet):
     lookup_field = 'uuid'
 
 
-class VirtualMachineViewSet(structure_views.BaseResourceViewSet):
+class VirtualMachineViewSet(core_mixins.EagerLoadMixin, structure_views.BaseResourceViewSet):
     queryset = models.VirtualMachine.objects.all()
     serializer_class = serializers.VirtualMachineSerializer
     delete_executor = executors.VirtualMachineDeleteExecutor
@@ -45,9 +48,8 @@ class VirtualMachineViewSet(structure_views.BaseResourceViewSet):
     def rdp(self, request, uuid=None):
         vm = self.get_object()
 
-        try:
-            rdp_endpoint = vm.endpoints.get(name=models.InstanceEndpoint.Name.RDP)
-        except models.InstanceEndpoint.DoesNotExist:
+        rdp_endpoint = vm.endpoints.filter(name=models.InstanceEndpoint.Name.RDP).first()
+        if rdp_endpoint is None:
             raise exceptions.NotFound("This virtual machine doesn't run remote desktop")
 
         response = HttpResponse(content_type='application/x-rdp')
@@ -91,6 +93,59 @@ class VirtualMachineViewSet(structure_views.BaseResourceViewSet):
                           core_validators.RuntimeStateValidator('running')]
     restart_serializer_class = rf_serializers.Serializer
 
+    def _execute_bulk_action(self, request, executor, validators):
+        """
+        Validate every virtual machine and schedule single action per cloud service.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        groups = collections.OrderedDict()
+        for virtual_machine in serializer.validated_data['virtual_machines']:
+            structure_permissions.is_administrator(request, self, virtual_machine)
+            try:
+                for validator in validators:
+                    validator(virtual_machine)
+            except core_exceptions.IncorrectStateException as e:
+                raise core_exceptions.IncorrectStateException(
+                    _('Virtual machine %(name)s: %(error)s') % {'name': virtual_machine.name, 'error': e.detail})
+
+            spl = virtual_machine.service_project_link
+            groups.setdefault((spl.service.settings_id, spl.cloud_service_name), []).append(virtual_machine)
+
+        for virtual_machines in groups.values():
+            executor.execute(virtual_machines)
+
+    @decorators.list_route(methods=['post'])
+    def bulk_start(self, request):
+        self._execute_bulk_action(request, executors.VirtualMachinesStartExecutor, self.start_validators)
+        return response.Response({'status': _('start was scheduled')}, status=status.HTTP_202_ACCEPTED)
+
+    bulk_start_serializer_class = serializers.VirtualMachinesActionSerializer
+
+    @decorators.list_route(methods=['post'])
+    def bulk_stop(self, request):
+        self._execute_bulk_action(request, executors.VirtualMachinesStopExecutor, self.stop_validators)
+        return response.Response({'status': _('stop was scheduled')}, status=status.HTTP_202_ACCEPTED)
+
+    bulk_stop_serializer_class = serializers.VirtualMachinesActionSerializer
+
+    @decorators.list_route(methods=['post'])
+    def batch_create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        virtual_machines = serializer.save()
+        executors.VirtualMachinesCreateExecutor.execute(
+            virtual_machines,
+            backend_image_id=serializer.validated_data['image'].backend_id,
+            backend_size_id=serializer.validated_data['size'].pk,
+        )
+        data = serializers.VirtualMachineSerializer(
+            virtual_machines, many=True, context=self.get_serializer_context()).data
+        return response.Response(data, status=status.HTTP_201_CREATED)
+
+    batch_create_serializer_class = serializers.VirtualMachineBatchCreateSerializer
+
     def perform_create(self, serializer):
         instance = serializer.save()
         executors.VirtualMachineCreateExecutor.execute(